@@ -0,0 +1,178 @@
+# answer_cache.py - Caché semántica de respuestas (preguntas repetidas o casi iguales)
+#
+# Una respuesta se reutiliza si:
+#   - el modelo es el mismo,
+#   - Chroma ha devuelto exactamente los mismos chunks (mismo contexto),
+#   - la colección no ha cambiado desde que se guardó (huella),
+#   - y el embedding de la pregunta se parece lo suficiente (coseno >= umbral).
+# Se guarda en SQLite, con caducidad (TTL) y tamaño máximo (LRU).
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from array import array
+
+from config import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL_H,
+    ANSWER_CACHE_MAX_ENTRIES,
+    MANIFEST_PATH,
+)
+from manifest import cargar_manifest, generacion
+
+# (mtime del manifest, su generación): solo se vuelve a leer si lo reescriben
+_generacion_vista = (None, "0")
+
+
+def huella_coleccion(collection) -> str:
+    """
+    Identifica el estado de la colección: nº de chunks + generación del
+    manifest (la ingesta la sube solo cuando escribe o borra chunks; una
+    ingesta sin cambios no la toca). Si cambia, las respuestas guardadas
+    dejan de ser válidas.
+    """
+    global _generacion_vista
+    try:
+        mtime = MANIFEST_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _generacion_vista[0]:
+        _generacion_vista = (mtime, generacion(cargar_manifest()) if mtime is not None else "0")
+    return f"{collection.count()}:{_generacion_vista[1]}"
+
+
+def hash_chunks(chunk_ids) -> str:
+    return hashlib.sha1("\n".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+
+def _coseno(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    if na == 0 or nb == 0:
+        return 0.0
+    return dot / (na * nb)
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, umbral: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_h: float = ANSWER_CACHE_TTL_H, max_entradas: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.umbral = umbral
+        self.ttl_s = ttl_h * 3600
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._huella_vista = None
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS respuestas (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                origen      TEXT NOT NULL,
+                modelo      TEXT NOT NULL,
+                chunks_hash TEXT NOT NULL,
+                huella      TEXT NOT NULL,
+                pregunta    TEXT NOT NULL,
+                embedding   BLOB NOT NULL,
+                respuesta   TEXT NOT NULL,
+                fuentes     TEXT NOT NULL,
+                creada      REAL NOT NULL,
+                ultimo_uso  REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_clave ON respuestas(origen, modelo, chunks_hash)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_uso ON respuestas(ultimo_uso)")
+        self._db.commit()
+
+    def _invalidar_si_cambio(self, huella: str):
+        """La primera vez que se ve una huella nueva se borra todo lo anterior."""
+        if huella == self._huella_vista:
+            return
+        self._db.execute("DELETE FROM respuestas WHERE huella != ?", (huella,))
+        self._db.commit()
+        self._huella_vista = huella
+
+    def buscar(self, embedding, modelo: str, chunk_ids, huella: str, origen: str = "core"):
+        """
+        Devuelve (respuesta, fuentes, similitud) o None.
+        Solo compara el embedding con las entradas de la misma clave exacta
+        (origen, modelo, chunks), que suelen ser muy pocas.
+        """
+        with self._lock:
+            self._invalidar_si_cambio(huella)
+            ahora = time.time()
+            filas = self._db.execute(
+                "SELECT id, embedding, respuesta, fuentes FROM respuestas "
+                "WHERE origen = ? AND modelo = ? AND chunks_hash = ? AND creada >= ?",
+                (origen, modelo, hash_chunks(chunk_ids), ahora - self.ttl_s),
+            ).fetchall()
+
+            mejor = None
+            for fila_id, emb_blob, respuesta, fuentes in filas:
+                guardado = array("f")
+                guardado.frombytes(emb_blob)
+                sim = _coseno(embedding, guardado)
+                if sim >= self.umbral and (mejor is None or sim > mejor[0]):
+                    mejor = (sim, fila_id, respuesta, fuentes)
+
+            if mejor is None:
+                self.misses += 1
+                return None
+
+            sim, fila_id, respuesta, fuentes = mejor
+            self._db.execute("UPDATE respuestas SET ultimo_uso = ? WHERE id = ?", (ahora, fila_id))
+            self._db.commit()
+            self.hits += 1
+            return respuesta, json.loads(fuentes), sim
+
+    def guardar(self, pregunta: str, embedding, modelo: str, chunk_ids, huella: str,
+                respuesta: str, fuentes: list[str], origen: str = "core"):
+        if not respuesta:
+            return
+        with self._lock:
+            self._invalidar_si_cambio(huella)
+            ahora = time.time()
+            self._db.execute(
+                "INSERT INTO respuestas (origen, modelo, chunks_hash, huella, pregunta, embedding, "
+                "respuesta, fuentes, creada, ultimo_uso) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    origen, modelo, hash_chunks(chunk_ids), huella, pregunta,
+                    array("f", embedding).tobytes(), respuesta,
+                    json.dumps(fuentes, ensure_ascii=False), ahora, ahora,
+                ),
+            )
+            self._podar(ahora)
+            self._db.commit()
+
+    def _podar(self, ahora: float):
+        """Quita lo caducado (TTL) y, si se pasa del máximo, lo menos usado (LRU)."""
+        self._db.execute("DELETE FROM respuestas WHERE creada < ?", (ahora - self.ttl_s,))
+        (n,) = self._db.execute("SELECT COUNT(*) FROM respuestas").fetchone()
+        if n > self.max_entradas:
+            self._db.execute(
+                "DELETE FROM respuestas WHERE id IN "
+                "(SELECT id FROM respuestas ORDER BY ultimo_uso ASC LIMIT ?)",
+                (n - self.max_entradas,),
+            )
+
+    def vaciar(self):
+        with self._lock:
+            self._db.execute("DELETE FROM respuestas")
+            self._db.commit()
+
+
+def formatear_acierto(stats: dict) -> str:
+    return (
+        f"⚡ Respuesta desde la caché semántica "
+        f"(similitud {stats['similitud']:.3f}, {stats['total_s'] * 1000:.0f} ms)"
+    )
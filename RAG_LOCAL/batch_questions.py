@@ -0,0 +1,288 @@
+# batch_questions.py - Responde un archivo de preguntas (JSONL o CSV) de una vez
+#
+#   python batch_questions.py preguntas.jsonl -o respuestas.jsonl
+#   python batch_questions.py preguntas.csv  -o respuestas.jsonl --tanda 64
+#
+# Entrada:
+#   JSONL → una línea por pregunta: {"id": "q1", "pregunta": "..."} ("id" opcional)
+#   CSV   → cabecera con columna "pregunta" (o la primera columna) e "id" opcional
+#   Se admiten los mismos filtros y prefijos que en la consola ([type:pdf], /phi ...).
+#
+# Cómo va:
+#   - Las preguntas se agrupan por el modelo que elige model_router, para que
+#     Ollama no vaya cargando y descargando modelos entre pregunta y pregunta.
+#   - Un hilo hace la recuperación por tandas (un único encode por tanda y las
+#     consultas a Chroma agrupadas por query_batcher) mientras el hilo
+#     principal genera con Ollama las respuestas de la tanda anterior.
+#   - Cada respuesta se escribe (y se hace flush) en cuanto está, con sus
+#     fuentes y los tiempos de cada etapa. Si se interrumpe, al volver a
+#     lanzarlo se saltan las preguntas que ya tienen respuesta sin error.
+import csv
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from config import TOP_K
+from model_router import elegir_modelo
+import rag_core
+import runtime
+import tracing
+
+TANDA = 32
+# Tandas ya recuperadas esperando a Ollama (limita la memoria)
+COLA_TANDAS = 2
+
+_FIN = None
+
+
+def cargar_preguntas(path: Path) -> list[dict]:
+    """Devuelve [{"id", "texto"}] en el orden del archivo."""
+    preguntas = []
+    if path.suffix.lower() == ".csv":
+        with path.open("r", encoding="utf-8-sig", newline="") as f:
+            filas = list(csv.reader(f))
+        if not filas:
+            return []
+        cabecera = [c.strip().lower() for c in filas[0]]
+        col_texto = cabecera.index("pregunta") if "pregunta" in cabecera else 0
+        col_id = cabecera.index("id") if "id" in cabecera else None
+        for n, fila in enumerate(filas[1:], start=1):
+            if len(fila) <= col_texto or not fila[col_texto].strip():
+                continue
+            qid = fila[col_id].strip() if col_id is not None and len(fila) > col_id else ""
+            preguntas.append({"id": qid or str(n), "texto": fila[col_texto].strip()})
+    else:
+        with path.open("r", encoding="utf-8") as f:
+            for n, linea in enumerate(f, start=1):
+                if not linea.strip():
+                    continue
+                data = json.loads(linea)
+                if isinstance(data, str):
+                    data = {"pregunta": data}
+                texto = data.get("pregunta") or data.get("question") or ""
+                if texto.strip():
+                    preguntas.append({"id": str(data.get("id") or n), "texto": texto.strip()})
+
+    vistos = set()
+    for p in preguntas:
+        if p["id"] in vistos:
+            raise ValueError(f"ID de pregunta repetido en {path.name}: {p['id']}")
+        vistos.add(p["id"])
+    return preguntas
+
+
+def ya_respondidas(salida: Path) -> set[str]:
+    """IDs con respuesta correcta en una ejecución anterior (las que fallaron se repiten)."""
+    hechas = set()
+    if not salida.exists():
+        return hechas
+    with salida.open("r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                data = json.loads(linea)
+            except ValueError:
+                continue  # última línea a medias si se cortó mientras escribía
+            if not data.get("error"):
+                hechas.add(str(data.get("id")))
+    return hechas
+
+
+def _recuperar_tanda(tanda: list[dict], usar_cache: bool) -> list[dict]:
+    """Embeddings de toda la tanda en un encode + búsqueda de contexto en paralelo."""
+    t0 = time.perf_counter()
+    vectores = runtime.get_embedder().encode([p["pregunta"] for p in tanda], batch_size=len(tanda))
+    embedding_ms = (time.perf_counter() - t0) * 1000 / len(tanda)
+
+    def recuperar(item_y_vector):
+        item, vector = item_y_vector
+        item["embedding"] = vector.tolist()
+        item["tiempos"] = {"embedding_ms": embedding_ms}
+        t = time.perf_counter()
+        try:
+            chunks = rag_core.buscar_contexto(
+                item["pregunta"], item["filtros"], k=TOP_K,
+                pregunta_embedding=item["embedding"], tiempos=item["tiempos"], verbose=False,
+            )
+        except Exception as e:
+            item["error"] = f"recuperación: {e}"
+            return item
+        item["tiempos"]["recuperacion_ms"] = (time.perf_counter() - t) * 1000
+        item["fuentes"] = rag_core.fuentes_de(chunks)
+        item["prompt"] = rag_core.construir_prompt(chunks, item["pregunta"])
+        item["clave"] = {
+            "pregunta": item["pregunta"],
+            "embedding": item["embedding"],
+            "modelo": item["modelo"],
+            "chunk_ids": [ch["id"] for ch in chunks],
+        }
+        if usar_cache:
+            acierto, item["huella"] = rag_core.buscar_en_cache(item["clave"])
+            if acierto:
+                item["respuesta"], item["similitud"] = acierto[0], acierto[2]
+        return item
+
+    # Varios hilos a la vez: query_batcher junta sus consultas a Chroma
+    with ThreadPoolExecutor(max_workers=min(8, len(tanda))) as pool:
+        return list(pool.map(recuperar, zip(tanda, vectores)))
+
+
+def _poner(cola: queue.Queue, item, parar: threading.Event):
+    """put() bloqueante que se rinde si el hilo principal ha parado."""
+    while not parar.is_set():
+        try:
+            cola.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _productor(tandas, usar_cache, cola, parar, errores):
+    """Hilo de recuperación: va una o dos tandas por delante de la generación."""
+    try:
+        for tanda in tandas:
+            if parar.is_set():
+                break
+            _poner(cola, _recuperar_tanda(tanda, usar_cache), parar)
+    except Exception as e:
+        errores.append(e)
+    finally:
+        _poner(cola, _FIN, parar)
+
+
+def _generar(item: dict, usar_cache: bool) -> dict:
+    """Llama a Ollama (si no salió de la caché) y devuelve la línea de salida."""
+    linea = {
+        "id": item["id"],
+        "pregunta": item["texto"],
+        "modelo": item["modelo"],
+        "respuesta": item.get("respuesta"),
+        "fuentes": item.get("fuentes", []),
+        "cache": "similitud" in item,
+        "tiempos": item["tiempos"],
+        "error": item.get("error"),
+    }
+    if linea["error"]:
+        return linea
+    if linea["cache"]:
+        tracing.registrar("lote", item["modelo"], item["pregunta"],
+                          {"etapas": item["tiempos"], "cache": True, "similitud": item["similitud"]})
+        return linea
+
+    stats = {}
+    try:
+        linea["respuesta"] = rag_core.llamar_ollama(item["modelo"], item["prompt"], stats=stats)
+    except Exception as e:
+        linea["error"] = f"generación: {e}"
+        return linea
+    tracing.registrar("lote", item["modelo"], item["pregunta"], {**stats, "etapas": dict(item["tiempos"])})
+    linea["tiempos"].update({
+        "generacion_s": stats.get("total_s"),
+        "ttft_s": stats.get("ttft_s"),
+        "tokens_s": stats.get("tokens_s"),
+    })
+    if usar_cache and item.get("huella") is not None:
+        rag_core.guardar_en_cache(item["clave"], item["huella"], linea["respuesta"], linea["fuentes"])
+    return linea
+
+
+def run(entrada, salida, tam_tanda: int = TANDA, usar_cache: bool = True, reanudar: bool = True) -> dict:
+    entrada, salida = Path(entrada), Path(salida)
+    preguntas = cargar_preguntas(entrada)
+    hechas = ya_respondidas(salida) if reanudar else set()
+    pendientes = [p for p in preguntas if p["id"] not in hechas]
+
+    print(f"📝 {len(preguntas)} pregunta(s) en {entrada.name}; "
+          f"{len(preguntas) - len(pendientes)} ya respondidas, {len(pendientes)} pendientes.")
+    if not pendientes:
+        return {"respondidas": 0, "errores": 0, "total_s": 0.0}
+
+    # Agrupar por modelo (en orden de primera aparición) para no alternar modelos
+    grupos = {}
+    for p in pendientes:
+        filtros, pregunta = rag_core.parsear_filtros_y_pregunta(p["texto"])
+        p.update({"filtros": filtros, "pregunta": pregunta, "modelo": elegir_modelo(pregunta)})
+        grupos.setdefault(p["modelo"], []).append(p)
+    for modelo, items in grupos.items():
+        print(f"   · {modelo}: {len(items)}")
+
+    tandas = [
+        items[i:i + tam_tanda]
+        for items in grupos.values()
+        for i in range(0, len(items), tam_tanda)
+    ]
+
+    cola = queue.Queue(maxsize=COLA_TANDAS)
+    parar = threading.Event()
+    errores = []
+    hilo = threading.Thread(
+        target=_productor, args=(tandas, usar_cache, cola, parar, errores),
+        name="batch-recuperacion", daemon=True,
+    )
+
+    if reanudar and salida.exists() and salida.stat().st_size:
+        with salida.open("rb") as f:
+            f.seek(-1, 2)
+            cortada = f.read(1) != b"\n"
+        if cortada:
+            # La ejecución anterior se cortó a mitad de línea: la siguiente va aparte
+            with salida.open("a", encoding="utf-8") as f:
+                f.write("\n")
+
+    t0 = time.perf_counter()
+    respondidas = fallidas = 0
+    hilo.start()
+    try:
+        with salida.open("a" if reanudar else "w", encoding="utf-8") as f:
+            while True:
+                tanda = cola.get()
+                if tanda is _FIN:
+                    break
+                for item in tanda:
+                    linea = _generar(item, usar_cache)
+                    f.write(json.dumps(linea, ensure_ascii=False) + "\n")
+                    f.flush()
+                    if linea["error"]:
+                        fallidas += 1
+                        print(f"   ⚠ [{item['id']}] {linea['error']}")
+                    else:
+                        respondidas += 1
+                    hechas_ahora = respondidas + fallidas
+                    if hechas_ahora % 10 == 0 or hechas_ahora == len(pendientes):
+                        vel = hechas_ahora / (time.perf_counter() - t0)
+                        print(f"   … {hechas_ahora}/{len(pendientes)} ({vel:.2f} preguntas/s)")
+    finally:
+        parar.set()
+        hilo.join(timeout=5)
+
+    if errores:
+        raise errores[0]
+
+    total = time.perf_counter() - t0
+    print(f"\n✅ {respondidas} respondida(s), {fallidas} con error · {total:.1f} s → {salida}")
+    if fallidas:
+        print("   Vuelve a ejecutar el mismo comando para reintentar las que fallaron.")
+    return {"respondidas": respondidas, "errores": fallidas, "total_s": total}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Responde un archivo de preguntas con el RAG")
+    parser.add_argument("entrada", help="preguntas en .jsonl o .csv")
+    parser.add_argument("-o", "--salida", default=None, help="JSONL de respuestas (por defecto <entrada>.respuestas.jsonl)")
+    parser.add_argument("--tanda", type=int, default=TANDA, help=f"preguntas por tanda de recuperación (por defecto {TANDA})")
+    parser.add_argument("--sin-cache", action="store_true", help="no usar la caché semántica de respuestas")
+    parser.add_argument("--desde-cero", action="store_true", help="ignora respuestas anteriores y sobrescribe la salida")
+    args = parser.parse_args()
+
+    salida = args.salida or str(Path(args.entrada).with_suffix(".respuestas.jsonl"))
+    try:
+        run(args.entrada, salida, tam_tanda=max(1, args.tanda),
+            usar_cache=not args.sin_cache, reanudar=not args.desde_cero)
+    except KeyboardInterrupt:
+        print("\n⏸ Interrumpido. Lo ya escrito se conserva: vuelve a lanzarlo para continuar.")
+    finally:
+        runtime.teardown()
@@ -0,0 +1,531 @@
+# benchmark.py - Banco de pruebas de la ingesta y la recuperación (sin Ollama real)
+#
+#   python benchmark.py                         # corpus sintético por defecto
+#   python benchmark.py --docs 80 --preguntas 60 --salida hoy.json
+#   python benchmark.py --chunker caracteres --comparar hoy.json
+#   python benchmark.py --vector-backend int8 --comparar hoy.json
+#   python benchmark.py --sharding carpeta --comparar hoy.json
+#
+# Qué hace:
+#   1. Genera en una carpeta temporal un corpus sintético (txt, md, docx y pdf)
+#      con "hechos" únicos sembrados entre texto de relleno, y un conjunto de
+#      preguntas etiquetadas: cada una sabe qué marca debe aparecer en el
+#      fragmento correcto.
+#   2. Mide por separado carga, troceado, embeddings y escritura en Chroma.
+#   3. Mide la latencia (p50/p90/p95/p99) de rag_core.buscar_contexto y de
+#      rag_query.rag_query con un Ollama falso en local que responde al instante,
+#      así que lo que se mide es solo lo nuestro.
+#   4. Calcula recall@1, recall@3, recall@TOP_K y MRR.
+#   5. Guarda todo en JSON (con los parámetros usados) para comparar ejecuciones.
+#
+# No toca docs/, chroma_db/ ni cache/: antes de importar nada del RAG se
+# apuntan las variables RAG_* de config.py a la carpeta temporal.
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FORMATOS = ["txt", "md", "docx", "pdf"]
+
+_RELLENO = {
+    "redes": ["el router", "la VLAN", "el cortafuegos", "la subred", "el switch", "la VPN",
+              "el balanceador", "el proxy", "la latencia", "el enlace troncal"],
+    "finanzas": ["el presupuesto", "la factura", "el proveedor", "la partida", "el trimestre",
+                 "la auditoría", "el coste", "la amortización", "el contrato", "el pago"],
+    "personal": ["el turno", "la formación", "el equipo", "la evaluación", "el convenio",
+                 "la incorporación", "el responsable", "la plantilla", "la baja", "el horario"],
+    "soporte": ["la incidencia", "el ticket", "el parche", "la copia de seguridad", "el servidor",
+                "la actualización", "el inventario", "la licencia", "el portátil", "la impresora"],
+}
+_VERBOS = ["se revisa", "se documenta", "se aprueba", "se comunica", "se planifica",
+           "se supervisa", "se actualiza", "se registra", "se valida", "se prioriza"]
+_CUANDO = ["cada lunes", "al cierre del mes", "antes de cada cambio", "según el procedimiento",
+           "tras cada incidencia", "en la reunión semanal", "con el área afectada", "por escrito"]
+_SILABAS = ["ra", "mo", "ti", "len", "sa", "vor", "qui", "del", "na", "bru", "ces", "lo", "mar", "tu"]
+_SALAS = ["norte", "sur", "este", "oeste", "central", "anexo"]
+
+
+# ── Corpus sintético ─────────────────────────────────────────
+
+def _frase(rng: random.Random, tema: str) -> str:
+    sujeto = rng.choice(_RELLENO[tema])
+    return f"{sujeto.capitalize()} {rng.choice(_VERBOS)} {rng.choice(_CUANDO)}."
+
+
+def _parrafo(rng: random.Random, tema: str) -> str:
+    return " ".join(_frase(rng, tema) for _ in range(rng.randint(3, 7)))
+
+
+def _nombre(rng: random.Random, usados: set) -> str:
+    while True:
+        nombre = "".join(rng.choice(_SILABAS) for _ in range(3)).capitalize()
+        if nombre not in usados:
+            usados.add(nombre)
+            return nombre
+
+
+def _hecho(rng: random.Random, usados: set) -> tuple[str, dict]:
+    """Una frase con un dato único y su pregunta. La "marca" identifica el fragmento correcto."""
+    if rng.random() < 0.5:
+        # Búsqueda exacta: un código que solo aparece una vez en todo el corpus
+        codigo = f"{rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ')}-{rng.randint(1000, 9999)}"
+        while codigo in usados:
+            codigo = f"{codigo[:3]}{rng.randint(1000, 9999)}"
+        usados.add(codigo)
+        host = _nombre(rng, usados).lower()
+        sala = rng.choice(_SALAS)
+        frase = f"El activo {codigo} corresponde al servidor {host} instalado en la sala {sala}."
+        return frase, {"tipo": "exacta", "marca": codigo,
+                       "pregunta": f"¿Qué servidor corresponde al activo {codigo}?"}
+
+    # Semántica: la pregunta no repite la frase, solo el nombre del proyecto
+    proyecto = _nombre(rng, usados)
+    responsable = _nombre(rng, usados)
+    semanas = rng.randint(2, 40)
+    frase = (f"El proyecto {proyecto} lo coordina {responsable} y tiene una duración "
+             f"prevista de {semanas} semanas.")
+    return frase, {"tipo": "semantica", "marca": proyecto,
+                   "pregunta": f"¿Quién dirige el proyecto {proyecto} y cuánto va a durar?"}
+
+
+def _escribir_docx(path: Path, parrafos: list[str]):
+    from docx import Document
+
+    doc = Document()
+    for p in parrafos:
+        doc.add_paragraph(p)
+    doc.save(str(path))
+
+
+def _escribir_pdf(path: Path, parrafos: list[str]):
+    """PDF de texto mínimo escrito a mano (Helvetica, 45 líneas por página)."""
+    def escapar(t):
+        return t.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    lineas = []
+    for p in parrafos:
+        lineas.extend(textwrap.wrap(p, 90))
+        lineas.append("")
+    paginas = [lineas[i:i + 45] for i in range(0, len(lineas), 45)] or [[]]
+
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(paginas)))
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(paginas)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, pagina in enumerate(paginas):
+        texto = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({escapar(l)}) Tj T*" for l in pagina) + " ET"
+        datos = texto.encode("cp1252", "replace")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objetos.append(f"<< /Length {len(datos)} >>\nstream\n".encode() + datos + b"\nendstream")
+
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, cuerpo in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += f"{n} 0 obj\n".encode() + cuerpo + b"\nendobj\n"
+    xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for o in offsets:
+        salida += f"{o:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(salida))
+
+
+def generar_corpus(docs_dir: Path, n_docs: int, n_preguntas: int, semilla: int) -> list[dict]:
+    """Crea los documentos y devuelve las preguntas etiquetadas."""
+    rng = random.Random(semilla)
+    usados = set()
+    temas = list(_RELLENO)
+    preguntas = []
+
+    # Reparto de hechos: todos los documentos reciben alguno si hay suficientes
+    hechos_por_doc = [0] * n_docs
+    for i in range(n_preguntas):
+        hechos_por_doc[i % n_docs] += 1
+
+    for i in range(n_docs):
+        tema = temas[i % len(temas)]
+        formato = FORMATOS[i % len(FORMATOS)]
+        carpeta = docs_dir / tema
+        carpeta.mkdir(parents=True, exist_ok=True)
+        path = carpeta / f"{tema}_{i:03d}.{formato}"
+
+        parrafos = [_parrafo(rng, tema) for _ in range(rng.randint(6, 30))]
+        for _ in range(hechos_por_doc[i]):
+            frase, pregunta = _hecho(rng, usados)
+            pos = rng.randrange(len(parrafos))
+            parrafos[pos] = f"{parrafos[pos]} {frase}"
+            pregunta.update({"id": f"q{len(preguntas) + 1}", "archivo": path.name})
+            preguntas.append(pregunta)
+
+        if formato == "docx":
+            _escribir_docx(path, parrafos)
+        elif formato == "pdf":
+            _escribir_pdf(path, parrafos)
+        else:
+            if formato == "md":
+                parrafos = [f"# Informe de {tema} {i}"] + parrafos
+            path.write_text("\n\n".join(parrafos), encoding="utf-8")
+
+    return preguntas
+
+
+# ── Ollama falso ─────────────────────────────────────────────
+
+class _OllamaFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        lineas = []
+        if cuerpo.get("stream", True):
+            lineas += [{"message": {"content": t}, "done": False} for t in ("Respuesta", " de", " prueba.")]
+        else:
+            lineas.append({"message": {"content": "Respuesta de prueba."}, "done": False})
+        lineas.append({"message": {"content": ""}, "done": True, "eval_count": 3,
+                       "eval_duration": 1_000_000, "prompt_eval_count": 1, "prompt_eval_duration": 1})
+        self.wfile.write("".join(json.dumps(l) + "\n" for l in lineas).encode("utf-8"))
+
+
+def arrancar_ollama_falso() -> ThreadingHTTPServer:
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaFalso)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="ollama-falso", daemon=True).start()
+    return servidor
+
+
+# ── Métricas ─────────────────────────────────────────────────
+
+def percentiles(valores_s: list[float]) -> dict:
+    """Resumen en milisegundos."""
+    if not valores_s:
+        return {}
+    ms = sorted(v * 1000 for v in valores_s)
+
+    def p(q):
+        return ms[min(len(ms) - 1, int(round(q / 100 * (len(ms) - 1))))]
+
+    return {
+        "n": len(ms),
+        "media_ms": round(statistics.fmean(ms), 2),
+        "p50_ms": round(p(50), 2),
+        "p90_ms": round(p(90), 2),
+        "p95_ms": round(p(95), 2),
+        "p99_ms": round(p(99), 2),
+        "max_ms": round(ms[-1], 2),
+    }
+
+
+def _cronometrar(funcion, repeticiones: int) -> list[float]:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return tiempos
+
+
+def medir_carga(files: list[Path]) -> dict:
+    """Carga y troceado por archivo, fuera de ingest.py (sin procesos ni Chroma)."""
+    from config import CHUNK_SIZE, CHUNK_OVERLAP
+    from chunker import contador_tokens
+    from loaders import iter_segmentos, trocear
+
+    contar = contador_tokens()
+    carga, troceado = [], []
+    n_chunks = caracteres = tokens = 0
+    for f in files:
+        t0 = time.perf_counter()
+        segmentos = list(iter_segmentos(f))
+        t1 = time.perf_counter()
+        chunks = [c for c, _ in trocear(f, CHUNK_SIZE, CHUNK_OVERLAP, segmentos=segmentos)]
+        t2 = time.perf_counter()
+        carga.append(t1 - t0)
+        troceado.append(t2 - t1)
+        n_chunks += len(chunks)
+        caracteres += sum(len(t) for t, _ in segmentos)
+        # Lo que se embebe de verdad (con solapamiento, lo repetido cuenta dos veces)
+        tokens += sum(contar(c) for c in chunks)
+    return {
+        "archivos": len(files),
+        "caracteres": caracteres,
+        "chunks": n_chunks,
+        "tokens_embebidos": tokens,
+        "carga_s": round(sum(carga), 4),
+        "troceado_s": round(sum(troceado), 4),
+        "carga_por_archivo": percentiles(carga),
+        "troceado_por_archivo": percentiles(troceado),
+    }
+
+
+def _tamano_mb(carpeta: Path) -> float:
+    return sum(p.stat().st_size for p in carpeta.rglob("*") if p.is_file()) / 2**20
+
+
+def medir_ingesta(workers: int | None) -> dict:
+    import ingest
+    from config import CHROMA_DIR
+
+    with redirect_stdout(io.StringIO()):
+        stats = ingest.run(mode="full", workers=workers)
+    return {
+        "archivos": stats.archivos,
+        "errores": stats.archivos_error,
+        "chunks": stats.chunks,
+        "duplicados": stats.duplicados,
+        "extraccion_s": round(stats.extraccion_s, 4),
+        "embeddings_s": round(stats.embeddings_s, 4),
+        "escritura_s": round(stats.escritura_s, 4),
+        "total_s": round(stats.total_s, 4),
+        "chunks_por_s": round(stats.chunks / stats.total_s, 1) if stats.total_s else None,
+        # Vectores + metadatos + BM25 + duplicados (todo lo que cuelga de CHROMA_DIR)
+        "disco_mb": round(_tamano_mb(CHROMA_DIR), 2),
+    }
+
+
+def medir_recall(preguntas: list[dict], k: int) -> dict:
+    """Un fragmento es relevante si contiene la marca del hecho por el que se pregunta."""
+    import rag_core
+
+    cortes = sorted({c for c in (1, 3, k) if c <= k})
+    aciertos = {c: 0 for c in cortes}
+    por_tipo = {}
+    rr_total = 0.0
+    fallos = []
+    for p in preguntas:
+        filtros, pregunta = rag_core.parsear_filtros_y_pregunta(p["pregunta"])
+        chunks = rag_core.buscar_contexto(pregunta, filtros, k=k, verbose=False)
+        rango = next((i + 1 for i, ch in enumerate(chunks) if p["marca"] in ch["text"]), None)
+        tipo = por_tipo.setdefault(p["tipo"], {"n": 0, "aciertos": 0})
+        tipo["n"] += 1
+        if rango is None:
+            fallos.append(p["id"])
+            continue
+        tipo["aciertos"] += 1
+        rr_total += 1 / rango
+        for c in cortes:
+            if rango <= c:
+                aciertos[c] += 1
+
+    n = len(preguntas) or 1
+    resultado = {f"recall@{c}": round(aciertos[c] / n, 4) for c in cortes}
+    resultado["mrr"] = round(rr_total / n, 4)
+    resultado[f"recall@{k}_por_tipo"] = {
+        t: round(v["aciertos"] / v["n"], 4) for t, v in por_tipo.items()
+    }
+    resultado["fallos"] = fallos
+    return resultado
+
+
+# ── Comparación entre ejecuciones ────────────────────────────
+
+_METRICAS_COMPARADAS = [
+    ("ingesta.total_s", "ingesta total (s)", False),
+    ("ingesta.embeddings_s", "embeddings (s)", False),
+    ("ingesta.escritura_s", "escritura (s)", False),
+    ("ingesta.disco_mb", "base en disco (MB)", False),
+    ("carga.carga_s", "carga (s)", False),
+    ("carga.troceado_s", "troceado (s)", False),
+    ("carga.chunks", "chunks", False),
+    ("carga.tokens_embebidos", "tokens embebidos", False),
+    ("buscar_contexto.p50_ms", "buscar_contexto p50 (ms)", False),
+    ("buscar_contexto.p95_ms", "buscar_contexto p95 (ms)", False),
+    ("rag_query.p50_ms", "rag_query p50 (ms)", False),
+    ("rag_query.p95_ms", "rag_query p95 (ms)", False),
+    ("recall.mrr", "MRR", True),
+]
+
+
+def _valor(datos: dict, ruta: str):
+    for parte in ruta.split("."):
+        if not isinstance(datos, dict) or parte not in datos:
+            return None
+        datos = datos[parte]
+    return datos
+
+
+def comparar(actual: dict, previo: dict):
+    print(f"\n📊 Comparación con {previo.get('fecha', 'la ejecución anterior')}:")
+    metricas = list(_METRICAS_COMPARADAS)
+    metricas += [(f"recall.{c}", c, True) for c in actual.get("recall", {}) if c.startswith("recall@") and "_" not in c]
+    for ruta, nombre, mas_es_mejor in metricas:
+        a, b = _valor(actual, ruta), _valor(previo, ruta)
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+            continue
+        delta = ((a - b) / b * 100) if b else 0.0
+        mejor = (delta > 0) == mas_es_mejor
+        marca = " " if abs(delta) < 2 else ("✅" if mejor else "⚠")
+        print(f"   {marca} {nombre:<26} {b:>10.3f} → {a:>10.3f}  ({delta:+.1f}%)")
+    if actual.get("parametros") != previo.get("parametros"):
+        print("   (parámetros distintos entre las dos ejecuciones)")
+
+
+# ── Programa ─────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta, latencia y recall del RAG")
+    parser.add_argument("--docs", type=int, default=40, help="documentos sintéticos (por defecto 40)")
+    parser.add_argument("--preguntas", type=int, default=40, help="preguntas etiquetadas (por defecto 40)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="veces que se lanza cada pregunta para la latencia")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--chunker", choices=["estructura", "caracteres"], default=None, help="sustituye CHUNKER de config.py")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="sustituye CHUNK_TOKENS de config.py")
+    parser.add_argument("--chunk-size", type=int, default=None, help="sustituye CHUNK_SIZE de config.py")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="sustituye CHUNK_OVERLAP de config.py")
+    parser.add_argument("--top-k", type=int, default=None, help="sustituye TOP_K de config.py")
+    parser.add_argument("--sin-dedup", action="store_true", help="ingesta sin deduplicación de chunks (DEDUP_ENABLED)")
+    parser.add_argument("--modelo-embeddings", default=None, help="sustituye EMBEDDING_MODEL_NAME de config.py")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx", "onnx-int8"], default=None,
+                        help="sustituye EMBEDDING_BACKEND de config.py")
+    parser.add_argument("--vector-backend", choices=["chroma", "int8"], default=None, help="sustituye VECTOR_BACKEND de config.py")
+    parser.add_argument("--sharding", choices=["carpeta", "hash"], default=None, help="sustituye SHARDING de config.py")
+    parser.add_argument("--workers", type=int, default=None, help="procesos de extracción en la ingesta")
+    parser.add_argument("--salida", default="benchmark.json", help="JSON con los resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una ejecución anterior")
+    parser.add_argument("--conservar", action="store_true", help="no borra la carpeta temporal al terminar")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    ollama = arrancar_ollama_falso()
+    os.environ.update({
+        "RAG_DOCS_DIR": str(tmp / "docs"),
+        "RAG_CHROMA_DIR": str(tmp / "chroma_db"),
+        "RAG_CACHE_DIR": str(tmp / "cache"),
+        "RAG_TRACE_LOG": str(tmp / "traces.jsonl"),
+        "RAG_OLLAMA_URL": f"http://127.0.0.1:{ollama.server_address[1]}/api/chat",
+        "RAG_ANSWER_CACHE": "0",  # si no, las repeticiones medirían la caché
+    })
+    if args.sin_dedup:
+        os.environ["RAG_DEDUP"] = "0"
+    for nombre, valor in (("RAG_CHUNKER", args.chunker), ("RAG_CHUNK_TOKENS", args.chunk_tokens),
+                          ("RAG_CHUNK_SIZE", args.chunk_size), ("RAG_CHUNK_OVERLAP", args.chunk_overlap),
+                          ("RAG_TOP_K", args.top_k), ("RAG_EMBEDDING_MODEL", args.modelo_embeddings),
+                          ("RAG_VECTOR_BACKEND", args.vector_backend), ("RAG_SHARDING", args.sharding),
+                          ("RAG_EMBEDDING_BACKEND", args.embedding_backend)):
+        if valor is not None:
+            os.environ[nombre] = str(valor)
+
+    # A partir de aquí ya se puede importar el RAG: config.py lee las variables de arriba
+    import config
+    import runtime
+
+    try:
+        print(f"🧪 Generando corpus sintético en {tmp} ...")
+        preguntas = generar_corpus(config.DOCS_DIR, max(1, args.docs), max(1, args.preguntas), args.semilla)
+        files = sorted(p for p in config.DOCS_DIR.rglob("*") if p.is_file())
+
+        print("⏱ Carga y troceado ...")
+        carga = medir_carga(files)
+
+        print("⏱ Ingesta completa (embeddings + Chroma + BM25) ...")
+        ingesta = medir_ingesta(args.workers)
+
+        import rag_core
+        import rag_query
+
+        # Primera consulta fuera de la medida (carga perezosa de modelo y colección)
+        with redirect_stdout(io.StringIO()):
+            rag_core.buscar_contexto(preguntas[0]["pregunta"], {}, k=config.TOP_K, verbose=False)
+
+        print("⏱ Latencia de buscar_contexto ...")
+        t_buscar = []
+        for p in preguntas:
+            filtros, pregunta = rag_core.parsear_filtros_y_pregunta(p["pregunta"])
+            t_buscar += _cronometrar(
+                lambda: rag_core.buscar_contexto(pregunta, filtros, k=config.TOP_K, verbose=False),
+                args.repeticiones,
+            )
+
+        print("⏱ Latencia de rag_query (Ollama falso) ...")
+        t_rag = []
+        for p in preguntas:
+            t_rag += _cronometrar(lambda: rag_query.rag_query(p["pregunta"]), args.repeticiones)
+
+        print("🎯 Recall ...")
+        recall = medir_recall(preguntas, config.TOP_K)
+
+        resultado = {
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "parametros": {
+                "docs": args.docs,
+                "preguntas": len(preguntas),
+                "repeticiones": args.repeticiones,
+                "semilla": args.semilla,
+                "chunker": config.CHUNKER,
+                "chunk_tokens": config.CHUNK_TOKENS,
+                "chunk_size": config.CHUNK_SIZE,
+                "chunk_overlap": config.CHUNK_OVERLAP,
+                "dedup": config.DEDUP_ENABLED,
+                "vector_backend": config.VECTOR_BACKEND,
+                "sharding": config.SHARDING,
+                "top_k": config.TOP_K,
+                "modelo_embeddings": config.EMBEDDING_MODEL_NAME,
+                "embedding_backend": config.EMBEDDING_BACKEND,
+                "busqueda_hibrida": config.HYBRID_SEARCH,
+                "rerank": config.RERANK_ENABLED,
+                "query_batching": config.QUERY_BATCHING,
+            },
+            "entorno": {
+                "python": platform.python_version(),
+                "sistema": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "carga": carga,
+            "ingesta": ingesta,
+            "buscar_contexto": percentiles(t_buscar),
+            "rag_query": percentiles(t_rag),
+            "recall": recall,
+        }
+    finally:
+        runtime.teardown()
+        ollama.shutdown()
+        if args.conservar:
+            print(f"📁 Carpeta conservada: {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    salida = Path(args.salida)
+    salida.write_text(json.dumps(resultado, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\n📦 Ingesta: {ingesta['archivos']} archivos, {ingesta['chunks']} chunks en {ingesta['total_s']:.2f} s "
+          f"(embeddings {ingesta['embeddings_s']:.2f} s · escritura {ingesta['escritura_s']:.2f} s · "
+          f"{ingesta['disco_mb']:.1f} MB en disco)")
+    print(f"   Carga {carga['carga_s']:.2f} s · troceado {carga['troceado_s']:.2f} s · "
+          f"{carga['tokens_embebidos']} tokens embebidos")
+    for nombre in ("buscar_contexto", "rag_query"):
+        r = resultado[nombre]
+        print(f"⏱ {nombre}: p50 {r['p50_ms']:.1f} ms · p95 {r['p95_ms']:.1f} ms · p99 {r['p99_ms']:.1f} ms")
+    metricas = " · ".join(f"{c} {v:.2f}" for c, v in recall.items() if c.startswith("recall@") and "_" not in c)
+    print(f"🎯 {metricas} · MRR {recall['mrr']:.2f}")
+    print(f"💾 Resultados en {salida}")
+
+    if args.comparar:
+        comparar(resultado, json.loads(Path(args.comparar).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# benchmark_embeddings.py - Paridad, arranque y velocidad de los motores de embeddings
+#
+#   python benchmark_embeddings.py                          # todos los motores disponibles
+#   python benchmark_embeddings.py --backends onnx onnx-int8 --chunks 2000
+#   python benchmark_embeddings.py --solo-paridad          # solo la comprobación (código 1 si falla)
+#
+# Cada motor (ver embeddings.py) se mide en un proceso nuevo, como lo vería
+# el RAG al arrancar:
+#   arranque   import + carga del modelo, primer encode y el proceso entero
+#              (con el arranque de Python)
+#   velocidad  chunks/s embebiendo un corpus sintético en lotes de EMBED_MAX_BATCH
+# Paridad: coseno entre los vectores de cada motor ONNX y los de torch para
+# los mismos textos. Por debajo de EMBEDDING_PARIDAD_MIN el programa termina
+# con código 1: sirve de prueba después de exportar_onnx.py o de actualizar
+# torch / onnxruntime.
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import EMBED_MAX_BATCH, EMBEDDING_MODEL_NAME, EMBEDDING_PARIDAD_MIN
+
+
+def textos_de_prueba(n: int, semilla: int = 1234) -> list[str]:
+    """Chunks de una a cuatro párrafos y alguna pregunta corta (longitudes variadas)."""
+    from benchmark import _RELLENO, _parrafo
+
+    rng = random.Random(semilla)
+    textos = []
+    for i in range(n):
+        tema = rng.choice(list(_RELLENO))
+        if i % 5 == 0:
+            textos.append(f"¿Quién revisa {rng.choice(_RELLENO[tema])} y cada cuánto?")
+        else:
+            textos.append("\n\n".join(_parrafo(rng, tema) for _ in range(rng.randint(1, 4))))
+    return textos
+
+
+def cosenos(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Coseno fila a fila entre dos matrices de vectores."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+
+
+# ── Medida de un motor (proceso hijo) ─────────────────────────
+
+def medir(backend: str, carpeta: Path, n: int, lote: int) -> dict:
+    t0 = time.perf_counter()
+    from embeddings import cargar_embedder
+
+    embedder = cargar_embedder(backend)
+    t1 = time.perf_counter()
+    embedder.encode(["calentamiento"])
+    t2 = time.perf_counter()
+
+    textos = textos_de_prueba(n)
+    t3 = time.perf_counter()
+    vectores = np.asarray(embedder.encode(textos, batch_size=lote, show_progress_bar=False), dtype=np.float32)
+    t4 = time.perf_counter()
+    np.save(carpeta / f"{backend}.npy", vectores)
+    return {
+        "import_y_carga_s": round(t1 - t0, 3),
+        "primer_encode_ms": round((t2 - t1) * 1000, 1),
+        "chunks": n,
+        "embeddings_s": round(t4 - t3, 3),
+        "chunks_por_s": round(n / (t4 - t3), 1) if t4 > t3 else None,
+    }
+
+
+def _en_proceso_aparte(backend: str, carpeta: Path, n: int, lote: int) -> dict | None:
+    salida = carpeta / f"{backend}.json"
+    t0 = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--medir", backend, "--carpeta", str(carpeta),
+         "--chunks", str(n), "--lote", str(lote), "--json-medida", str(salida)],
+        cwd=str(Path(__file__).resolve().parent), capture_output=True, text=True,
+    )
+    total = time.perf_counter() - t0
+    if proceso.returncode != 0:
+        error = (proceso.stderr.strip().splitlines() or ["error desconocido"])[-1]
+        print(f"   ⚠ {backend}: no disponible ({error})")
+        return None
+    r = json.loads(salida.read_text(encoding="utf-8"))
+    r["proceso_s"] = round(total, 3)
+    return r
+
+
+# ── Programa ─────────────────────────────────────────────────
+
+def main():
+    from embeddings import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Paridad, arranque y chunks/s de los motores de embeddings")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--chunks", type=int, default=1000, help="chunks sintéticos a embeber (por defecto 1000)")
+    parser.add_argument("--lote", type=int, default=EMBED_MAX_BATCH, help="chunks por lote")
+    parser.add_argument("--solo-paridad", action="store_true", help="solo compara con torch (200 chunks)")
+    parser.add_argument("--salida", default="benchmark_embeddings.json", help="JSON con los resultados")
+    # Uso interno: medida de un motor en un proceso hijo
+    parser.add_argument("--medir", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--carpeta", help=argparse.SUPPRESS)
+    parser.add_argument("--json-medida", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        resultado = medir(args.medir, Path(args.carpeta), args.chunks, args.lote)
+        Path(args.json_medida).write_text(json.dumps(resultado), encoding="utf-8")
+        return 0
+
+    n = 200 if args.solo_paridad else max(1, args.chunks)
+    backends = list(args.backends)
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # la referencia de la paridad
+
+    tmp = Path(tempfile.mkdtemp(prefix="rag_emb_bench_"))
+    motores = {}
+    try:
+        for backend in backends:
+            print(f"⏱ {backend}: arranque y {n} chunks...")
+            r = _en_proceso_aparte(backend, tmp, n, max(1, args.lote))
+            if r is not None:
+                motores[backend] = r
+
+        fallos = []
+        if "torch" not in motores:
+            print("⚠ Sin el motor torch no se puede comprobar la paridad.")
+        else:
+            referencia = np.load(tmp / "torch.npy")
+            for backend in motores:
+                if backend == "torch":
+                    continue
+                c = cosenos(referencia, np.load(tmp / f"{backend}.npy"))
+                minimo = EMBEDDING_PARIDAD_MIN[backend]
+                motores[backend]["paridad"] = {
+                    "coseno_min": round(float(c.min()), 6),
+                    "coseno_media": round(float(c.mean()), 6),
+                    "umbral": minimo,
+                    "ok": bool(c.min() >= minimo),
+                }
+                if c.min() < minimo:
+                    fallos.append(backend)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"\n🧠 {EMBEDDING_MODEL_NAME} · {n} chunks · lotes de {args.lote} · {os.cpu_count()} CPUs")
+    for backend, r in motores.items():
+        if backend not in args.backends:
+            continue
+        linea = f"   {backend:<10} "
+        if not args.solo_paridad:
+            linea += (f"import+carga {r['import_y_carga_s']:.2f} s · primer encode {r['primer_encode_ms']:.0f} ms · "
+                      f"proceso {r['proceso_s']:.2f} s · {r['chunks_por_s']:.1f} chunks/s")
+        if "paridad" in r:
+            p = r["paridad"]
+            linea += (f"{' · ' if not args.solo_paridad else ''}{'✅' if p['ok'] else '❌'} coseno con torch "
+                      f"mín {p['coseno_min']:.5f} · media {p['coseno_media']:.5f} (umbral {p['umbral']})")
+        print(linea)
+
+    if not args.solo_paridad:
+        resultado = {
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "parametros": {"modelo": EMBEDDING_MODEL_NAME, "chunks": n, "lote": args.lote, "cpus": os.cpu_count()},
+            "motores": motores,
+        }
+        salida = Path(args.salida)
+        salida.write_text(json.dumps(resultado, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 Resultados en {salida}")
+
+    if fallos:
+        print(f"❌ Paridad insuficiente: {', '.join(fallos)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# benchmark_vectores.py - Chroma frente al almacén int8: memoria, disco, latencia y recall
+#
+#   python benchmark_vectores.py                        # 50.000 vectores sintéticos de 384 dim
+#   python benchmark_vectores.py --n 200000 --consultas 500
+#   python benchmark_vectores.py --desde-chroma         # los vectores reales de chroma_db
+#
+# Cada almacén se construye en una carpeta temporal y se mide en procesos
+# aparte (la memoria de uno no se mezcla con la del otro):
+#   carga      tiempo de meter todos los vectores (upsert por tandas)
+#   disco      tamaño de su carpeta
+#   memoria    lo que crece el proceso (RSS) al abrir el almacén y lanzar las
+#              consultas (psutil; sin él, /proc en Linux o el pico de resource).
+#              Incluye las páginas de los archivos mmap que se han tocado,
+#              que el sistema puede soltar si necesita la RAM
+#   latencia   p50/p95 de query(n_results=k), una pregunta cada vez
+#   recall@k   frente a la búsqueda exacta en float32 (fuerza bruta)
+# Si chromadb no está instalado solo se mide el almacén int8.
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ALMACENES = ["chroma", "int8"]
+_TANDA = 5000  # Chroma no admite más de ~5.400 por llamada
+
+
+def _tamano_mb(carpeta: Path) -> float:
+    return sum(p.stat().st_size for p in carpeta.rglob("*") if p.is_file()) / 2**20
+
+
+def _rss_mb() -> float | None:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        # Linux: RSS actual en páginas (segundo campo)
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+# ── Datos ─────────────────────────────────────────────────────
+
+def _normalizar(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def datos_sinteticos(n: int, dim: int, consultas: int, semilla: int):
+    """Vectores normalizados agrupados en temas (como los de un corpus real, no uniformes)."""
+    rng = np.random.default_rng(semilla)
+    temas = rng.normal(size=(max(1, n // 250), dim))
+    vectores = _normalizar(temas[rng.integers(0, len(temas), n)] + 0.7 * rng.normal(size=(n, dim)))
+    preguntas = _normalizar(temas[rng.integers(0, len(temas), consultas)] + 0.7 * rng.normal(size=(consultas, dim)))
+    return vectores, preguntas
+
+
+def datos_de_chroma(consultas: int, semilla: int):
+    """Los vectores de la colección 'docs'; las preguntas, vectores suyos con ruido."""
+    import runtime
+
+    col = runtime.get_client().get_collection(runtime.COLECCION)
+    partes = []
+    for offset in range(0, col.count(), _TANDA):
+        partes.append(np.asarray(col.get(include=["embeddings"], limit=_TANDA, offset=offset)["embeddings"], dtype=np.float32))
+    vectores = np.concatenate(partes)
+    rng = np.random.default_rng(semilla)
+    base = vectores[rng.integers(0, len(vectores), consultas)]
+    preguntas = _normalizar(base + 0.05 * rng.normal(size=base.shape))
+    return vectores, preguntas
+
+
+def vecinos_exactos(vectores: np.ndarray, preguntas: np.ndarray, k: int) -> np.ndarray:
+    normas = (vectores ** 2).sum(axis=1)
+    out = []
+    for q in preguntas:
+        d = normas - 2 * (vectores @ q)
+        top = np.argpartition(d, k - 1)[:k]
+        out.append(top[np.argsort(d[top])])
+    return np.array(out)
+
+
+# ── Medida de un almacén (proceso hijo) ───────────────────────
+
+def _abrir(almacen: str, carpeta: Path):
+    if almacen == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+
+        cliente = chromadb.PersistentClient(path=str(carpeta / "chroma"), settings=Settings(anonymized_telemetry=False))
+        return cliente.get_or_create_collection(name="docs")
+    from vector_store import QuantizedCollection
+
+    return QuantizedCollection(carpeta / "int8")
+
+
+def medir(almacen: str, fase: str, carpeta: Path, k: int) -> dict:
+    if fase == "cargar":
+        vectores = np.load(carpeta / "vectores.npy", mmap_mode="r")
+        t0 = time.perf_counter()
+        col = _abrir(almacen, carpeta)
+        for start in range(0, len(vectores), _TANDA):
+            lote = np.asarray(vectores[start:start + _TANDA])
+            col.upsert(ids=[str(i) for i in range(start, start + len(lote))], embeddings=lote.tolist())
+        if hasattr(col, "entrenar"):
+            col.entrenar()  # como deja el índice migrar_vectores.py
+        segundos = time.perf_counter() - t0
+        if hasattr(col, "cerrar"):
+            col.cerrar()
+        return {"carga_s": round(segundos, 2), "disco_mb": round(_tamano_mb(carpeta / almacen), 2)}
+
+    from benchmark import percentiles
+
+    preguntas = np.load(carpeta / "consultas.npy")
+    antes = _rss_mb()
+    t0 = time.perf_counter()
+    col = _abrir(almacen, carpeta)
+    col.query(query_embeddings=[preguntas[0].tolist()], n_results=k)
+    primera = time.perf_counter() - t0
+    tiempos, ids = [], []
+    for q in preguntas:
+        t0 = time.perf_counter()
+        res = col.query(query_embeddings=[q.tolist()], n_results=k)
+        tiempos.append(time.perf_counter() - t0)
+        ids.append([int(x) for x in res["ids"][0]])
+    despues = _rss_mb()
+    lat = percentiles(tiempos)
+    return {
+        "abrir_y_primera_consulta_ms": round(primera * 1000, 1),
+        "p50_ms": lat["p50_ms"],
+        "p95_ms": lat["p95_ms"],
+        "memoria_mb": round(despues - antes, 1) if antes is not None and despues is not None else None,
+        "ids": ids,
+    }
+
+
+def _en_proceso_aparte(almacen: str, fase: str, carpeta: Path, k: int) -> dict:
+    salida = carpeta / f"{almacen}.{fase}.json"
+    # config.py (lo importa vector_store) no debe apuntar a la chroma_db de verdad
+    entorno = dict(os.environ, RAG_CHROMA_DIR=str(carpeta / "config"))
+    subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--medir", almacen, "--fase", fase,
+         "--carpeta", str(carpeta), "--k", str(k), "--json-medida", str(salida)],
+        check=True, env=entorno, cwd=str(Path(__file__).resolve().parent),
+    )
+    return json.loads(salida.read_text(encoding="utf-8"))
+
+
+# ── Programa ─────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria, disco, latencia y recall: Chroma frente a int8")
+    parser.add_argument("--n", type=int, default=50000, help="vectores sintéticos (por defecto 50.000)")
+    parser.add_argument("--dim", type=int, default=384, help="dimensión (la de all-MiniLM-L6-v2 por defecto)")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="resultados por consulta (recall@k)")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--desde-chroma", action="store_true", help="usa los vectores de la colección real")
+    parser.add_argument("--salida", default="benchmark_vectores.json", help="JSON con los resultados")
+    parser.add_argument("--conservar", action="store_true", help="no borra la carpeta temporal al terminar")
+    # Uso interno: medida de un almacén en un proceso hijo
+    parser.add_argument("--medir", choices=ALMACENES, help=argparse.SUPPRESS)
+    parser.add_argument("--fase", choices=["cargar", "consultar"], help=argparse.SUPPRESS)
+    parser.add_argument("--carpeta", help=argparse.SUPPRESS)
+    parser.add_argument("--json-medida", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        resultado = medir(args.medir, args.fase, Path(args.carpeta), args.k)
+        Path(args.json_medida).write_text(json.dumps(resultado), encoding="utf-8")
+        return 0
+
+    if args.desde_chroma:
+        print("📚 Leyendo los vectores de la colección 'docs'...")
+        vectores, preguntas = datos_de_chroma(args.consultas, args.semilla)
+    else:
+        print(f"🧪 Generando {args.n} vectores sintéticos de {args.dim} dimensiones...")
+        vectores, preguntas = datos_sinteticos(args.n, args.dim, args.consultas, args.semilla)
+    k = max(1, min(args.k, len(vectores)))
+
+    tmp = Path(tempfile.mkdtemp(prefix="rag_vec_bench_"))
+    try:
+        np.save(tmp / "vectores.npy", vectores)
+        np.save(tmp / "consultas.npy", preguntas)
+        print("🎯 Vecinos exactos (float32, fuerza bruta)...")
+        exactos = vecinos_exactos(vectores, preguntas, k)
+
+        almacenes = {}
+        for almacen in ALMACENES:
+            if almacen == "chroma" and importlib.util.find_spec("chromadb") is None:
+                print("⚠ chromadb no está instalado: se mide solo el almacén int8.")
+                continue
+            print(f"⏱ {almacen}: carga...")
+            r = _en_proceso_aparte(almacen, "cargar", tmp, k)
+            print(f"⏱ {almacen}: consultas...")
+            r.update(_en_proceso_aparte(almacen, "consultar", tmp, k))
+            ids = r.pop("ids")
+            r[f"recall@{k}"] = round(float(np.mean([len(set(a) & set(b.tolist())) / k for a, b in zip(ids, exactos)])), 4)
+            almacenes[almacen] = r
+    finally:
+        if args.conservar:
+            print(f"📁 Carpeta conservada: {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "parametros": {
+            "vectores": len(vectores),
+            "dim": int(vectores.shape[1]),
+            "consultas": len(preguntas),
+            "k": k,
+            "origen": "chroma_db" if args.desde_chroma else "sintético",
+        },
+        "vectores_float32_mb": round(vectores.nbytes / 2**20, 2),
+        "almacenes": almacenes,
+    }
+    salida = Path(args.salida)
+    salida.write_text(json.dumps(resultado, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\n📦 {len(vectores)} vectores de {vectores.shape[1]} dim ({resultado['vectores_float32_mb']:.1f} MB en float32)")
+    for almacen, r in almacenes.items():
+        memoria = f"{r['memoria_mb']:.1f} MB" if r["memoria_mb"] is not None else "?"
+        print(f"   {almacen:<7} disco {r['disco_mb']:>8.1f} MB · memoria {memoria:>9} · carga {r['carga_s']:.1f} s · "
+              f"p50 {r['p50_ms']:.2f} ms · p95 {r['p95_ms']:.2f} ms · recall@{k} {r[f'recall@{k}']:.3f}")
+    print(f"💾 Resultados en {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# bm25_index.py - Índice léxico BM25 persistente (complemento de Chroma)
+#
+# Los embeddings no distinguen bien identificadores exactos (CVE-2024-3094,
+# srv-web01.corp.local, 0x80070005...). Este índice invertido sí, y se
+# combina con la búsqueda vectorial en hybrid_search.py.
+#
+# Formato en BM25_DIR:
+#   meta.json            → generación actual, IDs de chunk, longitudes, borrados
+#                          y el "delta" (postings añadidos desde la última compactación)
+#   lexicon.<gen>.json   → término → [offset, nº de postings] en postings.<gen>.bin
+#   postings.<gen>.bin   → pares uint32 (doc, tf), se abre con mmap: cargar el
+#                          índice no lee las postings, solo las páginas que se usan.
+# Las altas/bajas van al delta y a la lista de borrados; cuando crecen
+# demasiado se compacta todo en una generación nueva. meta.json se escribe
+# de forma atómica, así un lector nunca ve un estado a medias.
+import json
+import math
+import mmap
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from config import BM25_DIR
+
+K1 = 1.2
+B = 0.75
+
+# Compactar cuando el delta o los borrados superan esta fracción del índice base
+_FRACCION_COMPACTAR = 0.25
+_MIN_DELTA_COMPACTAR = 50_000
+
+_RE_TOKEN = re.compile(r"\w(?:[\w.\-:/]*\w)?")
+_RE_SEPARADORES = re.compile(r"[.\-:/_]+")
+
+
+def _sin_acentos(texto: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)
+    )
+
+
+def tokenizar(texto: str) -> list[str]:
+    """
+    Minúsculas y sin acentos. Los tokens compuestos se indexan enteros y por
+    partes: "CVE-2024-3094" → "cve-2024-3094", "cve", "2024", "3094".
+    """
+    tokens = []
+    for tok in _RE_TOKEN.findall(_sin_acentos(texto.lower())):
+        tokens.append(tok)
+        if _RE_SEPARADORES.search(tok):
+            tokens.extend(p for p in _RE_SEPARADORES.split(tok) if p)
+    return tokens
+
+
+def _escribir_json_atomico(path: Path, data):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+class BM25Index:
+    def __init__(self, directorio=BM25_DIR):
+        self.dir = Path(directorio)
+        self._lock = threading.RLock()
+        self._mmap = None
+        self._archivo = None
+        self._cargar()
+
+    # ── Carga / persistencia ──────────────────────────────────
+
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    def _cerrar_postings(self):
+        self._base = np.zeros((0, 2), dtype=np.uint32)
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Aún hay vistas numpy vivas sobre el mmap: lo cerrará el GC
+                pass
+            self._mmap = None
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def _cargar(self):
+        self._cerrar_postings()
+        meta_path = self._meta_path()
+        if meta_path.exists():
+            with meta_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._meta_mtime = meta_path.stat().st_mtime_ns
+        else:
+            meta = {"gen": 0, "ids": [], "lens": [], "borrados": [], "delta": {}}
+            self._meta_mtime = None
+
+        self.gen = meta["gen"]
+        self.ids = meta["ids"]
+        self.lens = meta["lens"]
+        self.borrados = set(meta["borrados"])
+        self.delta = meta["delta"]  # término → [doc, tf, doc, tf, ...]
+        self.lexicon = {}
+
+        lex_path = self.dir / f"lexicon.{self.gen}.json"
+        post_path = self.dir / f"postings.{self.gen}.bin"
+        if lex_path.exists():
+            with lex_path.open("r", encoding="utf-8") as f:
+                self.lexicon = json.load(f)
+        if post_path.exists() and post_path.stat().st_size > 0:
+            self._archivo = post_path.open("rb")
+            self._mmap = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            self._base = np.frombuffer(self._mmap, dtype=np.uint32).reshape(-1, 2)
+
+        self._doc_de_id = {cid: d for d, cid in enumerate(self.ids) if d not in self.borrados}
+        self._arrays = None
+
+    def _recargar_si_cambio(self):
+        """Un proceso lector ve lo que haya escrito la ingesta desde que cargó."""
+        try:
+            mtime = self._meta_path().stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            self._cargar()
+
+    def guardar(self):
+        """Persiste altas/bajas; compacta si el delta o los borrados han crecido mucho."""
+        with self._lock:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            n_delta = sum(len(v) for v in self.delta.values()) // 2
+            n_base = len(self._base)
+            umbral = max(_MIN_DELTA_COMPACTAR, _FRACCION_COMPACTAR * n_base)
+            if n_delta > umbral or len(self.borrados) > _FRACCION_COMPACTAR * max(1, len(self.ids)):
+                self._compactar()
+            else:
+                self._escribir_meta()
+
+    def _escribir_meta(self):
+        _escribir_json_atomico(self._meta_path(), {
+            "gen": self.gen,
+            "ids": self.ids,
+            "lens": self.lens,
+            "borrados": sorted(self.borrados),
+            "delta": self.delta,
+        })
+        self._meta_mtime = self._meta_path().stat().st_mtime_ns
+
+    def _compactar(self):
+        """Reescribe base + delta sin los documentos borrados en una generación nueva."""
+        vivos = [d for d in range(len(self.ids)) if d not in self.borrados]
+        remap = np.full(len(self.ids), -1, dtype=np.int64)
+        remap[vivos] = np.arange(len(vivos))
+
+        nuevo_lexicon = {}
+        trozos = []
+        offset = 0
+        for termino in sorted(set(self.lexicon) | set(self.delta)):
+            post = self._postings(termino)
+            if not len(post):
+                continue
+            docs = remap[post[:, 0]]
+            ok = docs >= 0
+            if not ok.any():
+                continue
+            nuevo = np.stack([docs[ok], post[ok, 1]], axis=1).astype(np.uint32)
+            nuevo_lexicon[termino] = [offset, len(nuevo)]
+            trozos.append(nuevo)
+            offset += len(nuevo)
+        post = None  # suelta la última vista sobre el mmap antes de cerrarlo
+
+        gen = self.gen + 1
+        post_path = self.dir / f"postings.{gen}.bin"
+        if trozos:
+            np.concatenate(trozos).tofile(str(post_path))
+        else:
+            post_path.write_bytes(b"")
+        _escribir_json_atomico(self.dir / f"lexicon.{gen}.json", nuevo_lexicon)
+
+        self.ids = [self.ids[d] for d in vivos]
+        self.lens = [self.lens[d] for d in vivos]
+        self.borrados = set()
+        self.delta = {}
+        self.gen = gen
+        self._escribir_meta()  # a partir de aquí los lectores ven la generación nueva
+
+        self._cerrar_postings()
+        self._limpiar_generaciones_viejas()
+        self._cargar()
+
+    def _limpiar_generaciones_viejas(self):
+        for path in list(self.dir.glob("postings.*.bin")) + list(self.dir.glob("lexicon.*.json")):
+            if path.name in (f"postings.{self.gen}.bin", f"lexicon.{self.gen}.json"):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # En Windows falla si otro proceso aún lo tiene mapeado; se borrará en la próxima
+                pass
+
+    def cerrar(self):
+        """Libera el mmap de las postings (antes de borrar el directorio o al salir)."""
+        with self._lock:
+            self._cerrar_postings()
+
+    @staticmethod
+    def borrar_todo(directorio=BM25_DIR):
+        """Elimina el índice completo (limpieza / re-ingesta desde cero)."""
+        d = Path(directorio)
+        if not d.exists():
+            return
+        for path in d.iterdir():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    # ── Escritura ─────────────────────────────────────────────
+
+    def agregar(self, ids: list[str], textos: list[str]):
+        """Indexa chunks. Un ID que ya existía se reemplaza (upsert)."""
+        with self._lock:
+            for cid, texto in zip(ids, textos):
+                previo = self._doc_de_id.get(cid)
+                if previo is not None:
+                    self.borrados.add(previo)
+                doc = len(self.ids)
+                tokens = tokenizar(texto)
+                self.ids.append(cid)
+                self.lens.append(len(tokens))
+                self._doc_de_id[cid] = doc
+                for termino, tf in Counter(tokens).items():
+                    self.delta.setdefault(termino, []).extend((doc, tf))
+            self._arrays = None
+
+    def borrar(self, ids: list[str]):
+        with self._lock:
+            for cid in ids:
+                doc = self._doc_de_id.pop(cid, None)
+                if doc is not None:
+                    self.borrados.add(doc)
+            self._arrays = None
+
+    # ── Consulta ──────────────────────────────────────────────
+
+    def _postings(self, termino: str) -> np.ndarray:
+        """Postings (doc, tf) de un término: base (mmap) + delta."""
+        partes = []
+        pos = self.lexicon.get(termino)
+        if pos:
+            offset, n = pos
+            partes.append(self._base[offset:offset + n])
+        extra = self.delta.get(termino)
+        if extra:
+            partes.append(np.asarray(extra, dtype=np.uint32).reshape(-1, 2))
+        if not partes:
+            return np.zeros((0, 2), dtype=np.uint32)
+        return partes[0] if len(partes) == 1 else np.concatenate(partes)
+
+    def _preparar_arrays(self):
+        if self._arrays is None:
+            lens = np.asarray(self.lens, dtype=np.float32)
+            vivo = np.ones(len(self.ids), dtype=bool)
+            if self.borrados:
+                vivo[list(self.borrados)] = False
+            n = int(vivo.sum())
+            avgdl = float(lens[vivo].mean()) if n else 0.0
+            self._arrays = (lens, vivo, n, avgdl)
+        return self._arrays
+
+    def __len__(self):
+        return len(self.ids) - len(self.borrados)
+
+    def buscar(self, texto: str, n: int = 10) -> list[tuple[str, float]]:
+        """Devuelve hasta n (chunk_id, puntuación BM25) de mayor a menor."""
+        with self._lock:
+            self._recargar_si_cambio()
+            terminos = set(tokenizar(texto))
+            if not terminos or not self.ids:
+                return []
+
+            lens, vivo, n_docs, avgdl = self._preparar_arrays()
+            if n_docs == 0 or avgdl == 0:
+                return []
+
+            puntos = np.zeros(len(self.ids), dtype=np.float32)
+            for termino in terminos:
+                post = self._postings(termino)
+                if not len(post):
+                    continue
+                docs = post[:, 0].astype(np.int64)
+                # Las postings de chunks borrados (o reemplazados) siguen ahí hasta compactar
+                vivos = vivo[docs]
+                df = int(vivos.sum())
+                if df == 0:
+                    continue
+                docs = docs[vivos]
+                tf = post[vivos, 1].astype(np.float32)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                dl = lens[docs]
+                # Cada doc aparece una sola vez por término: se puede sumar directamente
+                puntos[docs] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+
+            puntos[~vivo] = 0
+            candidatos = np.flatnonzero(puntos > 0)
+            if not len(candidatos):
+                return []
+            if len(candidatos) > n:
+                mejores = np.argpartition(-puntos[candidatos], n - 1)[:n]
+                candidatos = candidatos[mejores]
+            orden = candidatos[np.argsort(-puntos[candidatos])]
+            return [(self.ids[d], float(puntos[d])) for d in orden]
@@ -0,0 +1,229 @@
+# chunker.py - Troceado por estructura y con tamaño en tokens (CHUNKER = "estructura")
+#
+# El troceado por caracteres (loaders.chunk_stream) corta a ciegas cada
+# CHUNK_SIZE caracteres y repite CHUNK_OVERLAP en el siguiente: un 20% del
+# texto se embebe dos veces y los chunks cruzan páginas y diapositivas.
+# Aquí se corta primero por lo que marca la estructura y solo si hace falta
+# por algo más fino:
+#   página / diapositiva / hoja → nunca se mezclan en un chunk
+#   título Markdown (# ...)     → empieza un chunk nuevo
+#   párrafo (línea en blanco) → línea → frase → palabras
+# y se junta lo que cabe hasta CHUNK_TOKENS tokens del modelo de embeddings
+# (lo que de verdad llega al modelo: all-MiniLM-L6-v2 trunca a 256), sin
+# solapamiento. Cada chunk lleva en metadatos la página/diapositiva/hoja de
+# la que sale, para poder citarla.
+import multiprocessing
+import re
+from pathlib import Path
+
+from config import EMBEDDING_MODEL_NAME
+from embeddings import directorio_onnx
+
+# Marcas que ponen los loaders al principio de cada página/diapositiva: con el
+# número ya en los metadatos solo ocupan tokens
+_MARCA = re.compile(r"^\s*\[(?:Página|Diapositiva) \d+\]\n")
+_PARRAFOS = re.compile(r"\n[ \t]*\n")
+_LINEAS = re.compile(r"\n")
+_FRASES = re.compile(r"(?<=[.!?…;:])\s+")
+_TITULO = re.compile(r"^#{1,6}\s")
+
+# [CLS] y [SEP] que añade el modelo a cada texto
+_TOKENS_ESPECIALES = 2
+# Texto sin ninguna línea en blanco (un .docx, un .txt sin párrafos): a partir
+# de aquí se suelta hasta el último salto de línea para no acumular el archivo
+_MAX_PENDIENTE = 64 * 1024
+
+_contador = None
+_tipo_contador = None
+
+
+def _ruta_tokenizer() -> Path | None:
+    """tokenizer.json del modelo sin tocar la red (None si no está en disco)."""
+    local = Path(EMBEDDING_MODEL_NAME)
+    if (local / "tokenizer.json").exists():
+        return local / "tokenizer.json"
+    if (directorio_onnx() / "tokenizer.json").exists():
+        # El que dejó exportar_onnx.py
+        return directorio_onnx() / "tokenizer.json"
+    try:
+        # El que descargó sentence_transformers la primera vez (caché de HF)
+        from huggingface_hub import hf_hub_download
+
+        nombre = EMBEDDING_MODEL_NAME if "/" in EMBEDDING_MODEL_NAME else f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+        return Path(hf_hub_download(nombre, "tokenizer.json", local_files_only=True))
+    except Exception:
+        return None
+
+
+def _cargar_contador():
+    """Tokenizer del modelo de embeddings sin cargar el modelo (ni torch) ni ir a internet."""
+    ruta = _ruta_tokenizer()
+    if ruta is not None:
+        try:
+            from tokenizers import Tokenizer
+
+            tok = Tokenizer.from_file(str(ruta))
+            tok.no_truncation()
+            tok.no_padding()
+            return "tokenizer", lambda texto: len(tok.encode(texto, add_special_tokens=False).ids)
+        except Exception as e:
+            motivo = f"no se pudo cargar {ruta} ({e})"
+    else:
+        motivo = f"no hay tokenizer.json de {EMBEDDING_MODEL_NAME} en disco"
+    if multiprocessing.parent_process() is None:
+        # Solo el proceso principal: los del pool dirían lo mismo una vez cada uno
+        print(f"⚠ Chunker: {motivo}; se estiman ~4 caracteres por token.")
+    # La misma aproximación que embed_batcher, redondeando hacia arriba para
+    # que la suma de las partes no se quede corta
+    return "aprox", lambda texto: max(1, (len(texto) + 3) // 4)
+
+
+def contador_tokens():
+    """Función texto → nº de tokens (una por proceso; los del pool cargan la suya)."""
+    global _contador, _tipo_contador
+    if _contador is None:
+        _tipo_contador, _contador = _cargar_contador()
+    return _contador
+
+
+def tipo_contador() -> str:
+    """Cómo se cuentan los tokens ("tokenizer" o "aprox"): cambia dónde se corta."""
+    contador_tokens()
+    return _tipo_contador
+
+
+def ubicacion(meta: dict) -> str:
+    """Dónde está el fragmento dentro de su archivo, para citarlo."""
+    if meta.get("page") is not None:
+        return f"página {meta['page']}"
+    if meta.get("slide") is not None:
+        return f"diapositiva {meta['slide']}"
+    if meta.get("row_start") is not None:
+        return f"hoja {meta['sheet']}, filas {meta['row_start']}-{meta['row_end']}"
+    if meta.get("sheet") is not None:
+        return f"hoja {meta['sheet']}"
+    return f"chunk {meta.get('chunk_index', '?')}"
+
+
+def _por_palabras(texto: str, n: int, limite: int, contar):
+    """Último recurso (una "frase" sin puntos más larga que el límite)."""
+    palabras = texto.split()
+    i = 0
+    while i < len(palabras):
+        cuantas = max(1, int(len(palabras) * limite / max(n, 1)))
+        while True:
+            trozo = " ".join(palabras[i:i + cuantas])
+            nt = contar(trozo)
+            if nt <= limite or cuantas == 1:
+                break
+            cuantas = max(1, int(cuantas * 0.8))
+        if nt > limite:
+            # Una sola "palabra" gigante (base64, una tabla sin espacios...): por caracteres
+            paso = max(1, len(trozo) * limite // nt)
+            for j in range(0, len(trozo), paso):
+                yield trozo[j:j + paso], contar(trozo[j:j + paso])
+        else:
+            yield trozo, nt
+        i += cuantas
+
+
+def _unidades(texto: str, limite: int, contar, n: int | None = None):
+    """Parte un párrafo en trozos de <= limite tokens: líneas, después frases, después palabras."""
+    n = contar(texto) if n is None else n
+    if n <= limite:
+        yield texto, n
+        return
+    for sep, patron in (("\n", _LINEAS), (" ", _FRASES)):
+        partes = [p.strip() for p in patron.split(texto) if p.strip()]
+        if len(partes) > 1:
+            yield from _juntar(partes, sep, limite, contar)
+            return
+    yield from _por_palabras(texto, n, limite, contar)
+
+
+def _juntar(partes: list[str], sep: str, limite: int, contar):
+    """Junta partes consecutivas mientras quepan (las que no caben solas se parten)."""
+    actual, n_actual = [], 0
+    for parte in partes:
+        for texto, n in _unidades(parte, limite, contar):
+            if actual and n_actual + n > limite:
+                yield sep.join(actual), n_actual
+                actual, n_actual = [], 0
+            actual.append(texto)
+            n_actual += n
+    if actual:
+        yield sep.join(actual), n_actual
+
+
+def _parrafos(segmentos):
+    """
+    Genera (párrafo, metadatos) a partir del flujo de segmentos de los
+    loaders, y None cada vez que empieza una página/diapositiva/hoja nueva.
+    Un párrafo puede venir repartido entre varios segmentos (bloques de un
+    .txt): solo se suelta cuando llega la línea en blanco que lo cierra.
+    """
+    pendiente = ""
+    meta_actual = None
+    for texto, meta in segmentos:
+        if meta != meta_actual:
+            if pendiente.strip():
+                yield pendiente.strip(), meta_actual
+            yield None
+            pendiente = ""
+            meta_actual = meta
+            texto = _MARCA.sub("", texto.lstrip("\n"), count=1)
+        pendiente += texto
+        *completos, pendiente = _PARRAFOS.split(pendiente)
+        for p in completos:
+            if p.strip():
+                yield p.strip(), meta_actual
+        if len(pendiente) > _MAX_PENDIENTE:
+            corte = pendiente.rfind("\n") + 1 or len(pendiente)
+            yield pendiente[:corte].strip(), meta_actual
+            pendiente = pendiente[corte:]
+    if pendiente.strip():
+        yield pendiente.strip(), meta_actual
+
+
+def chunk_estructura(segmentos, max_tokens: int, contar=None):
+    """
+    Genera (chunk, metadatos) respetando la estructura (ver cabecera del
+    módulo). Los metadatos son los del segmento (page/slide/sheet).
+    """
+    contar = contar or contador_tokens()
+    limite = max(8, max_tokens - _TOKENS_ESPECIALES)
+    actual = []  # [(texto, tokens)] del chunk en construcción
+    meta_actual = {}
+
+    def soltar():
+        return "\n\n".join(t for t, _ in actual), dict(meta_actual)
+
+    for item in _parrafos(segmentos):
+        if item is None:
+            # Página/diapositiva/hoja nueva: lo anterior se cierra aquí
+            if actual:
+                yield soltar()
+            actual = []
+            continue
+
+        parrafo, meta = item
+        meta_actual = meta
+        solo_titulos = all(_TITULO.match(t) for t, _ in actual)
+        if _TITULO.match(parrafo) and not solo_titulos:
+            yield soltar()
+            actual = []
+            solo_titulos = True
+
+        # Detrás de un título se deja sitio para él: no se queda solo en un chunk
+        disponible = limite
+        if actual and solo_titulos:
+            disponible = max(8, limite - sum(n for _, n in actual))
+
+        for texto, n in _unidades(parrafo, disponible, contar):
+            if actual and sum(t for _, t in actual) + n > limite:
+                yield soltar()
+                actual = []
+            actual.append((texto, n))
+
+    if actual:
+        yield soltar()
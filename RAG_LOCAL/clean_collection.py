@@ -1,20 +1,11 @@
 # clean_collection.py
-import chromadb
-from config import CHROMA_DIR
+import runtime
+from manifest import borrar_manifest
 
 def main():
-    print("🔗 Conectando a Chroma...")
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-
-    print("🧹 Borrando colección 'docs'...")
-    try:
-        client.delete_collection("docs")
-        print("✅ Colección eliminada.")
-    except Exception as e:
-        print(f"⚠ No se pudo eliminar (posiblemente ya no existe): {e}")
-
-    print("📁 Creando colección vacía...")
-    client.get_or_create_collection("docs")
+    print("🧹 Eliminando colección 'docs' (sus shards, si los hay, y su índice BM25) y creándola vacía...")
+    runtime.reset_collection()
+    borrar_manifest()
     print("✨ Colección 'docs' creada y vacía.")
 
 if __name__ == "__main__":
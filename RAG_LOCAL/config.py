@@ -1,27 +1,172 @@
 # config.py
+import os
 from pathlib import Path
 
+# Los valores con os.environ.get(...) se pueden cambiar con variables de
+# entorno sin tocar este archivo (benchmark.py las usa para trabajar en una
+# carpeta temporal y comparar parámetros).
+
 # Ruta base del proyecto (D:\RAG_LOCAL)
 BASE_DIR = Path(__file__).resolve().parent
 
 # Carpeta donde pondrás tus documentos
-DOCS_DIR = BASE_DIR / "docs"
+DOCS_DIR = Path(os.environ.get("RAG_DOCS_DIR", BASE_DIR / "docs"))
 
 # Carpeta donde Chroma guardará la base de datos vectorial
-CHROMA_DIR = BASE_DIR / "chroma_db"
+CHROMA_DIR = Path(os.environ.get("RAG_CHROMA_DIR", BASE_DIR / "chroma_db"))
+
+# Cachés en disco (embeddings y respuestas)
+CACHE_DIR = Path(os.environ.get("RAG_CACHE_DIR", BASE_DIR / "cache"))
+
+# Registro de archivos ya ingestados (para la ingesta incremental)
+MANIFEST_PATH = CHROMA_DIR / "ingest_manifest.json"
 
 # Modelo de embeddings
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL_NAME = os.environ.get("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Motor con el que se ejecuta (ver embeddings.py): "torch" (sentence-transformers),
+# "onnx" (ONNX Runtime, sin importar torch: arranca antes y en CPU suele ir más
+# rápido) u "onnx-int8" (pesos int8: más rápido aún; sus vectores cuentan como
+# otro modelo → ingesta completa). Los ONNX se generan una vez con:
+# python exportar_onnx.py
+EMBEDDING_BACKEND = os.environ.get("RAG_EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = CACHE_DIR / "onnx"
+EMBEDDING_THREADS = 0        # hilos de ONNX Runtime (0 = los que elija él)
+EMBEDDING_PARIDAD_MIN = {"onnx": 0.9999, "onnx-int8": 0.97}  # coseno mínimo frente a torch
 
 # URL de Ollama (por defecto)
-OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_URL = os.environ.get("RAG_OLLAMA_URL", "http://localhost:11434/api/chat")
 
 # Modelos LLM que usarás en Ollama
 MODEL_MAIN = "phi4:14b-q4_K_M"   # modelo fuerte (phi4 optimizado)
 MODEL_CODE = "mistral"           # programación
 MODEL_BALANCED = "llama3.1:8b"   # equilibrado / general
 
+# Conexión con Ollama (ver ollama_client.py)
+OLLAMA_KEEP_ALIVE = "30m"        # tiempo que Ollama mantiene el modelo cargado tras usarlo
+OLLAMA_KEEP_ALIVE_POR_MODELO = {
+    MODEL_MAIN: "30m",
+    MODEL_CODE: "15m",
+    MODEL_BALANCED: "60m",
+}
+OLLAMA_RETRIES = 3               # reintentos si Ollama no responde / devuelve 502-504
+OLLAMA_RETRY_BACKOFF = 0.5       # espera entre reintentos: 0.5 s, 1 s, 2 s...
+OLLAMA_POOL_SIZE = 4             # conexiones HTTP reutilizables
+
+# Precarga de modelos al arrancar la consola / modo chat (en segundo plano).
+# Por defecto el que más elige model_router.elegir_modelo (preguntas cortas/generales).
+OLLAMA_WARMUP = True
+OLLAMA_WARMUP_MODELS = [MODEL_BALANCED]
+# Igual con el modelo de embeddings y Chroma: se cargan en un hilo mientras
+# el usuario elige opción o escribe la primera pregunta.
+EMBEDDER_WARMUP = True
+
 # Parámetros del RAG
-TOP_K = 4              # cuántos fragmentos relevantes traer de Chroma
-CHUNK_SIZE = 1000      # caracteres por chunk de texto
-CHUNK_OVERLAP = 200    # solapamiento entre chunks (en caracteres)
\ No newline at end of file
+TOP_K = int(os.environ.get("RAG_TOP_K", 4))                   # cuántos fragmentos relevantes traer de Chroma
+CHUNK_SIZE = int(os.environ.get("RAG_CHUNK_SIZE", 1000))      # caracteres por chunk de texto
+CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", 200)) # solapamiento entre chunks (en caracteres)
+# Troceado: "estructura" → por página/diapositiva/título/párrafo/frase hasta
+# CHUNK_TOKENS tokens del modelo, sin solapamiento (ver chunker.py);
+# "caracteres" → el de siempre, con CHUNK_SIZE y CHUNK_OVERLAP.
+CHUNKER = os.environ.get("RAG_CHUNKER", "estructura")
+CHUNK_TOKENS = int(os.environ.get("RAG_CHUNK_TOKENS", 256))  # all-MiniLM-L6-v2 no ve más de 256
+
+# Ingesta en paralelo
+INGEST_WORKERS = 0     # procesos que extraen/trocean archivos (0 = núcleos - 1)
+INGEST_QUEUE_SIZE = 8  # archivos ya troceados esperando embeddings (limita la RAM)
+# Archivos grandes: se leen por partes (página/diapositiva/bloque de filas) en el
+# proceso principal y van entrando en los lotes de embeddings según se trocean,
+# así la memoria depende del tamaño del lote y no del archivo.
+INGEST_STREAM_MB = 20          # a partir de este tamaño
+INGEST_STREAM_CHUNKS = 256     # chunks por parte
+XLSX_FILAS_POR_BLOQUE = 200    # filas de Excel por segmento
+# Excel: "filas" → chunks de filas enteras con la cabecera repetida y metadatos
+# sheet/row_start/row_end; "texto" → se trocea por caracteres como los demás.
+XLSX_MODO = "filas"
+MAX_FILE_MB = 0                # 0 = sin límite (antes se omitía todo lo > 200 MB)
+
+# Chunks duplicados y casi duplicados (ver dedup.py): de cada grupo se embebe y
+# se guarda uno solo, con todas sus fuentes en los metadatos
+DEDUP_ENABLED = os.environ.get("RAG_DEDUP", "1") != "0"
+DEDUP_PATH = CHROMA_DIR / "dedup.sqlite"
+DEDUP_UMBRAL = 0.8           # similitud (Jaccard de tríos de palabras) para considerarlos casi iguales
+DEDUP_MIN_PALABRAS = 20      # chunks más cortos: solo duplicados exactos
+DEDUP_CONSULTA = True        # en cada búsqueda se juntan también los resultados casi iguales
+DEDUP_CONSULTA_FACTOR = 2    # candidatos pedidos = k × esto, para que queden k distintos
+
+# Almacén de vectores de la colección: "chroma" (el de siempre) o "int8"
+# (ver vector_store.py: int8 + copia float16 en archivos mmap con índice IVF,
+# ~4 veces menos disco y RAM). Para pasar de uno a otro sin re-ingestar:
+# python migrar_vectores.py
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "chroma")
+VECTOR_STORE_DIR = CHROMA_DIR / "int8"
+VECTOR_RESCORE_DTYPE = "float16"  # copia con la que se recalcula la lista corta ("float32" = exacta)
+VECTOR_RESCORE_FACTOR = 4         # lista corta = resultados pedidos × esto
+VECTOR_IVF_MIN = 20000            # por debajo se recorren todos los vectores (sin índice)
+VECTOR_IVF_NPROBE = 24            # listas IVF (de √N) que se miran por consulta
+VECTOR_FILTRO_EXACTO = 20000      # con filtro, si lo cumplen menos chunks se recorren todos ellos
+
+# Reparto del corpus en varias colecciones ("shards", ver shards.py):
+#   None      → una sola colección 'docs' (como siempre)
+#   "carpeta" → una por carpeta de primer nivel de docs/ (docs__seguridad...);
+#               [carpeta:...] solo consulta los shards que la tienen y cada
+#               carpeta se re-ingesta por separado (python re_ingest.py --shard seguridad)
+#   "hash"    → SHARDS colecciones repartidas por el ID del chunk
+# Las preguntas sin filtro de carpeta consultan todos los shards a la vez.
+# Cambiarlo obliga a re-ingestar todo.
+SHARDING = os.environ.get("RAG_SHARDING") or None
+SHARDS = 4                        # colecciones con SHARDING = "hash"
+SHARDS_PATH = CHROMA_DIR / "shards.json"
+SHARD_WORKERS = 0                 # hilos para consultar los shards a la vez (0 = hasta 8)
+
+# Lotes de embeddings (ver embed_batcher.py)
+EMBED_MAX_BATCH = 64         # máximo de chunks por lote
+EMBED_TOKEN_BUDGET = 8192    # chunks × tokens del más largo por lote (baja si falta RAM)
+EMBED_BUFFER_CHUNKS = 512    # chunks acumulados (de varios archivos) antes de ordenar y cortar
+
+# Caché de embeddings en disco (ver embed_cache.py)
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+EMBED_CACHE_MAX_MB = 512     # al pasarse se expulsan las entradas menos usadas (LRU)
+
+# Caché semántica de respuestas (ver answer_cache.py)
+ANSWER_CACHE_ENABLED = os.environ.get("RAG_ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_PATH = CACHE_DIR / "answers.sqlite"
+ANSWER_CACHE_THRESHOLD = 0.95   # similitud coseno mínima entre preguntas
+ANSWER_CACHE_TTL_H = 24 * 7     # horas que vale una respuesta
+ANSWER_CACHE_MAX_ENTRIES = 2000 # al pasarse se borran las menos usadas (LRU)
+
+# Búsqueda híbrida: BM25 (palabras exactas) + vectores, fusionados con RRF
+HYBRID_SEARCH = True
+BM25_DIR = CHROMA_DIR / "bm25"    # índice léxico que construye ingest.py
+HYBRID_CANDIDATES = 20            # candidatos que aporta cada buscador antes de fusionar
+HYBRID_FILTRO_FACTOR = 5          # con filtros, BM25 trae × candidatos y se quedan los que los cumplen
+RRF_K = 60                        # constante de Reciprocal Rank Fusion
+SHOW_RETRIEVAL_TIMINGS = True     # imprime el tiempo de cada buscador en cada consulta
+
+# Reranking con cross-encoder (ver reranker.py)
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # multilingüe, pequeño
+RERANK_CANDIDATES = 20      # candidatos que se puntúan para quedarse con TOP_K
+RERANK_BATCH_SIZE = 16      # pares (pregunta, fragmento) por lote
+RERANK_BUDGET_MS = 300      # si se pasa, se usa el orden de la recuperación
+
+# Servidor HTTP local (ver rag_server.py)
+SERVER_HOST = "127.0.0.1"   # solo esta máquina; "0.0.0.0" para la red local
+SERVER_PORT = 8765
+SERVER_THREADS = 4          # hilos para embeddings, Chroma e ingesta
+SERVER_MAX_BODY_KB = 256
+SERVER_READ_TIMEOUT = 30    # s por lectura de la petición: un cliente que no envía nada no ocupa la conexión
+# Peticiones simultáneas a Ollama por modelo (las demás esperan su turno)
+OLLAMA_CONCURRENCIA_POR_MODELO = {MODEL_MAIN: 1, MODEL_CODE: 2, MODEL_BALANCED: 2}
+OLLAMA_CONCURRENCIA_DEFECTO = 1
+
+# Micro-lotes de consultas concurrentes (ver query_batcher.py)
+QUERY_BATCHING = True
+QUERY_BATCH_WAIT_MS = 5     # cuánto se esperan más preguntas (solo si hay concurrencia)
+QUERY_BATCH_MAX = 32        # preguntas como máximo por tanda
+
+# Trazas de tiempos por pregunta (ver tracing.py)
+TRACE_LOG_ENABLED = True
+TRACE_LOG_PATH = Path(os.environ.get("RAG_TRACE_LOG", BASE_DIR / "logs" / "traces.jsonl"))
+TRACE_LOG_MAX_MB = 20       # al pasarse se renombra a .1 y se empieza otro
+TRACE_STATS_ULTIMAS = 500   # preguntas recientes que resume "python tracing.py"
\ No newline at end of file
@@ -1,13 +1,21 @@
 # count_collection.py
-import chromadb
-from config import CHROMA_DIR
+import runtime
 
 def main():
     print("🔗 Conectando a Chroma...")
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    col = client.get_or_create_collection("docs")
+    col = runtime.get_collection()
 
-    print(f"📊 Total de documentos/chunks en la colección: {col.count()}")
+    # Con SHARDING, además, los chunks de cada shard
+    por_shard = col.contar() if hasattr(col, "contar") else None
+    total = sum(por_shard.values()) if por_shard is not None else col.count()
+    print(f"📊 Total de documentos/chunks en la colección: {total}")
+    for shard, n in (por_shard or {}).items():
+        print(f"   · {shard}: {n}")
+
+    # Tiempos de las últimas preguntas (ver tracing.py)
+    import tracing
+    print()
+    print(tracing.formatear_resumen(tracing.resumen(tracing.leer())))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,460 @@
+# dedup.py - Chunks duplicados y casi duplicados (DEDUP_ENABLED en config.py)
+#
+# En docs/ suele haber varias versiones de la misma política o presentación:
+# cada copia se embebía y se guardaba, y el top-k acababa siendo k veces el
+# mismo párrafo. En la ingesta, antes de embeber, cada chunk se compara con
+# lo ya guardado:
+#   - duplicado exacto: mismo texto normalizado (hash)
+#   - casi duplicado: similitud de Jaccard >= DEDUP_UMBRAL entre sus tríos
+#     de palabras, estimada con MinHash (solo chunks de DEDUP_MIN_PALABRAS
+#     palabras o más: en textos cortos una palabra distinta ya cambia el sentido)
+# De cada grupo solo va a Chroma un chunk, el canónico, con su propio ID; en
+# sus metadatos lleva "copias", "fuentes" (archivos donde aparece, uno por
+# línea) y las marcas de carpeta de todas las copias, para que [carpeta:...]
+# lo encuentre desde cualquiera de ellas. Entre casi duplicados manda la
+# versión más reciente (date_ord). Los filtros [type:] y [fecha] usan los
+# metadatos del canónico.
+#
+# La tabla (DEDUP_PATH, SQLite) guarda cada chunk ingestado → su canónico. El
+# manifest sigue listando todos los IDs de cada archivo: al borrar o cambiar
+# un archivo que tenía el canónico de otras copias, una de ellas ocupa su
+# sitio (se copia su registro de Chroma con el vector, sin volver a embeber).
+# Para encontrar candidatos sin comparar con todo, la firma MinHash (64
+# valores) se parte en 16 bandas de 4 (LSH): dos textos con similitud 0.8
+# coinciden en alguna banda entera con probabilidad > 0.999, dos textos sin
+# relación casi nunca. Los candidatos se confirman comparando la firma entera.
+# (SimHash no sirve aquí: en chunks de 100-250 palabras cambiar una sola
+# palabra ya mueve ~10 de sus 64 bits.)
+#
+# En la consulta, colapsar() junta los resultados iguales o casi iguales que
+# queden (p. ej. de antes de activar esto) para que los k huecos sean distintos.
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from config import DEDUP_PATH, DEDUP_UMBRAL, DEDUP_MIN_PALABRAS
+from embed_cache import normalizar_texto
+from manifest import clave_carpeta
+
+_PALABRAS = re.compile(r"\w+")
+_PREFIJO_CARPETA = clave_carpeta("")
+
+# MinHash: 64 permutaciones (a·x + b) mod p, fijas para que las firmas
+# guardadas sigan valiendo entre ejecuciones
+_PERMUTACIONES = 64
+_FILAS_BANDA = 4
+_PRIMO = (1 << 61) - 1
+_A, _B = np.random.default_rng(20240917).integers(1, 1 << 32, size=(2, _PERMUTACIONES), dtype=np.uint64)
+
+# Fuentes que se guardan en los metadatos del canónico ("copias" cuenta todas)
+_MAX_FUENTES = 50
+
+
+def hash_texto(texto: str) -> str:
+    """Clave de duplicado exacto (mismo texto salvo espacios y forma Unicode)."""
+    return hashlib.sha1(normalizar_texto(texto).encode("utf-8")).hexdigest()
+
+
+def firma(texto: str, min_palabras: int = DEDUP_MIN_PALABRAS) -> np.ndarray | None:
+    """
+    Firma MinHash (64 × uint32) de los tríos de palabras del texto, o None
+    si tiene menos de min_palabras.
+    """
+    palabras = _PALABRAS.findall(normalizar_texto(texto).lower())
+    if len(palabras) < max(1, min_palabras):
+        return None
+    tejas = {" ".join(palabras[i:i + 3]) for i in range(max(1, len(palabras) - 2))}
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=4).digest() for t in tejas),
+        dtype="<u4",
+    ).astype(np.uint64)
+    # a, x < 2^32: a·x + b no desborda 64 bits
+    return ((np.outer(hashes, _A) + _B) % _PRIMO).min(axis=0).astype("<u4")
+
+
+def similitud(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard estimada: fracción de posiciones iguales de las dos firmas."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def _leer_firma(blob: bytes | None) -> np.ndarray | None:
+    return None if blob is None else np.frombuffer(blob, dtype="<u4")
+
+
+def _fecha(meta: dict) -> int:
+    return meta.get("date_ord") or 0
+
+
+def _unir_fuentes(*listas: str) -> list[str]:
+    return list(dict.fromkeys(f for lista in listas for f in lista.split("\n") if f))
+
+
+class Deduplicador:
+    """
+    Uso desde ingest.py (se puede llamar desde varios hilos):
+        ids, textos, metas, ops = dedup.clasificar(ids, textos, metas)  # antes de embeber
+        dedup.aplicar(collection, bm25, ops)         # antes de escribir esos lotes
+        datos = dedup.preparar_lote(datos)           # justo antes del upsert
+        dedup.aplicar(collection, bm25, dedup.liberar(ids))  # chunks que ya no existen
+        dedup.actualizar_metadatos(collection)       # al terminar: "copias"/"fuentes"
+    """
+
+    def __init__(self, path=DEDUP_PATH, umbral: float = DEDUP_UMBRAL,
+                 min_palabras: int = DEDUP_MIN_PALABRAS):
+        self.path = Path(path)
+        self.umbral = umbral
+        self.min_palabras = min_palabras
+        self.exactos = 0
+        self.casi = 0
+        self._lock = threading.RLock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id       TEXT PRIMARY KEY,
+                canonico TEXT NOT NULL,
+                hash     TEXT NOT NULL,
+                firma    BLOB,
+                meta     TEXT NOT NULL,
+                sucio    INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_canonico ON chunks(canonico);
+            CREATE INDEX IF NOT EXISTS idx_hash ON chunks(hash);
+            CREATE INDEX IF NOT EXISTS idx_sucio ON chunks(sucio) WHERE sucio = 1;
+            CREATE TABLE IF NOT EXISTS bandas (
+                banda INTEGER NOT NULL,
+                valor INTEGER NOT NULL,
+                id    TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_banda ON bandas(banda, valor);
+            CREATE INDEX IF NOT EXISTS idx_bandas_id ON bandas(id);
+            """
+        )
+
+    # ── Tabla ─────────────────────────────────────────────────
+
+    @staticmethod
+    def _bandas(f: np.ndarray) -> list[tuple[int, int]]:
+        """(nº de banda, hash de sus _FILAS_BANDA valores) para el índice LSH."""
+        return [
+            (i, int.from_bytes(
+                hashlib.blake2b(f[j:j + _FILAS_BANDA].tobytes(), digest_size=8).digest(), "little", signed=True
+            ))
+            for i, j in enumerate(range(0, _PERMUTACIONES, _FILAS_BANDA))
+        ]
+
+    def _poner_bandas(self, cid: str, f: np.ndarray | None):
+        if f is not None:
+            self._db.executemany(
+                "INSERT INTO bandas (banda, valor, id) VALUES (?, ?, ?)",
+                [(b, v, cid) for b, v in self._bandas(f)],
+            )
+
+    def _quitar_bandas(self, cid: str):
+        self._db.execute("DELETE FROM bandas WHERE id = ?", (cid,))
+
+    def _fila(self, cid: str) -> dict | None:
+        fila = self._db.execute(
+            "SELECT canonico, firma, meta FROM chunks WHERE id = ?", (cid,)
+        ).fetchone()
+        if fila is None:
+            return None
+        return {"canonico": fila[0], "firma": _leer_firma(fila[1]), "meta": json.loads(fila[2])}
+
+    def _buscar(self, h: str, f: np.ndarray | None, propio: str) -> tuple[str | None, bool]:
+        """(canónico del grupo al que pertenece el texto, ¿es copia exacta?)."""
+        fila = self._db.execute("SELECT canonico FROM chunks WHERE hash = ? LIMIT 1", (h,)).fetchone()
+        if fila is not None:
+            return fila[0], True
+        if f is None:
+            return None, False
+        bandas = self._bandas(f)
+        condicion = " OR ".join(["(b.banda = ? AND b.valor = ?)"] * len(bandas))
+        candidatos = self._db.execute(
+            f"SELECT DISTINCT c.id, c.firma FROM bandas b JOIN chunks c ON c.id = b.id WHERE {condicion}",
+            [x for banda in bandas for x in banda],
+        ).fetchall()
+        mejor = max(
+            ((similitud(f, _leer_firma(fc)), cid == propio, cid) for cid, fc in candidatos if fc is not None),
+            default=None,
+        )
+        if mejor is not None and mejor[0] >= self.umbral:
+            return mejor[2], False
+        return None, False
+
+    def _repuntar(self, de: str, a: str):
+        """Todo el grupo de `de` pasa a tener `a` como canónico."""
+        self._db.execute("UPDATE chunks SET canonico = ? WHERE canonico = ?", (a, de))
+        self._db.execute("UPDATE chunks SET sucio = 1 WHERE id = ?", (a,))
+
+    def _promover(self, viejo: str, ops: list):
+        """
+        El canónico `viejo` deja de existir con su texto actual: si tenía
+        copias, la más reciente ocupa su sitio con el mismo registro de Chroma.
+        """
+        self._quitar_bandas(viejo)
+        copias = self._db.execute(
+            "SELECT id, firma, meta FROM chunks WHERE canonico = ? AND id != ?", (viejo, viejo)
+        ).fetchall()
+        if not copias:
+            ops.append(("borrar", [viejo]))
+            return
+        nuevo, f, _ = max(copias, key=lambda c: _fecha(json.loads(c[2])))
+        self._repuntar(viejo, nuevo)
+        self._poner_bandas(nuevo, _leer_firma(f))
+        ops.append(("promover", viejo, nuevo))
+
+    def _metadatos(self, cid: str) -> dict:
+        """Metadatos del canónico con los de su grupo (copias, fuentes, carpetas)."""
+        fila = self._fila(cid)
+        meta = dict(fila["meta"])
+        grupo = [
+            json.loads(m)
+            for (m,) in self._db.execute("SELECT meta FROM chunks WHERE canonico = ?", (cid,))
+        ]
+        grupo.sort(key=_fecha, reverse=True)
+        for m in grupo:
+            for clave, valor in m.items():
+                if clave.startswith(_PREFIJO_CARPETA) and valor:
+                    meta[clave] = True
+        fuentes = list(dict.fromkeys(m["source"] for m in grupo if m.get("source")))
+        meta["copias"] = max(1, len(grupo))
+        meta["fuentes"] = "\n".join(fuentes[:_MAX_FUENTES])
+        return meta
+
+    # ── Ingesta ───────────────────────────────────────────────
+
+    def clasificar(self, ids: list[str], textos: list[str], metas: list[dict]):
+        """
+        Decide, antes de embeber, qué chunks son copia de uno ya guardado.
+        Devuelve (ids, textos, metas) de los que hay que embeber y guardar
+        (los canónicos) y las operaciones para aplicar() antes de esos lotes.
+        """
+        salida_ids, salida_textos, salida_metas, ops = [], [], [], []
+        with self._lock:
+            for cid, texto, meta in zip(ids, textos, metas):
+                h = hash_texto(texto)
+                f = firma(texto, self.min_palabras)
+                previo = self._fila(cid)
+                encontrado, exacto = self._buscar(h, f, cid)
+
+                destino = cid
+                absorbe = None
+                if encontrado is not None and encontrado != cid:
+                    if exacto:
+                        destino = encontrado
+                        self.exactos += 1
+                    else:
+                        self.casi += 1
+                        if _fecha(meta) > _fecha(self._fila(encontrado)["meta"]):
+                            # Versión más reciente: pasa a ser ella la canónica
+                            absorbe = encontrado
+                        else:
+                            destino = encontrado
+
+                if previo is not None and previo["canonico"] == cid:
+                    if destino != cid:
+                        # Era canónico y ahora es copia de otro: su grupo se va con él
+                        self._repuntar(cid, destino)
+                        self._quitar_bandas(cid)
+                        ops.append(("borrar", [cid]))
+                    elif encontrado != cid:
+                        # Su texto ya no es el de antes: las copias se quedan con el registro viejo
+                        self._promover(cid, ops)
+                elif previo is not None:
+                    self._db.execute("UPDATE chunks SET sucio = 1 WHERE id = ?", (previo["canonico"],))
+                elif destino != cid:
+                    # Puede estar en Chroma de antes de activar la deduplicación
+                    ops.append(("borrar", [cid]))
+
+                if absorbe is not None:
+                    self._repuntar(absorbe, cid)
+                    self._quitar_bandas(absorbe)
+                    ops.append(("borrar", [absorbe]))
+
+                self._db.execute(
+                    "INSERT OR REPLACE INTO chunks (id, canonico, hash, firma, meta, sucio) "
+                    "VALUES (?, ?, ?, ?, ?, 1)",
+                    (cid, destino, h, None if f is None else f.tobytes(), json.dumps(meta, ensure_ascii=False)),
+                )
+                self._quitar_bandas(cid)
+                if destino == cid:
+                    self._poner_bandas(cid, f)
+                    salida_ids.append(cid)
+                    salida_textos.append(texto)
+                    salida_metas.append(meta)
+                else:
+                    self._db.execute("UPDATE chunks SET sucio = 1 WHERE id = ?", (destino,))
+            self._db.commit()
+        return salida_ids, salida_textos, salida_metas, ops
+
+    def liberar(self, ids: list[str]) -> list:
+        """Quita chunks que ya no existen. Devuelve las operaciones para aplicar()."""
+        ops, desconocidos = [], []
+        with self._lock:
+            for cid in ids:
+                previo = self._fila(cid)
+                self._db.execute("DELETE FROM chunks WHERE id = ?", (cid,))
+                if previo is None:
+                    desconocidos.append(cid)
+                elif previo["canonico"] == cid:
+                    self._promover(cid, ops)
+                else:
+                    self._db.execute("UPDATE chunks SET sucio = 1 WHERE id = ?", (previo["canonico"],))
+            self._db.commit()
+        if desconocidos:
+            ops.insert(0, ("borrar", desconocidos))
+        return ops
+
+    def preparar_lote(self, datos: dict) -> dict:
+        """
+        Lote embebido listo para el upsert: sin los chunks que entre tanto han
+        pasado a ser copia de otro y con los metadatos de su grupo.
+        """
+        with self._lock:
+            quedan, metas = [], []
+            for i, cid in enumerate(datos["ids"]):
+                fila = self._fila(cid)
+                if fila is None or fila["canonico"] == cid:
+                    quedan.append(i)
+                    metas.append(self._metadatos(cid) if fila else datos["metadatas"][i])
+            self._db.executemany(
+                "UPDATE chunks SET sucio = 0 WHERE id = ?", [(datos["ids"][i],) for i in quedan]
+            )
+            self._db.commit()
+        return {
+            **datos,
+            "ids": [datos["ids"][i] for i in quedan],
+            "documents": [datos["documents"][i] for i in quedan],
+            "embeddings": [datos["embeddings"][i] for i in quedan],
+            "metadatas": metas,
+        }
+
+    def aplicar(self, collection, bm25, ops: list):
+        """Ejecuta en Chroma (y en BM25) las operaciones de clasificar()/liberar(), en orden."""
+        borrar = []
+
+        def vaciar():
+            for start in range(0, len(borrar), 500):
+                collection.delete(ids=borrar[start:start + 500])
+            if bm25 is not None and borrar:
+                bm25.borrar(borrar)
+            borrar.clear()
+
+        for op in ops:
+            if op[0] == "borrar":
+                borrar.extend(op[1])
+                continue
+            vaciar()
+            _, viejo, nuevo = op
+            previo = collection.get(ids=[viejo], include=["documents", "embeddings", "metadatas"])
+            with self._lock:
+                meta = self._metadatos(nuevo) if self._fila(nuevo) else None
+            if not previo["ids"] or meta is None:
+                print(f"   ⚠ Duplicados: no se pudo pasar {viejo} a {nuevo}; re-ingesta su archivo si falta.")
+                borrar.append(viejo)
+                continue
+            collection.upsert(
+                ids=[nuevo],
+                documents=previo["documents"],
+                embeddings=previo["embeddings"],
+                metadatas=[meta],
+            )
+            collection.delete(ids=[viejo])
+            if bm25 is not None:
+                bm25.borrar([viejo])
+                bm25.agregar([nuevo], previo["documents"])
+        vaciar()
+
+    def actualizar_metadatos(self, collection) -> int:
+        """Escribe "copias"/"fuentes"/carpetas de los canónicos cuyo grupo cambió."""
+        with self._lock:
+            ids = [
+                cid for (cid,) in self._db.execute(
+                    "SELECT id FROM chunks WHERE sucio = 1 AND canonico = id"
+                )
+            ]
+        for start in range(0, len(ids), 500):
+            actuales = collection.get(ids=ids[start:start + 500], include=["metadatas"])
+            nuevas = []
+            with self._lock:
+                for cid, previa in zip(actuales["ids"], actuales["metadatas"]):
+                    meta = self._metadatos(cid)
+                    # update() mezcla claves: la carpeta de una copia que ya no está se desmarca
+                    for clave in previa or {}:
+                        if clave.startswith(_PREFIJO_CARPETA) and clave not in meta:
+                            meta[clave] = False
+                    nuevas.append(meta)
+            if nuevas:
+                collection.update(ids=actuales["ids"], metadatas=nuevas)
+        with self._lock:
+            self._db.execute("UPDATE chunks SET sucio = 0 WHERE sucio = 1")
+            self._db.commit()
+        return len(ids)
+
+    def resumen(self):
+        with self._lock:
+            total, canonicos = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(canonico = id), 0) FROM chunks"
+            ).fetchone()
+        print(f"   · Duplicados: {self.exactos} exactos y {self.casi} casi iguales en esta ingesta · "
+              f"{canonicos} chunks distintos de {total} en total")
+
+    def cerrar(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    @staticmethod
+    def borrar_todo(path=DEDUP_PATH):
+        """Elimina la tabla (limpieza / re-ingesta desde cero)."""
+        path = Path(path)
+        for p in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# ── Consulta ──────────────────────────────────────────────────
+
+def colapsar(chunks: list[dict], k: int, umbral: float = DEDUP_UMBRAL) -> list[dict]:
+    """
+    Hasta k chunks de una lista ordenada de mejor a peor, saltando los que son
+    iguales o casi iguales a uno ya elegido (sus fuentes se suman a las del
+    que se queda).
+    """
+    elegidos = []  # [chunk, hash, firma]
+    for ch in chunks:
+        if len(elegidos) >= k:
+            break
+        meta = ch.get("metadata") or {}
+        texto = ch.get("text") or ""
+        h = hash_texto(texto)
+        f = firma(texto)
+        igual = next(
+            (e for e in elegidos
+             if e[1] == h or (f is not None and e[2] is not None and similitud(f, e[2]) >= umbral)),
+            None,
+        )
+        if igual is None:
+            elegidos.append([ch, h, f])
+            continue
+        # Copia nueva del dict: el de Chroma puede estar compartido entre consultas
+        meta_igual = dict(igual[0].get("metadata") or {})
+        meta_igual["fuentes"] = "\n".join(_unir_fuentes(
+            meta_igual.get("fuentes") or meta_igual.get("source", ""),
+            meta.get("fuentes") or meta.get("source", ""),
+        )[:_MAX_FUENTES])
+        meta_igual["copias"] = meta_igual.get("copias", 1) + meta.get("copias", 1)
+        igual[0] = {**igual[0], "metadata": meta_igual}
+    return [e[0] for e in elegidos]
@@ -0,0 +1,239 @@
+# embed_batcher.py - Lotes de embeddings que cruzan archivos, agrupados por longitud
+#
+# Con miles de .md pequeños, embeber archivo por archivo deja lotes de 1-3
+# chunks. Aquí se acumulan chunks de muchos archivos, se ordenan por número
+# de tokens y se cortan lotes cuyo tamaño "con padding" (nº chunks × longitud
+# del más largo) no pase de un presupuesto de tokens. Así hay poco relleno,
+# los lotes salen llenos y la RAM por lote queda acotada.
+#
+# Si se le pasa una EmbeddingCache (embed_cache.py), los chunks ya conocidos
+# no pasan por el modelo: salen directamente con su vector guardado.
+import time
+
+from config import EMBED_MAX_BATCH, EMBED_TOKEN_BUDGET, EMBED_BUFFER_CHUNKS
+
+
+def _es_falta_de_memoria(e: Exception) -> bool:
+    if isinstance(e, MemoryError):
+        return True
+    msg = str(e).lower()
+    return isinstance(e, RuntimeError) and ("out of memory" in msg or "alloc" in msg)
+
+
+class EmbeddingBatcher:
+    """
+    Uso:
+        batcher = EmbeddingBatcher(embedder)
+        for lote in batcher.agregar(ids, textos, metas, etiqueta): ...
+        for lote in batcher.vaciar(): ...
+
+    Cada lote devuelto es un dict con "ids", "documents", "embeddings",
+    "metadatas" y "etiquetas" (una por chunk, p. ej. el archivo de origen,
+    para saber cuándo se ha terminado de embeber un archivo).
+    """
+
+    def __init__(
+        self,
+        embedder,
+        max_batch: int = EMBED_MAX_BATCH,
+        token_budget: int = EMBED_TOKEN_BUDGET,
+        buffer_chunks: int = EMBED_BUFFER_CHUNKS,
+        cache=None,
+    ):
+        self.embedder = embedder
+        self.cache = cache
+        self.max_batch = max(1, max_batch)
+        self.token_budget_max = max(1, token_budget)
+        self.token_budget = self.token_budget_max
+        self.buffer_chunks = max(self.max_batch, buffer_chunks)
+        self.max_len = getattr(embedder, "max_seq_length", None) or 512
+        self._buffer = []  # (ntokens, id, texto, meta, etiqueta)
+        self._listos = []  # (id, texto, meta, etiqueta, vector) sacados de la caché
+        self._exitos_seguidos = 0
+
+        self.stats = {
+            "chunks": 0,
+            "lotes": 0,
+            "segundos": 0.0,
+            "tokens": 0,
+            "tokens_con_padding": 0,
+            "reducciones": 0,
+            "desde_cache": 0,
+        }
+
+    # ── Tokens ────────────────────────────────────────────────
+
+    def contar_tokens(self, textos: list[str]) -> list[int]:
+        """Longitud en tokens del modelo (truncada a max_seq_length)."""
+        tokenizer = getattr(self.embedder, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                enc = tokenizer(
+                    textos,
+                    add_special_tokens=True,
+                    truncation=True,
+                    max_length=self.max_len,
+                )
+                return [len(ids) for ids in enc["input_ids"]]
+            except Exception:
+                pass
+        # Aproximación si el backend no expone tokenizer: ~4 caracteres por token
+        return [min(self.max_len, len(t) // 4 + 2) for t in textos]
+
+    # ── API ───────────────────────────────────────────────────
+
+    def pendientes(self) -> int:
+        return len(self._buffer) + len(self._listos)
+
+    def agregar(self, ids, textos, metas, etiqueta=None, solo_llenos: bool = False) -> list[dict]:
+        """
+        Añade chunks al buffer. Si el buffer pasa de buffer_chunks se embebe
+        todo; con solo_llenos=True se embeben solo los lotes que ya están
+        llenos (útil cuando la etapa anterior va lenta y el modelo está ocioso).
+        """
+        if self.cache is not None and textos:
+            vectores = self.cache.buscar(textos)
+            faltan = []
+            for cid, txt, meta, vec in zip(ids, textos, metas, vectores):
+                if vec is None:
+                    faltan.append((cid, txt, meta))
+                else:
+                    self._listos.append((cid, txt, meta, etiqueta, vec))
+            ids = [f[0] for f in faltan]
+            textos = [f[1] for f in faltan]
+            metas = [f[2] for f in faltan]
+
+        for n, cid, txt, meta in zip(self.contar_tokens(textos), ids, textos, metas):
+            self._buffer.append((n, cid, txt, meta, etiqueta))
+
+        if len(self._buffer) >= self.buffer_chunks:
+            return self._procesar(solo_llenos=False)
+        if solo_llenos or len(self._listos) >= self.max_batch:
+            return self._procesar(solo_llenos=True)
+        return []
+
+    def vaciar(self) -> list[dict]:
+        return self._procesar(solo_llenos=False)
+
+    # ── Interno ───────────────────────────────────────────────
+
+    def _cortar_lotes(self, items):
+        """Agrupa items ordenados por longitud respetando max_batch y token_budget."""
+        lotes = []
+        actual = []
+        for item in items:
+            n = item[0]
+            # Ordenados de menor a mayor: el último añadido es el más largo
+            if actual and (len(actual) >= self.max_batch or (len(actual) + 1) * n > self.token_budget):
+                lotes.append(actual)
+                actual = []
+            actual.append(item)
+        if actual:
+            lotes.append(actual)
+        return lotes
+
+    def _lleno(self, lote) -> bool:
+        n_max = lote[-1][0]
+        return len(lote) >= self.max_batch or (len(lote) + 1) * n_max > self.token_budget
+
+    def _sacar_listos(self) -> list[dict]:
+        """Los chunks que vienen de la caché salen ya, en lotes de max_batch."""
+        resultado = []
+        for start in range(0, len(self._listos), self.max_batch):
+            tanda = self._listos[start:start + self.max_batch]
+            resultado.append({
+                "ids": [it[0] for it in tanda],
+                "documents": [it[1] for it in tanda],
+                "embeddings": [it[4] for it in tanda],
+                "metadatas": [it[2] for it in tanda],
+                "etiquetas": [it[3] for it in tanda],
+            })
+        self.stats["desde_cache"] += len(self._listos)
+        self._listos = []
+        return resultado
+
+    def _procesar(self, solo_llenos: bool) -> list[dict]:
+        resultado = self._sacar_listos()
+        if not self._buffer:
+            return resultado
+
+        self._buffer.sort(key=lambda it: it[0])
+        while self._buffer:
+            lotes = self._cortar_lotes(self._buffer)
+            if solo_llenos and not self._lleno(lotes[-1]):
+                # Todos menos el último se cerraron por estar llenos
+                lotes = lotes[:-1]
+            if not lotes:
+                break
+
+            hechos = set()
+            reducido = False
+            for lote in lotes:
+                try:
+                    resultado.append(self._embeber(lote))
+                except Exception as e:
+                    if not _es_falta_de_memoria(e) or len(lote) == 1:
+                        raise
+                    # Sin memoria: la mitad de presupuesto y se vuelve a cortar
+                    self.token_budget = max(1, self.token_budget // 2)
+                    self._exitos_seguidos = 0
+                    self.stats["reducciones"] += 1
+                    print(f"   ⚠ Sin memoria embebiendo; presupuesto reducido a {self.token_budget} tokens/lote.")
+                    reducido = True
+                    break
+                hechos.update(id(it) for it in lote)
+                self._recuperar_presupuesto()
+
+            self._buffer = [it for it in self._buffer if id(it) not in hechos]
+            if not reducido:
+                break
+        return resultado
+
+    def _recuperar_presupuesto(self):
+        """Tras varios lotes sin problemas se vuelve poco a poco al presupuesto configurado."""
+        if self.token_budget >= self.token_budget_max:
+            return
+        self._exitos_seguidos += 1
+        if self._exitos_seguidos >= 20:
+            self.token_budget = min(self.token_budget_max, int(self.token_budget * 1.25) + 1)
+            self._exitos_seguidos = 0
+
+    def _embeber(self, lote) -> dict:
+        textos = [it[2] for it in lote]
+        # Textos repetidos dentro del mismo lote (boilerplate) se embeben una vez
+        unicos = list(dict.fromkeys(textos))
+        t0 = time.perf_counter()
+        # batch_size=len(unicos): el lote ya viene cortado, que sea una sola pasada
+        vectores = self.embedder.encode(
+            unicos, batch_size=len(unicos), show_progress_bar=False
+        ).tolist()
+        self.stats["segundos"] += time.perf_counter() - t0
+        if self.cache is not None:
+            self.cache.guardar(unicos, vectores)
+        por_texto = dict(zip(unicos, vectores))
+        embeddings = [por_texto[t] for t in textos]
+        self.stats["chunks"] += len(lote)
+        self.stats["lotes"] += 1
+        self.stats["tokens"] += sum(it[0] for it in lote)
+        self.stats["tokens_con_padding"] += len(lote) * lote[-1][0]
+        return {
+            "ids": [it[1] for it in lote],
+            "documents": textos,
+            "embeddings": embeddings,
+            "metadatas": [it[3] for it in lote],
+            "etiquetas": [it[4] for it in lote],
+        }
+
+    def resumen(self):
+        s = self.stats
+        if s["desde_cache"]:
+            print(f"   · Chunks servidos desde la caché de embeddings: {s['desde_cache']}")
+        if not s["chunks"]:
+            return
+        vel = s["chunks"] / s["segundos"] if s["segundos"] > 0 else float("inf")
+        media = s["chunks"] / s["lotes"]
+        util = s["tokens"] / s["tokens_con_padding"] if s["tokens_con_padding"] else 1.0
+        print(f"   · Embeddings: {s['chunks']} chunks en {s['lotes']} lotes "
+              f"(media {media:.1f} chunks/lote) · {s['segundos']:.1f} s · {vel:.1f} chunks/s")
+        print(f"   · Tokens útiles/padding: {util:.0%} · presupuesto final {self.token_budget} tokens/lote"
+              + (f" ({s['reducciones']} reducción/es por memoria)" if s["reducciones"] else ""))
@@ -0,0 +1,148 @@
+# embed_cache.py - Caché persistente de embeddings (SQLite)
+#
+# Clave: hash de (modelo, texto del chunk normalizado). Cabeceras, pies
+# legales o diapositivas repetidas se embeben una sola vez aunque aparezcan
+# en cientos de archivos o se re-ingeste todo. Tamaño máximo con expulsión
+# LRU (se borran primero las entradas usadas hace más tiempo).
+import hashlib
+import sqlite3
+import time
+import unicodedata
+from array import array
+
+from config import EMBED_CACHE_PATH, EMBED_CACHE_MAX_MB
+from embeddings import id_modelo
+
+# Bytes aproximados por fila además del vector (clave, índice, página SQLite)
+_OVERHEAD_FILA = 160
+
+# Cada cuántas inserciones se comprueba el tamaño máximo
+_PODAR_CADA = 2000
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normalización para la clave: Unicode NFC y espacios colapsados.
+    El tokenizador del modelo ignora esas diferencias, así que el embedding
+    de ambos textos es el mismo.
+    """
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBED_CACHE_PATH, model_name: str = id_modelo(),
+                 max_mb: float = EMBED_CACHE_MAX_MB):
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.expulsadas = 0
+        self._insertadas = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # check_same_thread=False: se crea en el hilo principal y la usa el
+        # hilo de embeddings (nunca dos hilos a la vez).
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                clave      TEXT PRIMARY KEY,
+                modelo     TEXT NOT NULL,
+                dim        INTEGER NOT NULL,
+                vector     BLOB NOT NULL,
+                ultimo_uso REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_uso ON embeddings(ultimo_uso)")
+        self._db.commit()
+
+    def clave(self, texto: str) -> str:
+        h = hashlib.sha256()
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(normalizar_texto(texto).encode("utf-8"))
+        return h.hexdigest()
+
+    def buscar(self, textos: list[str]) -> list[list[float] | None]:
+        """Devuelve un vector por texto (None si no está en caché)."""
+        claves = [self.clave(t) for t in textos]
+        encontrados = {}
+        # SQLite limita el número de parámetros por consulta
+        for start in range(0, len(claves), 500):
+            tanda = claves[start:start + 500]
+            marcas = ",".join("?" * len(tanda))
+            for clave, vector in self._db.execute(
+                f"SELECT clave, vector FROM embeddings WHERE clave IN ({marcas})", tanda
+            ):
+                v = array("f")
+                v.frombytes(vector)
+                encontrados[clave] = v.tolist()
+
+        if encontrados:
+            ahora = time.time()
+            self._db.executemany(
+                "UPDATE embeddings SET ultimo_uso = ? WHERE clave = ?",
+                [(ahora, c) for c in encontrados],
+            )
+            self._db.commit()
+
+        resultado = [encontrados.get(c) for c in claves]
+        aciertos = sum(1 for v in resultado if v is not None)
+        self.hits += aciertos
+        self.misses += len(resultado) - aciertos
+        return resultado
+
+    def guardar(self, textos: list[str], vectores: list[list[float]]):
+        ahora = time.time()
+        filas = [
+            (self.clave(t), self.model_name, len(v), array("f", v).tobytes(), ahora)
+            for t, v in zip(textos, vectores)
+        ]
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (clave, modelo, dim, vector, ultimo_uso) "
+            "VALUES (?, ?, ?, ?, ?)",
+            filas,
+        )
+        self._db.commit()
+        self._insertadas += len(filas)
+        if self._insertadas >= _PODAR_CADA:
+            self.podar()
+
+    def _tamano_estimado(self) -> tuple[int, int]:
+        n, dim_total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(dim), 0) FROM embeddings").fetchone()
+        return n, dim_total * 4 + n * _OVERHEAD_FILA
+
+    def podar(self):
+        """Expulsión LRU hasta quedar por debajo del tamaño máximo."""
+        self._insertadas = 0
+        n, tam = self._tamano_estimado()
+        if tam <= self.max_bytes or n == 0:
+            return
+        bytes_fila = tam / n
+        # Se deja un 10% de margen para no podar en cada inserción
+        objetivo = int(self.max_bytes * 0.9 / bytes_fila)
+        sobran = n - objetivo
+        self._db.execute(
+            "DELETE FROM embeddings WHERE clave IN "
+            "(SELECT clave FROM embeddings ORDER BY ultimo_uso ASC LIMIT ?)",
+            (sobran,),
+        )
+        self._db.commit()
+        self.expulsadas += sobran
+
+    def cerrar(self):
+        """Poda pendiente y cierre. Llamar a resumen() antes si se quieren las cifras."""
+        self.podar()
+        self._db.close()
+
+    def resumen(self):
+        total = self.hits + self.misses
+        tasa = self.hits / total if total else 0.0
+        n, tam = self._tamano_estimado()
+        print(f"   · Caché de embeddings: {self.hits} aciertos / {self.misses} fallos ({tasa:.0%}) · "
+              f"{n} entradas (~{tam / (1024 * 1024):.1f} MB)"
+              + (f" · {self.expulsadas} expulsadas (LRU)" if self.expulsadas else ""))
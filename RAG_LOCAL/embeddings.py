@@ -0,0 +1,136 @@
+# embeddings.py - Motor del modelo de embeddings (EMBEDDING_BACKEND)
+#
+#   "torch"     → SentenceTransformer(EMBEDDING_MODEL_NAME), como siempre
+#   "onnx"      → el mismo modelo exportado a ONNX (python exportar_onnx.py) y
+#                 ejecutado con ONNX Runtime: no importa torch ni
+#                 sentence_transformers, arranca en una fracción del tiempo
+#                 y en CPU suele embeber más rápido
+#   "onnx-int8" → igual, con los pesos cuantizados a int8 (más rápido aún; los
+#                 vectores cambian un poco y cuentan como otro modelo)
+#
+# runtime.get_embedder() devuelve uno de estos y el resto del RAG (ingesta,
+# preguntas, caché de respuestas...) solo usa lo que tienen en común:
+# encode(textos, batch_size=...) → np.ndarray, max_seq_length y tokenizer.
+# El ONNX reproduce lo que hace SentenceTransformer después del modelo
+# (pooling y normalización) con los ajustes que guarda exportar_onnx.py; la
+# paridad con torch se comprueba con python benchmark_embeddings.py.
+import json
+from pathlib import Path
+
+import numpy as np
+
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+ARCHIVOS_ONNX = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+AJUSTES = "embeddings.json"
+
+
+def id_modelo(backend: str = EMBEDDING_BACKEND, modelo: str = EMBEDDING_MODEL_NAME) -> str:
+    """
+    Nombre del espacio de vectores (clave de la caché de embeddings y del
+    manifest): torch y onnx dan los mismos vectores; onnx-int8 no.
+    """
+    return modelo + ("#int8" if backend == "onnx-int8" else "")
+
+
+def directorio_onnx(modelo: str = EMBEDDING_MODEL_NAME) -> Path:
+    """Carpeta del modelo exportado (un nombre de HF o una ruta local)."""
+    return EMBEDDING_ONNX_DIR / Path(modelo).name
+
+
+class _Tokenizador:
+    """Lo que usa embed_batcher para contar tokens (como el tokenizer de HF)."""
+
+    def __init__(self, tok):
+        self._tok = tok
+
+    def __call__(self, textos, add_special_tokens: bool = True, **_):
+        enc = self._tok.encode_batch(list(textos), add_special_tokens=add_special_tokens)
+        # Con padding activado: los tokens de verdad son los de attention_mask
+        return {"input_ids": [e.ids[:sum(e.attention_mask)] for e in enc]}
+
+
+class OnnxEmbedder:
+    """El modelo de EMBEDDING_MODEL_NAME exportado a ONNX (ver exportar_onnx.py)."""
+
+    def __init__(self, directorio: Path, int8: bool = False, hilos: int = EMBEDDING_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        ajustes = json.loads((directorio / AJUSTES).read_text(encoding="utf-8"))
+        self.max_seq_length = ajustes["max_seq_length"]
+        self.dim = ajustes["dim"]
+        self._pooling = ajustes["pooling"]
+        self._normalizar = ajustes["normalizar"]
+
+        tok = Tokenizer.from_file(str(directorio / "tokenizer.json"))
+        tok.enable_truncation(self.max_seq_length)
+        tok.enable_padding(pad_id=ajustes["pad_id"], pad_token=ajustes["pad_token"])
+        self._tok = tok
+        self.tokenizer = _Tokenizador(tok)
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        archivo = directorio / ARCHIVOS_ONNX["onnx-int8" if int8 else "onnx"]
+        self._sesion = ort.InferenceSession(str(archivo), opciones, providers=["CPUExecutionProvider"])
+        self._entradas = {i.name for i in self._sesion.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _pool(self, ocultos: np.ndarray, mascara: np.ndarray) -> np.ndarray:
+        if self._pooling == "cls":
+            v = ocultos[:, 0]
+        elif self._pooling == "max":
+            v = np.where(mascara[..., None] > 0, ocultos, -np.inf).max(axis=1)
+        else:
+            m = mascara[..., None].astype(np.float32)
+            v = (ocultos * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        if self._normalizar:
+            v = v / np.clip(np.linalg.norm(v, axis=1, keepdims=True), 1e-12, None)
+        return v
+
+    def encode(self, textos, batch_size: int = 32, **_) -> np.ndarray:
+        """Como SentenceTransformer.encode (sin barra de progreso ni tensores)."""
+        uno = isinstance(textos, str)
+        textos = [textos] if uno else list(textos)
+        salida = np.empty((len(textos), self.dim), dtype=np.float32)
+        # Por longitud, como SentenceTransformer: menos relleno en cada lote
+        orden = np.argsort([-len(t) for t in textos], kind="stable")
+        for start in range(0, len(textos), max(1, batch_size)):
+            idx = orden[start:start + max(1, batch_size)]
+            enc = self._tok.encode_batch([textos[i] for i in idx])
+            mascara = np.array([e.attention_mask for e in enc], dtype=np.int64)
+            entradas = {
+                "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                "attention_mask": mascara,
+                "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+            }
+            ocultos = self._sesion.run(None, {k: v for k, v in entradas.items() if k in self._entradas})[0]
+            salida[idx] = self._pool(ocultos, mascara)
+        return salida[0] if uno else salida
+
+
+def cargar_embedder(backend: str = EMBEDDING_BACKEND, modelo: str = EMBEDDING_MODEL_NAME):
+    """
+    El embedder de ese backend. Sin el ONNX exportado da error en vez de
+    usar torch: los vectores de onnx-int8 no son los de torch y no deben
+    mezclarse en la misma colección ni en la caché.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND desconocido: {backend!r} (opciones: {', '.join(BACKENDS)})")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(modelo)
+
+    directorio = directorio_onnx(modelo)
+    if not (directorio / ARCHIVOS_ONNX[backend]).exists():
+        raise FileNotFoundError(
+            f"No está el modelo ONNX en {directorio / ARCHIVOS_ONNX[backend]}: "
+            f"expórtalo una vez con  python exportar_onnx.py"
+        )
+    return OnnxEmbedder(directorio, int8=backend == "onnx-int8")
@@ -0,0 +1,143 @@
+# exportar_onnx.py - Exporta el modelo de embeddings a ONNX (EMBEDDING_BACKEND = "onnx" / "onnx-int8")
+#
+#   python exportar_onnx.py              # EMBEDDING_MODEL_NAME → EMBEDDING_ONNX_DIR/<modelo>/
+#   python exportar_onnx.py --sin-int8   # solo el modelo float32
+#
+# Se ejecuta una vez, con torch y sentence_transformers instalados como
+# siempre; después el RAG embebe con ONNX Runtime sin importarlos. Deja:
+#   model.onnx        el transformer (entradas del tokenizer → last_hidden_state)
+#   model_int8.onnx   el mismo con los pesos cuantizados a int8 (quantize_dynamic)
+#   tokenizer.json    el tokenizer rápido del modelo
+#   embeddings.json   lo que SentenceTransformer hace después del transformer:
+#                     pooling, normalización, longitud máxima y dimensión
+# Al terminar compara los vectores con los de torch (como benchmark_embeddings.py
+# --solo-paridad) y termina con código 1 si no se parecen lo suficiente.
+import argparse
+import inspect
+import json
+import sys
+from pathlib import Path
+
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_PARIDAD_MIN
+from embeddings import AJUSTES, ARCHIVOS_ONNX, OnnxEmbedder, directorio_onnx
+
+
+def ajustes_del_modelo(st) -> dict:
+    """Pooling/normalización del SentenceTransformer (solo Transformer + Pooling [+ Normalize])."""
+    from sentence_transformers.models import Normalize, Pooling, Transformer
+
+    modulos = list(st)
+    tipos = ", ".join(type(m).__name__ for m in modulos)
+    if (not isinstance(modulos[0], Transformer)
+            or not any(isinstance(m, Pooling) for m in modulos)
+            or not all(isinstance(m, (Transformer, Pooling, Normalize)) for m in modulos)):
+        raise ValueError(f"Solo se exportan modelos Transformer + Pooling (+ Normalize); este tiene: {tipos}")
+    capa = next(m for m in modulos if isinstance(m, Pooling))
+    # sentence_transformers < 6 lo da con get_pooling_mode_str(); después es un atributo
+    pooling = capa.get_pooling_mode_str() if hasattr(capa, "get_pooling_mode_str") else capa.pooling_mode
+    if pooling not in ("mean", "cls", "max"):
+        raise ValueError(f"Pooling '{pooling}' no soportado en ONNX (solo mean, cls o max)")
+    if not st.tokenizer.is_fast:
+        raise ValueError("El modelo no tiene tokenizer rápido (tokenizer.json)")
+    return {
+        "modelo": EMBEDDING_MODEL_NAME,
+        "max_seq_length": st.max_seq_length,
+        "dim": st.get_sentence_embedding_dimension(),
+        "pooling": pooling,
+        "normalizar": any(isinstance(m, Normalize) for m in modulos),
+        "pad_id": st.tokenizer.pad_token_id,
+        "pad_token": st.tokenizer.pad_token,
+    }
+
+
+def exportar_transformer(st, destino: Path):
+    import torch
+
+    modelo = st[0].auto_model.eval()
+    ejemplo = st.tokenizer(["Texto de ejemplo para exportar", "otro"], padding=True, return_tensors="pt")
+    nombres = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in ejemplo]
+
+    class _UltimaCapa(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, *entradas):
+            return self.m(**dict(zip(nombres, entradas))).last_hidden_state
+
+    # El exportador nuevo (dynamo) de torch >= 2.5 no hace falta y cambia según versión
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            _UltimaCapa(modelo),
+            tuple(ejemplo[n] for n in nombres),
+            str(destino / ARCHIVOS_ONNX["onnx"]),
+            input_names=nombres,
+            output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "lote", 1: "tokens"} for n in nombres + ["last_hidden_state"]},
+            opset_version=14,
+            do_constant_folding=True,
+            **extra,
+        )
+
+
+def cuantizar(destino: Path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        str(destino / ARCHIVOS_ONNX["onnx"]),
+        str(destino / ARCHIVOS_ONNX["onnx-int8"]),
+        weight_type=QuantType.QInt8,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el modelo de embeddings a ONNX (float32 e int8)")
+    parser.add_argument("--sin-int8", action="store_true", help="no genera model_int8.onnx")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    from benchmark_embeddings import cosenos, textos_de_prueba
+
+    print(f"🧠 Cargando {EMBEDDING_MODEL_NAME} con sentence_transformers...")
+    st = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    try:
+        ajustes = ajustes_del_modelo(st)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    destino = directorio_onnx()
+    destino.mkdir(parents=True, exist_ok=True)
+    print(f"📦 Exportando a {destino / ARCHIVOS_ONNX['onnx']} ...")
+    exportar_transformer(st, destino)
+    st.tokenizer.backend_tokenizer.save(str(destino / "tokenizer.json"))
+    (destino / AJUSTES).write_text(json.dumps(ajustes, ensure_ascii=False, indent=1), encoding="utf-8")
+    if not args.sin_int8:
+        print(f"🔢 Cuantizando a int8: {destino / ARCHIVOS_ONNX['onnx-int8']} ...")
+        cuantizar(destino)
+
+    print("🎯 Paridad con torch...")
+    textos = textos_de_prueba(200)
+    referencia = st.encode(textos, batch_size=32, show_progress_bar=False)
+    ok = True
+    for backend in ("onnx", "onnx-int8"):
+        if not (destino / ARCHIVOS_ONNX[backend]).exists():
+            continue
+        vectores = OnnxEmbedder(destino, int8=backend == "onnx-int8").encode(textos, batch_size=32)
+        c = cosenos(referencia, vectores)
+        minimo = EMBEDDING_PARIDAD_MIN[backend]
+        ok = ok and c.min() >= minimo
+        print(f"   {'✅' if c.min() >= minimo else '❌'} {backend}: coseno mín {c.min():.5f} · "
+              f"media {c.mean():.5f} (umbral {minimo})")
+
+    if not ok:
+        print("❌ Los vectores ONNX no coinciden con los de torch: no cambies EMBEDDING_BACKEND.")
+        return 1
+    print('✅ Listo. Pon EMBEDDING_BACKEND = "onnx" (o "onnx-int8") en config.py.')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
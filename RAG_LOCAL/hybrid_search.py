@@ -0,0 +1,132 @@
+# hybrid_search.py - Búsqueda híbrida: vectores (Chroma) + léxica (BM25)
+#
+# Cada buscador aporta sus HYBRID_CANDIDATES mejores chunks y se fusionan con
+# Reciprocal Rank Fusion: puntuación = Σ 1 / (RRF_K + posición). No hace falta
+# que las puntuaciones de ambos sean comparables, solo el orden.
+# Con DEDUP_CONSULTA se piden k × DEDUP_CONSULTA_FACTOR y se descartan los
+# iguales o casi iguales a uno mejor (dedup.colapsar), así los k son distintos.
+import time
+
+from config import (
+    HYBRID_SEARCH,
+    HYBRID_CANDIDATES,
+    HYBRID_FILTRO_FACTOR,
+    RRF_K,
+    DEDUP_CONSULTA,
+    DEDUP_CONSULTA_FACTOR,
+)
+import dedup
+from runtime import get_bm25_index, get_embedder, get_query_batcher
+
+
+def rrf(listas: list[list[str]], k_rrf: int = RRF_K) -> list[str]:
+    """Fusiona varias listas ordenadas de IDs. Devuelve los IDs de mejor a peor."""
+    puntos = {}
+    for lista in listas:
+        for pos, cid in enumerate(lista, start=1):
+            puntos[cid] = puntos.get(cid, 0.0) + 1.0 / (k_rrf + pos)
+    return sorted(puntos, key=lambda cid: puntos[cid], reverse=True)
+
+
+def embeber_pregunta(pregunta: str) -> list[float]:
+    """Embedding de una pregunta; con varias a la vez se embeben en un mismo lote."""
+    batcher = get_query_batcher()
+    if batcher is not None:
+        return batcher.embeber(pregunta)
+    return get_embedder().encode([pregunta]).tolist()[0]
+
+
+def _consulta_vectorial(collection, embedding, n_results: int, where: dict | None) -> dict:
+    batcher = get_query_batcher()
+    if batcher is not None:
+        return batcher.consultar(collection, embedding, n_results, where)
+    return collection.query(query_embeddings=[embedding], n_results=n_results, where=where)
+
+
+def _ms(t0: float) -> float:
+    return (time.perf_counter() - t0) * 1000
+
+
+def buscar(collection, pregunta: str, pregunta_embedding: list[float], k: int,
+           where: dict | None = None, tiempos: dict | None = None) -> list[dict]:
+    """
+    Devuelve hasta k chunks {"id", "text", "metadata"} de mejor a peor.
+    `where` se aplica a ambos buscadores. En `tiempos` se anotan los ms de
+    cada paso (vector, bm25, lectura de los chunks que solo encontró BM25, fusión).
+    """
+    if tiempos is None:
+        tiempos = {}
+    k_pedidos = k * DEDUP_CONSULTA_FACTOR if DEDUP_CONSULTA else k
+    n_candidatos = max(k_pedidos, HYBRID_CANDIDATES) if HYBRID_SEARCH else k_pedidos
+
+    t0 = time.perf_counter()
+    results = _consulta_vectorial(collection, pregunta_embedding, n_candidatos, where)
+    tiempos["vector_ms"] = _ms(t0)
+
+    chunks = {}
+    orden_vector = []
+    for cid, doc, meta in zip(
+        results.get("ids", [[]])[0],
+        results.get("documents", [[]])[0],
+        results.get("metadatas", [[]])[0],
+    ):
+        chunks[cid] = {"id": cid, "text": doc, "metadata": meta}
+        orden_vector.append(cid)
+
+    if not HYBRID_SEARCH:
+        return _distintos([chunks[cid] for cid in orden_vector], k, tiempos)
+
+    # BM25 no conoce los metadatos: con filtros trae más candidatos para que,
+    # tras quitar los que no los cumplen, sigan quedando suficientes
+    t0 = time.perf_counter()
+    n_bm25 = n_candidatos * HYBRID_FILTRO_FACTOR if where else n_candidatos
+    hits = get_bm25_index().buscar(pregunta, n=n_bm25)
+    tiempos["bm25_ms"] = _ms(t0)
+
+    # Los que solo ha encontrado BM25 se leen de Chroma (con el mismo where,
+    # así los que no cumplen los filtros simplemente no vuelven)
+    faltan = [cid for cid, _ in hits if cid not in chunks]
+    if faltan:
+        t0 = time.perf_counter()
+        extra = collection.get(ids=faltan, where=where, include=["documents", "metadatas"])
+        for cid, doc, meta in zip(extra.get("ids", []), extra.get("documents", []), extra.get("metadatas", [])):
+            chunks[cid] = {"id": cid, "text": doc, "metadata": meta}
+        tiempos["lectura_ms"] = _ms(t0)
+    orden_bm25 = [cid for cid, _ in hits if cid in chunks][:n_candidatos]
+
+    t0 = time.perf_counter()
+    fusionados = rrf([orden_vector, orden_bm25])[:k_pedidos]
+    tiempos["fusion_ms"] = _ms(t0)
+
+    return _distintos([chunks[cid] for cid in fusionados], k, tiempos)
+
+
+def _distintos(candidatos: list[dict], k: int, tiempos: dict) -> list[dict]:
+    if not DEDUP_CONSULTA:
+        return candidatos[:k]
+    t0 = time.perf_counter()
+    elegidos = dedup.colapsar(candidatos, k)
+    tiempos["dedup_ms"] = _ms(t0)
+    return elegidos
+
+
+_NOMBRES = {
+    "embedding_ms": "embedding",
+    "vector_ms": "vector",
+    "bm25_ms": "bm25",
+    "lectura_ms": "lectura",
+    "fusion_ms": "fusión",
+    "dedup_ms": "duplicados",
+    "rerank_ms": "rerank",
+}
+
+
+def formatear_tiempos(tiempos: dict) -> str:
+    partes = [f"{nombre} {tiempos[clave]:.1f} ms" for clave, nombre in _NOMBRES.items() if clave in tiempos]
+    texto = "🔎 Recuperación: " + " · ".join(partes)
+    if tiempos.get("shards"):
+        texto += f" · shards {tiempos['shards']}"
+    if tiempos.get("rerank_agotado"):
+        puntuados, total = tiempos["rerank_agotado"]
+        texto += f" (presupuesto de rerank agotado: reordenados {puntuados} de {total})"
+    return texto
@@ -1,232 +1,627 @@
 # ingest.py (versión con PDF + Office + txt/md, optimizada y segura)
-import uuid
-import gc
+#
+# Pipeline por etapas:
+#   1) Extracción: un pool de procesos carga y trocea archivos en paralelo
+#      (pypdf/openpyxl son CPU puro y así usamos todos los núcleos). Los
+#      archivos grandes se leen por partes (página a página, bloques de filas)
+#      y sus chunks van entrando en los lotes según salen.
+#   2) Embeddings: un único hilo con el modelo cargado va embebiendo, en lotes
+#      que mezclan chunks de varios archivos (ver embed_batcher.py).
+#   3) Escritura: otro hilo guarda los lotes en Chroma (y en el índice BM25
+#      de la búsqueda híbrida) y actualiza el manifest.
+# Las etapas se comunican con colas acotadas: si una etapa va lenta, las
+# anteriores esperan (backpressure) y la memoria no crece sin límite.
+# Con DEDUP_ENABLED, antes de embeber se apartan los chunks que ya están
+# guardados (iguales o casi iguales, ver dedup.py): solo se embebe y se
+# guarda uno por grupo.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from datetime import datetime
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-
-from config import DOCS_DIR, CHROMA_DIR, EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
-
-# Librerías para formatos específicos
-from pypdf import PdfReader
-from docx import Document as DocxDocument
-from pptx import Presentation
-from openpyxl import load_workbook
+from config import (
+    DOCS_DIR,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    INGEST_WORKERS,
+    INGEST_QUEUE_SIZE,
+    INGEST_STREAM_MB,
+    INGEST_STREAM_CHUNKS,
+    EMBED_CACHE_ENABLED,
+    HYBRID_SEARCH,
+    DEDUP_ENABLED,
+)
+from dedup import Deduplicador
+from embed_batcher import EmbeddingBatcher
+from embed_cache import EmbeddingCache
+from loaders import EXTENSIONES_SOPORTADAS, extraer_archivo, extraer_por_partes
+from manifest import (
+    anotar_cambio,
+    cargar_manifest,
+    guardar_manifest,
+    detectar_cambios,
+    meta_fecha,
+    params_cambiados,
+    rel_key,
+)
+import runtime
+
+# Lotes ya embebidos esperando a ser escritos en Chroma
+WRITE_QUEUE_SIZE = 4
+
+# Marca de fin que se pasa por las colas
+_FIN = None
+
+
+@dataclass
+class IngestStats:
+    """Resultado de run(): qué se ha hecho y cuánto ha tardado cada etapa."""
+    modo: str = "incremental"
+    archivos_encontrados: int = 0
+    archivos: int = 0              # archivos guardados en Chroma
+    archivos_error: int = 0        # con error u omitidos (se reintentan la próxima vez)
+    sin_cambios: int = 0
+    eliminados: int = 0
+    chunks: int = 0
+    chunks_desde_cache: int = 0
+    duplicados: int = 0            # chunks que no se embebieron por ser copia de otro
+    extraccion_s: float = 0.0      # suma de los procesos de extracción
+    embeddings_s: float = 0.0
+    escritura_s: float = 0.0
+    total_s: float = 0.0
+    errores: list[str] = field(default_factory=list)
+
+
+def num_workers(workers: int | None = None) -> int:
+    """0 → automático (núcleos - 1, mínimo 1). None → INGEST_WORKERS de config.py."""
+    if workers is None:
+        workers = INGEST_WORKERS
+    if workers and workers > 0:
+        return workers
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _poner(cola: queue.Queue, item, abortar: threading.Event) -> bool:
+    """put() bloqueante (backpressure) que se rinde si otra etapa ha fallado."""
+    while not abortar.is_set():
+        try:
+            cola.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
 
-EXTENSIONES_SOPORTADAS = [".txt", ".md", ".pdf", ".docx", ".pptx", ".xlsx"]
 
-# 🔢 Tamaño de lote para embeddings (ajusta si quieres usar menos RAM aún)
-BATCH_SIZE = 16
+def _sacar(cola: queue.Queue, abortar: threading.Event):
+    """get() bloqueante; devuelve _FIN si otra etapa ha fallado."""
+    while not abortar.is_set():
+        try:
+            return cola.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _FIN
 
 
-def chunk_text(text: str, max_chars: int, overlap: int):
+def borrar_chunks(collection, ids: list[str], bm25=None, dedup=None):
     """
-    Divide un texto largo en chunks con solapamiento por caracteres,
-    usando un cálculo seguro basado en pasos fijos.
-    No hay bucles infinitos.
+    Borra IDs de Chroma por tandas (evita peticiones enormes) y del índice
+    BM25. Con deduplicación, si alguno era el canónico de otras copias, una
+    de ellas ocupa su sitio en vez de borrarse.
     """
-    if max_chars <= 0:
-        raise ValueError("max_chars debe ser > 0")
-
-    if overlap < 0:
-        overlap = 0
-    if overlap >= max_chars:
-        print(f"⚠ overlap ({overlap}) >= max_chars ({max_chars}), ajustando overlap automáticamente...")
-        overlap = max_chars - 1
-
-    length = len(text)
-    step = max_chars - overlap  # cuánto avanzamos cada vez
-    if step <= 0:
-        step = 1
-
-    chunks = []
-
-    print(f"   · Texto total: {length} caracteres")
-    print(f"   · max_chars={max_chars}, overlap={overlap}, step={step}")
-
-    for start in range(0, length, step):
-        end = min(start + max_chars, length)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-    print(f"   · Chunks generados: {len(chunks)}")
-    return chunks
-
+    if dedup is not None:
+        dedup.aplicar(collection, bm25, dedup.liberar(ids))
+        return
+    for start in range(0, len(ids), 500):
+        collection.delete(ids=ids[start:start + 500])
+    if bm25 is not None:
+        bm25.borrar(ids)
 
-def load_txt_md(path: Path) -> str:
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
 
+def actualizar_fechas(collection, manifest: dict, claves: list[str]):
+    """
+    Archivos con el mismo contenido pero otra fecha (tocados, copiados, un
+    checkout): no se re-embeben, solo se cambian date/date_ord de sus chunks
+    para que los filtros [fecha...] sigan coincidiendo con el archivo.
+    """
+    for key in claves:
+        info = manifest["files"][key]
+        ids = info.get("chunk_ids", [])
+        for start in range(0, len(ids), 500):
+            # Con deduplicación las copias no están en la colección
+            tanda = collection.get(ids=ids[start:start + 500], include=[])["ids"]
+            if tanda:
+                collection.update(ids=tanda, metadatas=[meta_fecha(info["mtime"])] * len(tanda))
+
+
+def _informar_extraccion(res: dict):
+    path = Path(res["path"])
+    print(f"\n📄 Extraído: {path.name} ({path.suffix.lower()}) · {res['size_mb']:.2f} MB")
+    if res["omitido"]:
+        print(f"   ⚠ {res['omitido']}")
+    elif res["error"]:
+        print(f"   ⚠ {res['error']}")
+    elif not res["total_chunks"]:
+        print("   (Archivo sin texto útil, se omite)")
+    elif res["parte"]:
+        print(f"   · Chunks generados: {res['total_chunks']} (leído en {res['parte'] + 1} partes)")
+    else:
+        print(f"   · Chunks generados: {res['total_chunks']} ({res['segundos']:.2f} s)")
+
+
+def _es_grande(info: dict) -> bool:
+    return info.get("size", 0) > INGEST_STREAM_MB * 1024 * 1024
+
+
+def _etapa_extraccion(pendientes, workers: int, cola_embed, abortar, stats):
+    """
+    Etapa 1 (hilo principal). Mantiene como mucho 2×workers archivos en vuelo
+    en el pool; como el put() a cola_embed bloquea cuando está llena, no se
+    lanzan archivos nuevos hasta que la etapa de embeddings libera hueco.
+    Los archivos de más de INGEST_STREAM_MB no van al pool (devolvería todos
+    sus chunks de golpe): se leen aquí por partes de INGEST_STREAM_CHUNKS,
+    recogiendo entre parte y parte lo que vaya terminando el pool.
+    """
+    def entregar(info, res):
+        if res["ultima"]:
+            _informar_extraccion(res)
+        stats.extraccion_s += res["segundos"]
+        if res["error"] or res["omitido"]:
+            # Se deja el manifest como estaba para reintentar en la próxima ingesta
+            stats.archivos_error += 1
+            stats.errores.append(f"{rel_key(Path(res['path']), DOCS_DIR)}: {res['omitido'] or res['error']}")
+            if not res["parte"]:
+                return True
+            # Ya hay partes del archivo en camino: la etapa de embeddings no debe cerrarlo
+        return _poner(cola_embed, (info, res), abortar)
+
+    args_comunes = (str(DOCS_DIR), CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def por_partes(path, info, recoger=None) -> bool:
+        for res in extraer_por_partes(str(path), *args_comunes, INGEST_STREAM_CHUNKS):
+            if not entregar(info, res):
+                return False
+            if recoger is not None and not recoger(False):
+                return False
+        return True
+
+    if workers <= 1:
+        for path, info in pendientes:
+            if not por_partes(path, info):
+                return
+        return
 
-def load_pdf(path: Path) -> str:
-    """Extrae texto de un PDF página por página."""
-    texto = []
-    reader = PdfReader(str(path))
-    for i, page in enumerate(reader.pages):
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        en_vuelo = {}
+        restantes = iter([(p, i) for p, i in pendientes if not _es_grande(i)])
+        grandes = [(p, i) for p, i in pendientes if _es_grande(i)]
+
+        def lanzar():
+            for path, info in restantes:
+                fut = pool.submit(extraer_archivo, str(path), *args_comunes)
+                en_vuelo[fut] = info
+                if len(en_vuelo) >= workers * 2:
+                    break
+
+        def recoger(bloquear: bool) -> bool:
+            if not en_vuelo:
+                return True
+            hechos, _ = wait(en_vuelo, timeout=None if bloquear else 0, return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                info = en_vuelo.pop(fut)
+                if not entregar(info, fut.result()):
+                    return False
+            lanzar()
+            return True
+
+        lanzar()
+        for path, info in grandes:
+            if not por_partes(path, info, recoger):
+                return
+        while en_vuelo:
+            if not recoger(True):
+                return
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _etapa_embeddings(embedder, cache, dedup, cola_embed, cola_escritura, abortar, errores, stats, batchers):
+    """
+    Etapa 2 (hilo): junta chunks de varios archivos en el EmbeddingBatcher
+    (lotes llenos y agrupados por longitud) y pasa los lotes al escritor.
+    Cuando todos los chunks de un archivo han salido, avisa al escritor para
+    que cierre ese archivo en el manifest. Con `dedup`, los chunks que son
+    copia de uno ya guardado no se embeben (pero cuentan para el manifest).
+    """
+    batcher = EmbeddingBatcher(embedder, cache=cache)
+    batchers.append(batcher)
+    # path → [info, ids, chunks que faltan por embeber, ¿llegó la última parte?]
+    abiertos = {}
+
+    def cerrables():
+        return [p for p, (_, _, faltan, completo) in abiertos.items() if faltan == 0 and completo]
+
+    def enviar(lotes) -> bool:
+        for lote in lotes:
+            if not _poner(cola_escritura, ("lote", lote), abortar):
+                return False
+            for etiqueta in lote["etiquetas"]:
+                if etiqueta in abiertos:
+                    abiertos[etiqueta][2] -= 1
+            # Los lotes del archivo ya van delante en la cola: se puede cerrar
+            for path in cerrables():
+                info, ids, _, _ = abiertos.pop(path)
+                if not _poner(cola_escritura, ("archivo", (info, path, ids)), abortar):
+                    return False
+        return True
+
+    try:
+        while True:
+            item = _sacar(cola_embed, abortar)
+            if item is _FIN:
+                break
+            info, res = item
+            path = res["path"]
+            if res["error"] or res["omitido"]:
+                # Falló a mitad de un archivo leído por partes: lo ya enviado se
+                # escribe, pero el archivo no se cierra en el manifest (se reintenta)
+                abiertos.pop(path, None)
+                continue
+            ids, textos, metas = res["ids"], res["chunks"], res["metadatas"]
+            if dedup is not None and ids:
+                ids, textos, metas, ops = dedup.clasificar(ids, textos, metas)
+                stats.duplicados += len(res["ids"]) - len(ids)
+                # Borrados/promociones en Chroma, por delante de los lotes de estos chunks
+                if ops and not _poner(cola_escritura, ("dedup", ops), abortar):
+                    return
+            abierto = abiertos.setdefault(path, [info, [], 0, False])
+            abierto[1].extend(res["ids"])
+            abierto[2] += len(ids)
+            abierto[3] = res["ultima"]
+            # Si la extracción va más lenta que el modelo, no esperamos a llenar
+            # el buffer: se embeben ya los lotes que estén completos.
+            lotes = batcher.agregar(
+                ids, textos, metas,
+                etiqueta=path,
+                solo_llenos=cola_embed.empty(),
+            )
+            del item, res, textos, metas
+            if not enviar(lotes):
+                return
+
+            # Archivos sin chunks (sin texto útil) o cuyas partes ya están
+            # todas embebidas se cierran directamente
+            if path in abiertos and abiertos[path][2] == 0 and abiertos[path][3]:
+                info, ids, _, _ = abiertos.pop(path)
+                if not _poner(cola_escritura, ("archivo", (info, path, ids)), abortar):
+                    return
+
+        if not abortar.is_set():
+            enviar(batcher.vaciar())
+    except Exception as e:
+        errores.append(e)
+        abortar.set()
+    finally:
+        stats.embeddings_s = batcher.stats["segundos"]
+        stats.chunks_desde_cache = batcher.stats["desde_cache"]
+        _poner(cola_escritura, _FIN, abortar)
+
+
+def _etapa_escritura(collection, bm25, dedup, manifest, cola_escritura, abortar, errores, stats):
+    """Etapa 3 (hilo): upsert en Chroma (+ BM25) y actualización del manifest por archivo."""
+    try:
+        ultimo_guardado = time.monotonic()
+        while True:
+            item = _sacar(cola_escritura, abortar)
+            if item is _FIN:
+                break
+            tipo, datos = item
+
+            if tipo == "dedup":
+                t0 = time.perf_counter()
+                dedup.aplicar(collection, bm25, datos)
+                anotar_cambio(manifest)
+                stats.escritura_s += time.perf_counter() - t0
+                continue
+
+            if tipo == "lote":
+                t0 = time.perf_counter()
+                if dedup is not None:
+                    # Sin los que han pasado a ser copia y con "copias"/"fuentes"
+                    datos = dedup.preparar_lote(datos)
+                    if not datos["ids"]:
+                        continue
+                # upsert: con IDs deterministas, re-ingestar un archivo sobreescribe sus chunks
+                collection.upsert(
+                    documents=datos["documents"],
+                    embeddings=datos["embeddings"],
+                    metadatas=datos["metadatas"],
+                    ids=datos["ids"],
+                )
+                if bm25 is not None:
+                    bm25.agregar(datos["ids"], datos["documents"])
+                anotar_cambio(manifest)
+                stats.escritura_s += time.perf_counter() - t0
+                stats.chunks += len(datos["ids"])
+                continue
+
+            info, path_str, ids = datos
+            key = rel_key(Path(path_str), DOCS_DIR)
+            previo = manifest["files"].get(key)
+            if previo:
+                sobrantes = sorted(set(previo.get("chunk_ids", [])) - set(ids))
+                if sobrantes:
+                    print(f"   · {key}: borrando {len(sobrantes)} chunk(s) antiguos que ya no existen.")
+                    borrar_chunks(collection, sobrantes, bm25, dedup)
+                    anotar_cambio(manifest)
+
+            info["chunk_ids"] = ids
+            manifest["files"][key] = info
+            stats.archivos += 1
+            print(f"   💾 Guardado en Chroma: {key} ({len(ids)} chunks)")
+
+            # Guardado periódico: si se corta la ingesta no se pierde lo ya hecho
+            if time.monotonic() - ultimo_guardado > 5:
+                guardar_manifest(manifest)
+                if bm25 is not None:
+                    bm25.guardar()
+                ultimo_guardado = time.monotonic()
+    except Exception as e:
+        errores.append(e)
+        abortar.set()
+
+
+def _resolver_paths(paths) -> tuple[list[Path], set[str], list[str]]:
+    """
+    Archivos compatibles bajo `paths` (archivos o carpetas dentro de DOCS_DIR;
+    relativas a DOCS_DIR o absolutas) y las claves exactas y prefijos de
+    carpeta ("dir/") del manifest que cubren, para saber qué archivos
+    eliminados les corresponden. Una ruta que ya no existe puede haber sido
+    un archivo o una carpeta: cuenta como ambas cosas, nunca como prefijo suelto
+    ("inf" no abarca informes/).
+    """
+    files = []
+    claves = set()
+    prefijos = []
+    base = DOCS_DIR.resolve()
+    for p in paths:
+        p = Path(p)
+        if not p.is_absolute():
+            p = DOCS_DIR / p
+        p = p.resolve()
         try:
-            page_text = page.extract_text() or ""
-        except Exception:
-            page_text = ""
-        if page_text.strip():
-            texto.append(f"[Página {i+1}]\n{page_text}")
-    return "\n\n".join(texto)
-
-
-def load_docx(path: Path) -> str:
-    """Extrae texto de un documento .docx (Word)."""
-    doc = DocxDocument(str(path))
-    parts = []
-    for para in doc.paragraphs:
-        txt = para.text.strip()
-        if txt:
-            parts.append(txt)
-    return "\n".join(parts)
-
-
-def load_pptx(path: Path) -> str:
-    """Extrae texto de un .pptx (PowerPoint)."""
-    prs = Presentation(str(path))
-    parts = []
-    for i, slide in enumerate(prs.slides):
-        slide_parts = []
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                txt = shape.text.strip()
-                if txt:
-                    slide_parts.append(txt)
-        if slide_parts:
-            parts.append(f"[Diapositiva {i+1}]\n" + "\n".join(slide_parts))
-    return "\n\n".join(parts)
-
-
-def load_xlsx(path: Path) -> str:
-    """Extrae texto de un .xlsx (Excel) recorriendo hojas y celdas."""
-    wb = load_workbook(filename=str(path), data_only=True)
-    parts = []
-    for sheet in wb.worksheets:
-        sheet_parts = []
-        for row in sheet.iter_rows(values_only=True):
-            vals = [str(c) for c in row if c is not None]
-            if vals:
-                sheet_parts.append(" | ".join(vals))
-        if sheet_parts:
-            parts.append(f"[Hoja: {sheet.title}]\n" + "\n".join(sheet_parts))
-    return "\n\n".join(parts)
-
-
-def load_file(path: Path) -> str:
-    """Detecta el tipo de archivo y llama al loader correspondiente."""
-    ext = path.suffix.lower()
-
-    if ext in [".txt", ".md"]:
-        return load_txt_md(path)
-    if ext == ".pdf":
-        return load_pdf(path)
-    if ext == ".docx":
-        return load_docx(path)
-    if ext == ".pptx":
-        return load_pptx(path)
-    if ext == ".xlsx":
-        return load_xlsx(path)
-
-    return ""
-
-
-def main():
+            key = p.relative_to(base).as_posix()
+        except ValueError:
+            print(f"⚠ {p} no está dentro de {DOCS_DIR}, se ignora.")
+            continue
+        if p.is_dir():
+            files.extend(x for x in p.glob("**/*") if x.suffix.lower() in EXTENSIONES_SOPORTADAS)
+            prefijos.append("" if key == "." else key + "/")
+        elif p.exists():
+            if p.suffix.lower() in EXTENSIONES_SOPORTADAS:
+                files.append(p)
+            claves.add(key)
+        else:
+            claves.add(key)
+            prefijos.append(key + "/")
+    # rel_key() trabaja con DOCS_DIR tal cual
+    files = [DOCS_DIR / f.relative_to(base) for f in dict.fromkeys(files)]
+    return files, claves, prefijos
+
+
+def run(paths=None, mode: str = "incremental", workers: int | None = None) -> IngestStats:
+    """
+    Ingesta de DOCS_DIR en la colección 'docs' desde el propio proceso:
+    reutiliza el embedder y el cliente de Chroma de runtime.py si ya están cargados.
+
+    - mode="incremental": usa el manifest para procesar solo archivos nuevos
+      o modificados y borra los chunks de archivos eliminados.
+    - mode="full": vuelve a procesar todos los archivos (los IDs deterministas
+      hacen que se sobreescriban en lugar de duplicarse).
+    paths: limita la ingesta a esos archivos/carpetas (None → todo DOCS_DIR).
+    workers: procesos de extracción (None → INGEST_WORKERS, 1 → sin pool).
+    """
+    if mode not in ("incremental", "full"):
+        raise ValueError(f"Modo de ingesta desconocido: {mode!r} (usa 'incremental' o 'full')")
+    full = mode == "full"
+    t_inicio = time.perf_counter()
     DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
     print(f"📂 Carpeta de documentos: {DOCS_DIR}")
     print(f"🔍 Buscando archivos con estas extensiones: {', '.join(EXTENSIONES_SOPORTADAS)}")
 
-    files = [p for p in DOCS_DIR.glob("**/*") if p.suffix.lower() in EXTENSIONES_SOPORTADAS]
-
-    if not files:
+    manifest = cargar_manifest()
+    bm25 = runtime.get_bm25_index() if HYBRID_SEARCH else None
+
+    forzar_todo = None
+    if not full and params_cambiados(manifest):
+        forzar_todo = ("Cambió el modelo de embeddings, el tamaño de chunk, los metadatos o el reparto "
+                       "en shards desde la última ingesta")
+    elif not full and bm25 is not None and manifest["files"] and len(bm25) == 0:
+        # Colección creada antes de la búsqueda híbrida: hay que construir el índice
+        forzar_todo = "El índice BM25 de la búsqueda híbrida está vacío"
+    if forzar_todo:
+        print(f"⚠ {forzar_todo}:")
+        print("   se reprocesarán todos los archivos.")
+        full = True
+        paths = None
+
+    if paths:
+        files, claves, prefijos = _resolver_paths(paths)
+    else:
+        files = [p for p in DOCS_DIR.glob("**/*") if p.suffix.lower() in EXTENSIONES_SOPORTADAS]
+        prefijos = None
+
+    # En modo completo todo cuenta como modificado, pero se conservan los IDs
+    # previos del manifest para poder borrar los chunks que sobren.
+    pendientes, sin_cambios, eliminados, redatados = detectar_cambios(files, DOCS_DIR, manifest, forzar=full)
+    if prefijos is not None:
+        # Solo cuentan como eliminados los que estaban bajo las rutas pedidas
+        eliminados = [k for k in eliminados if k in claves or any(k.startswith(p) for p in prefijos)]
+
+    stats = IngestStats(
+        modo="completa" if full else "incremental",
+        archivos_encontrados=len(files),
+        sin_cambios=len(sin_cambios),
+        eliminados=len(eliminados),
+    )
+
+    print(f"✅ Encontrados {len(files)} archivo(s). Ingesta {stats.modo}:")
+    print(f"   · Nuevos/modificados: {len(pendientes)}")
+    print(f"   · Sin cambios: {len(sin_cambios)}")
+    print(f"   · Eliminados: {len(eliminados)}")
+
+    if not files and not eliminados:
         print("⚠ No se encontraron archivos compatibles en la carpeta docs.")
         print("   Coloca tus PDF, DOCX, PPTX, XLSX, TXT o MD en D:\\RAG_LOCAL\\docs y vuelve a ejecutar este script.")
-        return
-
-    print(f"✅ Encontrados {len(files)} archivo(s).")
-
-    print(f"🧠 Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}...")
-    embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-    print(f"📚 Iniciando Chroma en: {CHROMA_DIR}")
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-    collection = client.get_or_create_collection(name="docs")
-
-    for file_path in files:
-        print(f"\n📄 Procesando: {file_path.name} ({file_path.suffix.lower()})")
+        stats.total_s = time.perf_counter() - t_inicio
+        return stats
+
+    if redatados:
+        print(f"   · Mismo contenido con otra fecha: {len(redatados)} (se actualiza la fecha de sus chunks)")
+        actualizar_fechas(runtime.get_collection(), manifest, redatados)
+        anotar_cambio(manifest)
+
+    if not pendientes and not eliminados:
+        guardar_manifest(manifest)
+        print("\n✅ Nada que hacer: la base vectorial ya está al día.")
+        stats.total_s = time.perf_counter() - t_inicio
+        return stats
+
+    # runtime importa chromadb/torch solo al pedirlos: los procesos del pool no los cargan
+    collection = runtime.get_collection()
+    dedup = Deduplicador() if DEDUP_ENABLED else None
+
+    for key in eliminados:
+        old_ids = manifest["files"].pop(key).get("chunk_ids", [])
+        print(f"\n🗑 Eliminado del disco: {key} → borrando {len(old_ids)} chunk(s)")
+        borrar_chunks(collection, old_ids, bm25, dedup)
+    if eliminados:
+        anotar_cambio(manifest)
+        guardar_manifest(manifest)
+        if bm25 is not None:
+            bm25.guardar()
+
+    if not pendientes:
+        if dedup is not None:
+            try:
+                dedup.actualizar_metadatos(collection)
+            finally:
+                dedup.cerrar()
+        print("\n✅ Ingesta completada. Tu base vectorial está lista.")
+        stats.total_s = time.perf_counter() - t_inicio
+        return stats
+
+    embedder = runtime.get_embedder()
+
+    cache = EmbeddingCache() if EMBED_CACHE_ENABLED else None
+
+    workers = min(num_workers(workers), len(pendientes))
+    print(f"⚙ Extracción con {workers} proceso(s), cola de {INGEST_QUEUE_SIZE} archivo(s).")
+
+    cola_embed = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    cola_escritura = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    abortar = threading.Event()
+    errores = []
+    batchers = []
+
+    hilo_embed = threading.Thread(
+        target=_etapa_embeddings,
+        args=(embedder, cache, dedup, cola_embed, cola_escritura, abortar, errores, stats, batchers),
+        name="ingest-embeddings",
+        daemon=True,
+    )
+    hilo_escritura = threading.Thread(
+        target=_etapa_escritura,
+        args=(collection, bm25, dedup, manifest, cola_escritura, abortar, errores, stats),
+        name="ingest-escritura",
+        daemon=True,
+    )
+    hilo_embed.start()
+    hilo_escritura.start()
+
+    t_etapas = time.perf_counter()
+    try:
+        _etapa_extraccion(pendientes, workers, cola_embed, abortar, stats)
+        _poner(cola_embed, _FIN, abortar)
+        hilo_embed.join()
+        hilo_escritura.join()
+        if dedup is not None and not errores:
+            # "copias"/"fuentes" de los canónicos que han ganado o perdido copias
+            t0 = time.perf_counter()
+            dedup.actualizar_metadatos(collection)
+            stats.escritura_s += time.perf_counter() - t0
+        if not errores:
+            # Las cifras de la caché y de duplicados se leen antes de cerrarlas
+            _resumen(stats, dedup, cache, batchers, t_inicio, t_etapas)
+    except BaseException:
+        abortar.set()
+        raise
+    finally:
+        # Tras un error o Ctrl+C las etapas salen al acabar el lote que tengan
+        # entre manos; hasta entonces el hilo de escritura sigue tocando el manifest
+        hilo_embed.join()
+        hilo_escritura.join()
+        # Solo contiene archivos completamente escritos: siempre es seguro guardarlo
+        guardar_manifest(manifest)
+        if bm25 is not None:
+            bm25.guardar()
+        # Siempre: en rag_server run() se llama una y otra vez en el mismo proceso
+        if cache is not None:
+            cache.cerrar()
+        if dedup is not None:
+            dedup.cerrar()
+
+    if errores:
+        raise errores[0]
 
-        # Protección por tamaño (ej. > 200 MB)
-        file_size_mb = file_path.stat().st_size / (1024 * 1024)
-        print(f"   · Tamaño archivo: {file_size_mb:.2f} MB")
-        if file_size_mb > 200:
-            print("   ⚠ Archivo demasiado grande, se omite por seguridad.")
-            continue
-
-        try:
-            text = load_file(file_path)
-        except Exception as e:
-            print(f"   ⚠ Error leyendo el archivo: {e}")
-            continue
-
-        if not text or not text.strip():
-            print("   (Archivo sin texto útil, se omite)")
-            continue
+    print("\n✅ Ingesta completada. Tu base vectorial está lista.")
+    return stats
 
-        chunks = chunk_text(text, max_chars=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        if not chunks:
-            print("   (No se generaron chunks, se omite)")
-            continue
 
-        # Metadatos base
-        rel_path = file_path.relative_to(DOCS_DIR)
-        folder = str(rel_path.parent) if rel_path.parent != Path('.') else ""
-        ext = file_path.suffix.lower()
-        mtime = file_path.stat().st_mtime
-        mdate = datetime.fromtimestamp(mtime).strftime("%Y-%m-%d")
-
-        chunk_index_offset = 0
-
-        # Procesar en lotes
-        for start in range(0, len(chunks), BATCH_SIZE):
-            batch_chunks = chunks[start:start + BATCH_SIZE]
-
-            batch_ids = []
-            batch_metadatas = []
-            for i, _ in enumerate(batch_chunks):
-                idx = chunk_index_offset + i
-                batch_ids.append(str(uuid.uuid4()))
-                batch_metadatas.append({
-                    "source": str(file_path),
-                    "chunk_index": idx,
-                    "ext": ext,
-                    "folder": folder,
-                    "date": mdate,
-                })
-
-            chunk_index_offset += len(batch_chunks)
-
-            print(f"   · Lote de {len(batch_chunks)} chunks → generando embeddings...")
-            embeddings = embedder.encode(batch_chunks, show_progress_bar=False).tolist()
-
-            collection.add(
-                documents=batch_chunks,
-                embeddings=embeddings,
-                metadatas=batch_metadatas,
-                ids=batch_ids
-            )
-            print(f"   · Lote guardado en Chroma.")
+def _resumen(stats: IngestStats, dedup, cache, batchers, t_inicio: float, t_etapas: float):
+    stats.total_s = time.perf_counter() - t_inicio
+    print("\n📈 Resumen de la ingesta:")
+    print(f"   · Archivos guardados: {stats.archivos} (con error/omitidos: {stats.archivos_error})")
+    print(f"   · Chunks: {stats.chunks}")
+    if dedup is not None:
+        dedup.resumen()
+    print(f"   · Extracción (suma de procesos): {stats.extraccion_s:.1f} s")
+    for batcher in batchers:
+        batcher.resumen()
+    if cache is not None:
+        cache.resumen()
+    print(f"   · Escritura en Chroma: {stats.escritura_s:.1f} s")
+    print(f"   · Tiempo total: {stats.total_s:.1f} s (etapas: {time.perf_counter() - t_etapas:.1f} s)")
 
-            # Liberar memoria del lote
-            del batch_chunks, batch_ids, batch_metadatas, embeddings
-            gc.collect()
 
-    print("\n✅ Ingesta completada. Tu base vectorial está lista.")
+def main(full: bool = False, workers: int | None = None, paths=None) -> IngestStats:
+    """Compatibilidad con el antiguo punto de entrada (ver run())."""
+    return run(paths=paths, mode="full" if full else "incremental", workers=workers)
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingesta de documentos en Chroma")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="reprocesa todos los archivos aunque no hayan cambiado",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="procesos de extracción (por defecto INGEST_WORKERS de config.py)",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="archivos o carpetas dentro de docs a ingestar (por defecto, todo)",
+    )
+    args = parser.parse_args()
+    run(paths=args.paths or None, mode="full" if args.full else "incremental", workers=args.workers)
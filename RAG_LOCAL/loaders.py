@@ -0,0 +1,405 @@
+# loaders.py - Lectura de documentos (PDF, Office, txt/md) y troceado en chunks
+#
+# Separado de ingest.py para que los procesos del pool de extracción solo
+# importen esto (pypdf, python-docx, ...) y no chromadb ni sentence_transformers.
+import time
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+# Librerías para formatos específicos
+from pypdf import PdfReader
+from pptx import Presentation
+from openpyxl import load_workbook
+
+from config import MAX_FILE_MB, XLSX_FILAS_POR_BLOQUE, XLSX_MODO, CHUNKER, CHUNK_TOKENS
+from chunker import chunk_estructura, contador_tokens
+from manifest import rel_key, chunk_id, clave_carpeta, meta_fecha
+
+EXTENSIONES_SOPORTADAS = [".txt", ".md", ".pdf", ".docx", ".pptx", ".xlsx"]
+
+# Los loaders son generadores de segmentos (texto, metadatos): una página, una
+# diapositiva, un bloque de filas... Concatenando los textos sale el documento
+# entero (los separadores ya van dentro), pero nunca se tiene entero en memoria.
+
+TXT_BLOQUE = 1024 * 1024  # caracteres por lectura en .txt/.md
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _ajustar_overlap(max_chars: int, overlap: int, verbose: bool) -> tuple[int, int]:
+    if max_chars <= 0:
+        raise ValueError("max_chars debe ser > 0")
+
+    if overlap < 0:
+        overlap = 0
+    if overlap >= max_chars:
+        if verbose:
+            print(f"⚠ overlap ({overlap}) >= max_chars ({max_chars}), ajustando overlap automáticamente...")
+        overlap = max_chars - 1
+
+    step = max_chars - overlap  # cuánto avanzamos cada vez
+    if step <= 0:
+        step = 1
+    return overlap, step
+
+
+def chunk_stream(segmentos, max_chars: int, overlap: int, verbose: bool = False):
+    """
+    Como chunk_text pero sobre un flujo de segmentos (texto, metadatos):
+    genera (chunk, metadatos del segmento donde empieza el chunk) según va
+    llegando el texto. Solo guarda lo que aún puede formar parte de un chunk
+    (como mucho max_chars + el último segmento), así que la memoria no
+    depende del tamaño del archivo. Los chunks son idénticos a los de
+    chunk_text sobre el texto completo.
+    """
+    overlap, step = _ajustar_overlap(max_chars, overlap, verbose)
+
+    buf = ""
+    base = 0       # posición (en el documento) de buf[0]
+    inicio = 0     # posición del próximo chunk
+    metas = []     # [(posición donde empieza el segmento, metadatos)]
+
+    def meta_en(pos):
+        actual = {}
+        for desde, meta in metas:
+            if desde > pos:
+                break
+            actual = meta
+        return actual
+
+    for texto, meta in segmentos:
+        if not texto:
+            continue
+        metas.append((base + len(buf), meta))
+        buf += texto
+        while inicio + max_chars <= base + len(buf):
+            chunk = buf[inicio - base:inicio - base + max_chars].strip()
+            if chunk:
+                yield chunk, meta_en(inicio)
+            inicio += step
+        # Lo anterior a `inicio` ya no lo va a usar ningún chunk
+        if inicio > base:
+            buf = buf[inicio - base:]
+            base = inicio
+            vigentes = [m for m in metas if m[0] > base]
+            metas = [(base, meta_en(base))] + vigentes
+
+    while inicio < base + len(buf):
+        chunk = buf[inicio - base:inicio - base + max_chars].strip()
+        if chunk:
+            yield chunk, meta_en(inicio)
+        inicio += step
+
+
+def chunk_text(text: str, max_chars: int, overlap: int, verbose: bool = True):
+    """
+    Divide un texto largo en chunks con solapamiento por caracteres,
+    usando un cálculo seguro basado en pasos fijos.
+    No hay bucles infinitos.
+    """
+    overlap, step = _ajustar_overlap(max_chars, overlap, verbose)
+
+    if verbose:
+        print(f"   · Texto total: {len(text)} caracteres")
+        print(f"   · max_chars={max_chars}, overlap={overlap}, step={step}")
+
+    chunks = [c for c, _ in chunk_stream([(text, {})], max_chars, overlap)]
+
+    if verbose:
+        print(f"   · Chunks generados: {len(chunks)}")
+    return chunks
+
+
+def iter_txt_md(path: Path):
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for bloque in iter(lambda: f.read(TXT_BLOQUE), ""):
+            yield bloque, {}
+
+
+def iter_pdf(path: Path):
+    """Una página cada vez (metadato "page")."""
+    reader = PdfReader(str(path))
+    sep = ""
+    for i, page in enumerate(reader.pages):
+        try:
+            page_text = page.extract_text() or ""
+        except Exception:
+            page_text = ""
+        if page_text.strip():
+            yield f"{sep}[Página {i+1}]\n{page_text}", {"page": i + 1}
+            sep = "\n\n"
+
+
+def iter_docx(path: Path):
+    """
+    Párrafos de word/document.xml leídos con iterparse: no se construye el
+    árbol XML entero (python-docx lo carga todo). Incluye los párrafos de
+    las tablas.
+    """
+    sep = ""
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        for _, elem in ElementTree.iterparse(f, events=("end",)):
+            if elem.tag != f"{_W}p":
+                continue
+            partes = []
+            for nodo in elem.iter():
+                if nodo.tag == f"{_W}t":
+                    partes.append(nodo.text or "")
+                elif nodo.tag == f"{_W}tab":
+                    partes.append("\t")
+                elif nodo.tag in (f"{_W}br", f"{_W}cr"):
+                    partes.append("\n")
+            elem.clear()
+            txt = "".join(partes).strip()
+            if txt:
+                yield sep + txt, {}
+                sep = "\n"
+
+
+def iter_pptx(path: Path):
+    """Una diapositiva cada vez (metadato "slide")."""
+    prs = Presentation(str(path))
+    sep = ""
+    for i, slide in enumerate(prs.slides):
+        slide_parts = []
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                txt = shape.text.strip()
+                if txt:
+                    slide_parts.append(txt)
+        if slide_parts:
+            yield f"{sep}[Diapositiva {i+1}]\n" + "\n".join(slide_parts), {"slide": i + 1}
+            sep = "\n\n"
+
+
+def iter_xlsx(path: Path):
+    """Bloques de XLSX_FILAS_POR_BLOQUE filas (metadato "sheet"), en modo read_only."""
+    wb = load_workbook(filename=str(path), read_only=True, data_only=True)
+    try:
+        sep = ""
+        for sheet in wb.worksheets:
+            cabecera = f"{sep}[Hoja: {sheet.title}]\n"
+            bloque = []
+            for row in sheet.iter_rows(values_only=True):
+                vals = [str(c) for c in row if c is not None]
+                if not vals:
+                    continue
+                bloque.append(" | ".join(vals))
+                if len(bloque) >= XLSX_FILAS_POR_BLOQUE:
+                    yield cabecera + "\n".join(bloque), {"sheet": sheet.title}
+                    cabecera, bloque = "\n", []
+            if bloque:
+                yield cabecera + "\n".join(bloque), {"sheet": sheet.title}
+            if cabecera == "\n" or bloque:
+                sep = "\n\n"
+    finally:
+        wb.close()
+
+
+def _celdas(row) -> list[str]:
+    """Valores de una fila como texto, conservando las columnas vacías intermedias."""
+    vals = ["" if c is None else str(c).strip() for c in row]
+    while vals and not vals[-1]:
+        vals.pop()
+    return vals
+
+
+def chunks_xlsx(path: Path, limite: int, medir=len):
+    """
+    Chunks de filas completas (XLSX_MODO = "filas"): nunca se corta una fila
+    a la mitad y cada chunk repite la cabecera de su hoja (la primera fila no
+    vacía), así se entiende sin el resto del archivo. Genera (texto, metadatos)
+    con sheet, row_start y row_end (números de fila de Excel). El tamaño se
+    mide con `medir` (caracteres o tokens, ver trocear); una fila que sola ya
+    pasa del límite va en su propio chunk.
+    """
+    wb = load_workbook(filename=str(path), read_only=True, data_only=True)
+    try:
+        for sheet in wb.worksheets:
+            cabecera = None
+            filas, largo, desde = [], 0, None
+
+            def emitir():
+                texto = f"[Hoja: {sheet.title}]\n{cabecera}\n" + "\n".join(filas)
+                return texto, {"sheet": sheet.title, "row_start": desde, "row_end": hasta}
+
+            for n, row in enumerate(sheet.iter_rows(min_row=1, values_only=True), start=1):
+                vals = _celdas(row)
+                if not any(vals):
+                    continue
+                linea = " | ".join(vals)
+                if cabecera is None:
+                    cabecera = linea
+                    base = medir(f"[Hoja: {sheet.title}]\n{cabecera}\n")
+                    continue
+                n_linea = medir(linea) + 1
+                if filas and base + largo + n_linea > limite:
+                    yield emitir()
+                    filas, largo = [], 0
+                if not filas:
+                    desde = n
+                filas.append(linea)
+                largo += n_linea
+                hasta = n
+
+            if filas:
+                yield emitir()
+            elif cabecera is not None:
+                # Hoja con una sola fila: la cabecera es todo el contenido
+                yield f"[Hoja: {sheet.title}]\n{cabecera}", {"sheet": sheet.title}
+    finally:
+        wb.close()
+
+
+_LOADERS = {
+    ".txt": iter_txt_md,
+    ".md": iter_txt_md,
+    ".pdf": iter_pdf,
+    ".docx": iter_docx,
+    ".pptx": iter_pptx,
+    ".xlsx": iter_xlsx,
+}
+
+
+def iter_segmentos(path: Path):
+    """Generador de (texto, metadatos) según el tipo de archivo."""
+    loader = _LOADERS.get(path.suffix.lower())
+    if loader is None:
+        return iter(())
+    return loader(path)
+
+
+def load_file(path: Path) -> str:
+    """Texto completo del archivo (para archivos grandes usa iter_segmentos)."""
+    return "".join(texto for texto, _ in iter_segmentos(path))
+
+
+def metadatos_carpeta(rel_path: Path) -> dict:
+    """
+    Un metadato booleano por cada carpeta de la ruta (docs/seguridad/linux/x.pdf
+    → {"dir:seguridad": True, "dir:linux": True}). Chroma no puede buscar
+    subcadenas en metadatos, pero sí igualdades: así [carpeta:...] se resuelve
+    dentro de la consulta.
+    """
+    return {clave_carpeta(parte): True for parte in rel_path.parent.parts if parte.strip()}
+
+
+def trocear(file_path: Path, max_chars: int, overlap: int, segmentos=None):
+    """
+    Generador de (chunk, metadatos del segmento) con el troceado configurado:
+    CHUNKER = "estructura" (chunker.py, tamaño en CHUNK_TOKENS) o
+    "caracteres" (max_chars/overlap); los .xlsx con XLSX_MODO = "filas" van
+    siempre por filas enteras, medidas igual que el resto. `segmentos` permite
+    pasar los de iter_segmentos ya leídos (benchmark.py mide cada paso aparte).
+    """
+    por_tokens = CHUNKER == "estructura"
+    if XLSX_MODO == "filas" and file_path.suffix.lower() == ".xlsx":
+        if por_tokens:
+            return chunks_xlsx(file_path, CHUNK_TOKENS - 2, medir=contador_tokens())
+        return chunks_xlsx(file_path, max_chars)
+    if segmentos is None:
+        segmentos = iter_segmentos(file_path)
+    if por_tokens:
+        return chunk_estructura(segmentos, CHUNK_TOKENS)
+    return chunk_stream(segmentos, max_chars, overlap)
+
+
+def _base_meta(file_path: Path, docs_dir: Path) -> dict:
+    rel_path = file_path.relative_to(docs_dir)
+    folder = str(rel_path.parent) if rel_path.parent != Path('.') else ""
+
+    base_meta = {
+        "ext": file_path.suffix.lower(),
+        "folder": folder,
+        **meta_fecha(file_path.stat().st_mtime),
+    }
+    base_meta.update(metadatos_carpeta(rel_path))
+    return base_meta
+
+
+def extraer_por_partes(path_str: str, docs_dir_str: str, max_chars: int, overlap: int,
+                       chunks_por_parte: int | None = None):
+    """
+    Carga y trocea un archivo en streaming: genera resultados parciales de
+    como mucho `chunks_por_parte` chunks (None = una sola parte) (con sus IDs y metadatos), así un
+    archivo enorme nunca está entero en memoria.
+
+    Cada parte es un dict con path, size_mb, ids, chunks, metadatas, error,
+    omitido, segundos (de esa parte), parte (0, 1, ...) y ultima. La última
+    parte lleva ultima=True y total_chunks. Nunca lanza excepciones: un error
+    termina el archivo con una parte con "error" (y ultima=True).
+    """
+    file_path = Path(path_str)
+    docs_dir = Path(docs_dir_str)
+    t0 = time.perf_counter()
+    parte = 0
+    total = 0
+
+    def nueva():
+        return {
+            "path": path_str,
+            "size_mb": size_mb,
+            "ids": [],
+            "chunks": [],
+            "metadatas": [],
+            "error": None,
+            "omitido": None,
+            "segundos": 0.0,
+            "parte": parte,
+            "ultima": False,
+            "total_chunks": 0,
+        }
+
+    size_mb = 0.0
+    try:
+        size_mb = file_path.stat().st_size / (1024 * 1024)
+        if MAX_FILE_MB and size_mb > MAX_FILE_MB:
+            res = nueva()
+            res.update(omitido=f"Archivo de más de {MAX_FILE_MB} MB (MAX_FILE_MB), se omite.", ultima=True)
+            yield res
+            return
+
+        base_meta = _base_meta(file_path, docs_dir)
+        rel = rel_key(file_path, docs_dir)
+        res = nueva()
+        for chunk, meta_segmento in trocear(file_path, max_chars, overlap):
+            meta = {"source": str(file_path), "chunk_index": total}
+            meta.update(base_meta)
+            meta.update(meta_segmento)
+            res["ids"].append(chunk_id(rel, total))
+            res["chunks"].append(chunk)
+            res["metadatas"].append(meta)
+            total += 1
+            if chunks_por_parte and len(res["chunks"]) >= chunks_por_parte:
+                res["segundos"] = time.perf_counter() - t0
+                yield res
+                parte += 1
+                t0 = time.perf_counter()
+                res = nueva()
+    except Exception as e:
+        res = nueva()
+        res.update(error=f"Error leyendo el archivo: {e}", ultima=True, segundos=time.perf_counter() - t0)
+        yield res
+        return
+
+    res.update(ultima=True, total_chunks=total, segundos=time.perf_counter() - t0)
+    yield res
+
+
+def extraer_archivo(path_str: str, docs_dir_str: str, max_chars: int, overlap: int) -> dict:
+    """
+    Carga y trocea un archivo entero y prepara IDs + metadatos de sus chunks.
+
+    Pensada para ejecutarse en un proceso del pool de ingest.py: recibe y
+    devuelve solo tipos simples (picklables) y no imprime nada; el proceso
+    principal informa del resultado. Nunca lanza excepciones: los errores
+    vuelven en "error". Los archivos grandes van por extraer_por_partes.
+    """
+    resultado = None
+    segundos = 0.0
+    for res in extraer_por_partes(path_str, docs_dir_str, max_chars, overlap):
+        segundos += res["segundos"]
+        resultado = res
+    resultado["segundos"] = segundos
+    return resultado
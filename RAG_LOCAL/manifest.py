@@ -0,0 +1,197 @@
+# manifest.py - Registro persistente de lo que ya está ingestado en Chroma
+#
+# Guarda, por cada archivo de DOCS_DIR: tamaño, mtime, hash del contenido y los
+# IDs de sus chunks. Con eso ingest.py puede procesar solo lo nuevo/modificado
+# y borrar de Chroma los chunks de archivos que ya no existen.
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    MANIFEST_PATH,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    XLSX_MODO,
+    CHUNKER,
+    CHUNK_TOKENS,
+    DEDUP_ENABLED,
+    DEDUP_UMBRAL,
+    DEDUP_MIN_PALABRAS,
+    VECTOR_BACKEND,
+    SHARDING,
+    SHARDS,
+)
+from chunker import tipo_contador
+from embeddings import id_modelo
+
+MANIFEST_VERSION = 1
+
+# Súbelo cuando cambien los metadatos que genera loaders.extraer_archivo:
+# la siguiente ingesta incremental reprocesará todo para incluirlos.
+METADATA_VERSION = 6
+
+
+def rel_key(path: Path, base_dir: Path) -> str:
+    """Clave estable de un archivo: ruta relativa a DOCS_DIR con '/'."""
+    return path.relative_to(base_dir).as_posix()
+
+
+def meta_fecha(mtime: float) -> dict:
+    """Metadatos de fecha de los chunks de un archivo con ese mtime."""
+    mdatetime = datetime.fromtimestamp(mtime)
+    return {
+        "date": mdatetime.strftime("%Y-%m-%d"),
+        # Para filtros de fecha en el `where` de Chroma (solo compara números)
+        "date_ord": mdatetime.date().toordinal(),
+    }
+
+
+def hash_archivo(path: Path, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 del contenido, leyendo por bloques (no carga el archivo entero)."""
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(rel_path: str, chunk_index: int) -> str:
+    """
+    ID determinista de un chunk: mismo archivo + mismo índice → mismo ID.
+    Así una re-ingesta hace upsert en vez de duplicar.
+    """
+    return hashlib.sha1(f"{rel_path}#{chunk_index}".encode("utf-8")).hexdigest()
+
+
+def clave_carpeta(nombre: str) -> str:
+    """
+    Clave del metadato booleano que marca que un chunk está bajo una carpeta
+    con ese nombre: "dir:<nombre en minúsculas>". La usan la ingesta (al
+    escribir) y rag_core (al filtrar con [carpeta:...]).
+    """
+    return "dir:" + nombre.strip().lower()
+
+
+def _parametros_actuales() -> dict:
+    # Si cambia cualquiera de estos, los chunks guardados ya no son válidos
+    params = {
+        # torch y onnx dan los mismos vectores: cambiar entre ellos no obliga a re-ingestar
+        "embedding_model": id_modelo(),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "xlsx_modo": XLSX_MODO,
+        "chunker": CHUNKER,
+        "chunk_tokens": CHUNK_TOKENS,
+        "dedup": [DEDUP_ENABLED, DEDUP_UMBRAL, DEDUP_MIN_PALABRAS],
+        "vector_backend": VECTOR_BACKEND,
+        "metadata_version": METADATA_VERSION,
+    }
+    if CHUNKER == "estructura":
+        # Sin tokenizer en disco se estima el tamaño: los cortes salen distintos
+        params["contador_tokens"] = tipo_contador()
+    if SHARDING:
+        # Solo con SHARDING: sin él, los manifest de antes siguen valiendo
+        params["sharding"] = f"hash:{SHARDS}" if SHARDING == "hash" else SHARDING
+    return params
+
+
+def manifest_vacio() -> dict:
+    # "creado" distingue este manifest de uno borrado antes (clean / re-ingesta):
+    # su contador de generación vuelve a empezar en 0
+    return {"version": MANIFEST_VERSION, "params": _parametros_actuales(), "files": {},
+            "creado": time.time_ns(), "generacion": 0}
+
+
+def cargar_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return manifest_vacio()
+    try:
+        with MANIFEST_PATH.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠ Manifest ilegible ({e}), se reconstruirá desde cero.")
+        return manifest_vacio()
+    if data.get("version") != MANIFEST_VERSION or "files" not in data:
+        return manifest_vacio()
+    return data
+
+
+def guardar_manifest(manifest: dict):
+    """Escritura atómica: primero a un .tmp y luego os.replace()."""
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    manifest["params"] = _parametros_actuales()
+    tmp = MANIFEST_PATH.with_suffix(MANIFEST_PATH.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def anotar_cambio(manifest: dict):
+    """Se han escrito o borrado chunks: cambia la generación (y la huella de la caché de respuestas)."""
+    manifest["generacion"] = manifest.get("generacion", 0) + 1
+
+
+def generacion(manifest: dict) -> str:
+    return f"{manifest.get('creado', 0)}.{manifest.get('generacion', 0)}"
+
+
+def borrar_manifest():
+    try:
+        MANIFEST_PATH.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def params_cambiados(manifest: dict) -> bool:
+    return manifest.get("params") != _parametros_actuales()
+
+
+def detectar_cambios(files: list[Path], base_dir: Path, manifest: dict, forzar: bool = False):
+    """
+    Compara los archivos actuales con el manifest.
+
+    Devuelve (pendientes, sin_cambios, eliminados, redatados):
+      - pendientes: lista de (path, info) nuevos o modificados
+      - sin_cambios: claves de archivos que no hay que tocar
+      - eliminados: claves que están en el manifest pero ya no en disco
+      - redatados: claves (también en sin_cambios) con el mismo contenido
+        pero otro día de modificación: hay que cambiar la fecha de sus chunks
+
+    Primero compara tamaño + mtime (barato). Solo si difieren calcula el hash:
+    si el contenido es igual (p. ej. se copió el archivo) basta con actualizar
+    el mtime en el manifest y, si cambia el día, los metadatos de fecha.
+    Con forzar=True todo archivo cuenta como pendiente.
+    """
+    registrados = manifest.get("files", {})
+    pendientes = []
+    sin_cambios = []
+    redatados = []
+    vistos = set()
+
+    for path in files:
+        key = rel_key(path, base_dir)
+        vistos.add(key)
+        st = path.stat()
+        info = {"size": st.st_size, "mtime": st.st_mtime}
+        previo = registrados.get(key)
+
+        if (not forzar and previo
+                and previo["size"] == info["size"] and previo["mtime"] == info["mtime"]):
+            sin_cambios.append(key)
+            continue
+
+        info["sha256"] = hash_archivo(path)
+        if not forzar and previo and previo.get("sha256") == info["sha256"]:
+            if meta_fecha(previo["mtime"]) != meta_fecha(info["mtime"]):
+                redatados.append(key)
+            previo["mtime"] = info["mtime"]
+            sin_cambios.append(key)
+            continue
+
+        pendientes.append((path, info))
+
+    eliminados = [key for key in registrados if key not in vistos]
+    return pendientes, sin_cambios, eliminados, redatados
@@ -0,0 +1,148 @@
+# migrar_vectores.py - Pasa la colección 'docs' de Chroma al almacén int8 (o al revés)
+#
+#   python migrar_vectores.py                   # Chroma → int8 (VECTOR_STORE_DIR)
+#   python migrar_vectores.py --hacia chroma    # int8 → Chroma
+#   python migrar_vectores.py --sobrescribir    # vacía antes el destino si ya tiene chunks
+#
+# Copia IDs, documentos, metadatos y vectores tal cual, por tandas (no se
+# vuelve a embeber nada), entrena el índice IVF y deja el manifest con el
+# nuevo VECTOR_BACKEND para que la siguiente ingesta siga siendo incremental.
+# Después solo falta poner el mismo VECTOR_BACKEND en config.py. El origen no
+# se borra: para volver atrás basta con cambiar VECTOR_BACKEND otra vez.
+# Con SHARDING se copian todos los shards (los de shards.json), cada chunk a
+# su mismo shard en el otro almacén.
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+def _tamano_mb(rutas) -> float:
+    total = 0
+    for ruta in rutas:
+        if ruta.is_file():
+            total += ruta.stat().st_size
+        elif ruta.is_dir():
+            total += sum(p.stat().st_size for p in ruta.rglob("*") if p.is_file())
+    return total / 2**20
+
+
+def _rutas_chroma(chroma_dir: Path) -> list[Path]:
+    """chroma.sqlite3 y las carpetas (una por índice HNSW, con nombre UUID) de Chroma."""
+    if not chroma_dir.exists():
+        return []
+    return [p for p in chroma_dir.iterdir()
+            if p.name == "chroma.sqlite3" or (p.is_dir() and len(p.name) == 36 and p.name.count("-") == 4)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copia la colección entre Chroma y el almacén int8")
+    parser.add_argument("--hacia", choices=["int8", "chroma"], default="int8", help="almacén de destino (por defecto int8)")
+    parser.add_argument("--tanda", type=int, default=1000, help="chunks por lectura/escritura")
+    parser.add_argument("--sobrescribir", action="store_true", help="vacía el destino si ya tiene chunks")
+    args = parser.parse_args()
+
+    # config.py lee VECTOR_BACKEND al importarse: runtime.get_collection() dará el destino
+    os.environ["RAG_VECTOR_BACKEND"] = args.hacia
+    import numpy as np
+
+    import runtime
+    from config import CHROMA_DIR, SHARDING, VECTOR_STORE_DIR, VECTOR_IVF_MIN
+    from manifest import anotar_cambio, cargar_manifest, guardar_manifest, manifest_vacio
+    from vector_store import QuantizedCollection
+
+    nombre = runtime.COLECCION
+    ruta_int8 = VECTOR_STORE_DIR if SHARDING else VECTOR_STORE_DIR / nombre
+    abiertas = {}
+    lock = threading.Lock()
+
+    def abrir_origen(nombre_col: str):
+        """La colección (o el shard) en el almacén de origen, abierta una sola vez."""
+        with lock:
+            if nombre_col not in abiertas:
+                if args.hacia == "int8":
+                    abiertas[nombre_col] = runtime.get_client().get_collection(nombre_col)
+                else:
+                    if not (VECTOR_STORE_DIR / nombre_col / "datos.sqlite").exists():
+                        raise FileNotFoundError(f"no hay colección int8 en {VECTOR_STORE_DIR / nombre_col}")
+                    abiertas[nombre_col] = QuantizedCollection(VECTOR_STORE_DIR / nombre_col, nombre_col)
+            return abiertas[nombre_col]
+
+    try:
+        if SHARDING:
+            from shards import ShardedCollection
+
+            origen = ShardedCollection(abrir_origen, None, nombre)
+            origen.count()  # abre ya todos los shards: si falta alguno, se sabe antes de copiar
+        else:
+            origen = abrir_origen(nombre)
+    except Exception as e:
+        print(f"❌ No se pudo abrir la colección de origen: {e}")
+        return 1
+
+    destino = runtime.get_collection(nombre)
+    if destino.count():
+        if not args.sobrescribir:
+            print(f"❌ El destino ya tiene {destino.count()} chunks. Usa --sobrescribir para vaciarlo antes.")
+            return 1
+        destino = runtime.reset_collection(nombre, solo_vectores=True)
+
+    total = origen.count()
+    print(f"🚚 Copiando {total} chunks: {'Chroma → int8' if args.hacia == 'int8' else 'int8 → Chroma'}")
+    t0 = time.perf_counter()
+    copiados = 0
+    tanda = max(1, args.tanda)
+    for offset in range(0, total, tanda):
+        lote = origen.get(include=["documents", "metadatas", "embeddings"], limit=tanda, offset=offset)
+        if not lote["ids"]:
+            break
+        destino.upsert(
+            ids=lote["ids"],
+            documents=lote["documents"],
+            # Chroma no admite metadatos vacíos
+            metadatas=[m or None for m in lote["metadatas"]],
+            embeddings=np.asarray(lote["embeddings"], dtype=np.float32).tolist(),
+        )
+        copiados += len(lote["ids"])
+        print(f"   {copiados}/{total}", end="\r", flush=True)
+    print()
+
+    if args.hacia == "int8" and destino.count() >= VECTOR_IVF_MIN:
+        print("🧭 Entrenando el índice IVF con la colección completa...")
+        destino.entrenar()
+    segundos = time.perf_counter() - t0
+
+    if destino.count() != total:
+        print(f"⚠ El destino tiene {destino.count()} chunks y el origen {total}: revisa antes de cambiar config.py.")
+        return 1
+
+    # El manifest solo se da por bueno si lo único que cambia es el almacén
+    manifest = cargar_manifest()
+    previos, actuales = manifest.get("params", {}), manifest_vacio()["params"]
+    otros = sorted(c for c in set(previos) | set(actuales)
+                   if c != "vector_backend" and previos.get(c) != actuales.get(c))
+    if not manifest.get("files"):
+        print("ℹ No hay manifest de ingesta: la próxima ingesta procesará todo.")
+    elif otros:
+        print(f"⚠ Además del almacén cambiaron {', '.join(otros)}: la próxima ingesta será completa igualmente.")
+    else:
+        # Mismos chunks, otros vectores: las respuestas guardadas ya no valen
+        anotar_cambio(manifest)
+        guardar_manifest(manifest)
+        print("📝 Manifest actualizado: la próxima ingesta sigue siendo incremental.")
+
+    mb_chroma = _tamano_mb(_rutas_chroma(CHROMA_DIR))
+    mb_int8 = _tamano_mb([ruta_int8])
+    print(f"✅ {copiados} chunks copiados en {segundos:.1f} s · disco: Chroma {mb_chroma:.1f} MB · int8 {mb_int8:.1f} MB")
+    print(f'👉 Pon VECTOR_BACKEND = "{args.hacia}" en config.py (o RAG_VECTOR_BACKEND={args.hacia}).')
+    for col in [*abiertas.values(), *([origen] if SHARDING else [])]:
+        if hasattr(col, "cerrar"):
+            col.cerrar()
+    runtime.teardown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# ollama_async.py - Cliente asyncio de /api/chat de Ollama (para rag_server.py)
+#
+# Misma petición y mismas stats que ollama_client.stream_chat, pero sin
+# bloquear el event loop: mientras un modelo genera, el servidor sigue
+# atendiendo otras peticiones. Solo usa la librería estándar (HTTP/1.1 con
+# Transfer-Encoding: chunked, que es lo que devuelve Ollama en streaming).
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from config import OLLAMA_URL, OLLAMA_RETRIES, OLLAMA_RETRY_BACKOFF
+from ollama_client import TIMEOUT, payload_chat, leer_linea, rellenar_stats
+
+_CONNECT_TIMEOUT = 10
+
+
+async def _conectar(url):
+    """Abre la conexión con reintentos (backoff exponencial) si Ollama aún no escucha."""
+    puerto = url.port or (443 if url.scheme == "https" else 80)
+    contexto = ssl.create_default_context() if url.scheme == "https" else None
+    for intento in range(OLLAMA_RETRIES + 1):
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(url.hostname, puerto, ssl=contexto),
+                timeout=_CONNECT_TIMEOUT,
+            )
+        except (OSError, asyncio.TimeoutError):
+            if intento == OLLAMA_RETRIES:
+                raise
+            await asyncio.sleep(OLLAMA_RETRY_BACKOFF * (2 ** intento))
+
+
+async def _leer(lectura):
+    """Cada lectura con TIMEOUT, como el timeout de socket del cliente síncrono."""
+    return await asyncio.wait_for(lectura, timeout=TIMEOUT)
+
+
+async def _leer_cuerpo(reader, cabeceras: dict):
+    """Generador asíncrono con los bytes del cuerpo (chunked o Content-Length)."""
+    if cabeceras.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            tam = int((await _leer(reader.readline())).split(b";")[0].strip() or b"0", 16)
+            if tam == 0:
+                await _leer(reader.readline())
+                return
+            yield await _leer(reader.readexactly(tam))
+            await _leer(reader.readexactly(2))  # \r\n tras cada trozo
+    elif "content-length" in cabeceras:
+        yield await _leer(reader.readexactly(int(cabeceras["content-length"])))
+    else:
+        while True:
+            datos = await _leer(reader.read(65536))
+            if not datos:
+                return
+            yield datos
+
+
+async def stream_chat(modelo: str, messages: list[dict], stats: dict | None = None):
+    """Generador asíncrono de tokens; `stats` como en ollama_client.stream_chat."""
+    url = urlsplit(OLLAMA_URL)
+    cuerpo = json.dumps(payload_chat(modelo, messages)).encode("utf-8")
+    peticion = (
+        f"POST {url.path or '/'} HTTP/1.1\r\n"
+        f"Host: {url.netloc}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(cuerpo)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("ascii") + cuerpo
+
+    t0 = time.perf_counter()
+    t_primero = None
+    trozos = 0
+    final = {}
+
+    reader, writer = await _conectar(url)
+    try:
+        writer.write(peticion)
+        await writer.drain()
+
+        linea_estado = await _leer(reader.readline())
+        partes = linea_estado.decode("latin-1").split(" ", 2)
+        codigo = int(partes[1]) if len(partes) > 1 else 0
+        cabeceras = {}
+        while True:
+            linea = await _leer(reader.readline())
+            if linea in (b"\r\n", b"\n", b""):
+                break
+            nombre, _, valor = linea.decode("latin-1").partition(":")
+            cabeceras[nombre.strip().lower()] = valor.strip()
+
+        if codigo != 200:
+            texto = b"".join([d async for d in _leer_cuerpo(reader, cabeceras)])
+            raise RuntimeError(f"Ollama respondió {codigo}: {texto[:500].decode('utf-8', 'replace')}")
+
+        pendiente = b""
+        async for datos in _leer_cuerpo(reader, cabeceras):
+            pendiente += datos
+            *lineas, pendiente = pendiente.split(b"\n")
+            for line in lineas:
+                if not line.strip():
+                    continue
+                data = leer_linea(line)
+                token = data.get("message", {}).get("content", "")
+                if token:
+                    if t_primero is None:
+                        t_primero = time.perf_counter()
+                    trozos += 1
+                    yield token
+                if data.get("done"):
+                    final = data
+                    break
+            if final:
+                break
+    finally:
+        if stats is not None:
+            rellenar_stats(stats, t0, t_primero, trozos, final)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
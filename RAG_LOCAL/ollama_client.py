@@ -0,0 +1,227 @@
+# ollama_client.py - Cliente único de /api/chat de Ollama (streaming + sesión compartida)
+#
+# Ollama, con "stream": true, envía la respuesta como NDJSON: una línea JSON
+# por trozo de texto y una última con "done": true y sus contadores. Así el
+# primer token se puede mostrar en cuanto llega en vez de esperar a que el
+# modelo termine toda la respuesta.
+#
+# Todas las peticiones comparten una requests.Session con pool de conexiones
+# (keep-alive HTTP: no se abre una conexión TCP por pregunta) y reintentos con
+# backoff. Cada petición lleva "keep_alive" para que Ollama no descargue el
+# modelo entre preguntas.
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    OLLAMA_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_KEEP_ALIVE_POR_MODELO,
+    OLLAMA_RETRIES,
+    OLLAMA_RETRY_BACKOFF,
+    OLLAMA_POOL_SIZE,
+)
+
+TIMEOUT = 600
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Sesión HTTP compartida por todo el proceso (thread-safe)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=OLLAMA_RETRIES,
+                    connect=OLLAMA_RETRIES,
+                    read=0,  # una respuesta a medias no se reintenta
+                    backoff_factor=OLLAMA_RETRY_BACKOFF,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset(["GET", "POST"]),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=OLLAMA_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def cerrar_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def keep_alive_de(modelo: str):
+    """Cuánto tiempo debe mantener Ollama el modelo cargado tras la petición."""
+    return OLLAMA_KEEP_ALIVE_POR_MODELO.get(modelo, OLLAMA_KEEP_ALIVE)
+
+
+def stream_chat(modelo: str, messages: list[dict], stats: dict | None = None):
+    """
+    Generador que va devolviendo los tokens (trozos de texto) según llegan.
+
+    Si se pasa un dict en `stats`, al terminar (también si se corta antes,
+    p. ej. el usuario deja de leer) se rellena con:
+      ttft_s      → segundos hasta el primer token
+      total_s     → segundos totales de la petición
+      tokens      → tokens generados (eval_count de Ollama)
+      tokens_s    → tokens por segundo de generación
+    y, si Ollama los envía, con sus contadores (ver tracing.py):
+      ollama_carga_s, ollama_prompt_s, ollama_generacion_s, tokens_prompt
+    Si no llegó la línea final de Ollama, stats["interrumpido"] es True.
+    """
+    payload = payload_chat(modelo, messages)
+
+    t0 = time.perf_counter()
+    t_primero = None
+    trozos = 0
+    final = {}
+
+    try:
+        with get_session().post(OLLAMA_URL, json=payload, stream=True, timeout=TIMEOUT) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = leer_linea(line)
+
+                token = data.get("message", {}).get("content", "")
+                if token:
+                    if t_primero is None:
+                        t_primero = time.perf_counter()
+                    trozos += 1
+                    yield token
+
+                if data.get("done"):
+                    final = data
+                    break
+    finally:
+        if stats is not None:
+            rellenar_stats(stats, t0, t_primero, trozos, final)
+
+
+def payload_chat(modelo: str, messages: list[dict], stream: bool = True) -> dict:
+    return {
+        "model": modelo,
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": keep_alive_de(modelo),
+    }
+
+
+def leer_linea(line) -> dict:
+    """Una línea NDJSON de /api/chat; lanza si no es JSON o si Ollama devuelve error."""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        print("\n⚠ Respuesta NO-JSON desde Ollama (debug):\n")
+        print(line[:1000])
+        raise
+    if data.get("error"):
+        raise RuntimeError(f"Ollama devolvió un error: {data['error']}")
+    return data
+
+
+def rellenar_stats(stats: dict, t0: float, t_primero: float | None, trozos: int, final: dict):
+    """Calcula ttft_s, total_s, tokens, tokens_s y los contadores de Ollama (ver stream_chat)."""
+    t_fin = time.perf_counter()
+    if not final:
+        stats["interrumpido"] = True
+    stats["ttft_s"] = (t_primero or t_fin) - t0
+    stats["total_s"] = t_fin - t0
+    for campo, clave in (("load_duration", "ollama_carga_s"),
+                         ("prompt_eval_duration", "ollama_prompt_s"),
+                         ("eval_duration", "ollama_generacion_s")):
+        if final.get(campo) is not None:
+            stats[clave] = final[campo] / 1e9
+    if final.get("prompt_eval_count") is not None:
+        stats["tokens_prompt"] = final["prompt_eval_count"]
+    eval_count = final.get("eval_count")
+    eval_ns = final.get("eval_duration")
+    if eval_count and eval_ns:
+        stats["tokens"] = eval_count
+        stats["tokens_s"] = eval_count / (eval_ns / 1e9)
+    else:
+        # Versiones antiguas de Ollama sin contadores: medimos en el cliente
+        stats["tokens"] = trozos
+        # Entre el primer token y el último hay trozos - 1 intervalos
+        gen = t_fin - (t_primero or t_fin)
+        stats["tokens_s"] = (trozos - 1) / gen if trozos > 1 and gen > 0 else 0.0
+
+
+def chat(modelo: str, messages: list[dict], stats: dict | None = None) -> str:
+    """Versión sin streaming: devuelve la respuesta completa como texto."""
+    return "".join(stream_chat(modelo, messages, stats=stats)).strip()
+
+
+def precargar_modelo(modelo: str) -> bool:
+    """
+    Carga el modelo en Ollama sin generar nada (/api/chat con messages vacío)
+    y lo deja residente durante su keep_alive. Devuelve False si falla.
+    """
+    payload = payload_chat(modelo, [], stream=False)
+    try:
+        resp = get_session().post(OLLAMA_URL, json=payload, timeout=TIMEOUT)
+        resp.raise_for_status()
+        return True
+    except requests.RequestException:
+        return False
+
+
+def precargar_modelos(modelos: list[str], en_segundo_plano: bool = True):
+    """
+    Precarga varios modelos (en orden). En segundo plano no bloquea el inicio
+    de la consola: cuando el usuario termine de escribir la primera pregunta
+    el modelo ya estará en memoria.
+    """
+    modelos = list(dict.fromkeys(modelos))
+    if not modelos:
+        return None
+
+    def _trabajo():
+        for modelo in modelos:
+            precargar_modelo(modelo)
+
+    if not en_segundo_plano:
+        _trabajo()
+        return None
+
+    hilo = threading.Thread(target=_trabajo, name="ollama-warmup", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def imprimir_stream(tokens) -> str:
+    """Imprime los tokens según llegan y devuelve el texto completo."""
+    partes = []
+    for token in tokens:
+        print(token, end="", flush=True)
+        partes.append(token)
+    print()
+    return "".join(partes).strip()
+
+
+def formatear_stats(stats: dict) -> str:
+    if not stats:
+        return ""
+    return (
+        f"⏱ Primer token: {stats['ttft_s']:.2f} s · "
+        f"{stats['tokens_s']:.1f} tokens/s · "
+        f"total: {stats['total_s']:.1f} s"
+    )
@@ -0,0 +1,134 @@
+# query_batcher.py - Micro-lotes de consultas concurrentes (embedding + Chroma)
+#
+# Con varios usuarios a la vez (rag_server.py) o en evaluaciones por lotes,
+# cada pregunta hacía su propio encode([pregunta]) y su propia consulta a
+# Chroma: el modelo trabajaba con lotes de 1. Aquí un hilo recoge lo que van
+# pidiendo los demás hilos durante unos milisegundos (QUERY_BATCH_WAIT_MS),
+# lo resuelve en un único encode y en una única collection.query con varios
+# query_embeddings, y devuelve a cada hilo su parte a través de un Future.
+#
+# La ventana solo se espera si hay concurrencia (otros hilos esperando o la
+# tanda anterior tuvo más de una petición): una consola con un único usuario
+# no paga ni un milisegundo extra.
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import QUERY_BATCH_WAIT_MS, QUERY_BATCH_MAX
+
+# Claves de un resultado de collection.query que van "una lista por consulta"
+_CLAVES_POR_CONSULTA = ("ids", "documents", "metadatas", "distances", "embeddings", "uris", "data")
+
+_PARAR = object()
+
+
+class QueryBatcher:
+    def __init__(self, get_embedder, espera_ms: float = QUERY_BATCH_WAIT_MS,
+                 max_lote: int = QUERY_BATCH_MAX):
+        self._get_embedder = get_embedder
+        self.espera_s = espera_ms / 1000
+        self.max_lote = max(1, max_lote)
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._en_vuelo = 0
+        self._ultimo_lote = 1
+        self.stats = {"tandas": 0, "peticiones": 0, "max_tanda": 0}
+
+        self._hilo = threading.Thread(target=self._bucle, name="query-batcher", daemon=True)
+        self._hilo.start()
+
+    # ── API (bloqueante, se llama desde cualquier hilo) ───────
+
+    def embeber(self, texto: str) -> list[float]:
+        return self._pedir("embedding", None, texto)
+
+    def consultar(self, collection, embedding: list[float], n_results: int, where: dict | None = None) -> dict:
+        """Como collection.query con una sola pregunta (mismo formato de resultado)."""
+        clave = (id(collection), n_results, json.dumps(where, sort_keys=True))
+        return self._pedir("consulta", clave, (collection, embedding, n_results, where))
+
+    def cerrar(self):
+        self._cola.put(_PARAR)
+        self._hilo.join(timeout=5)
+
+    # ── Hilo de tandas ────────────────────────────────────────
+
+    def _pedir(self, tipo: str, clave, args):
+        futuro = Future()
+        with self._lock:
+            self._en_vuelo += 1
+        try:
+            self._cola.put((tipo, clave, args, futuro))
+            return futuro.result()
+        finally:
+            with self._lock:
+                self._en_vuelo -= 1
+
+    def _bucle(self):
+        while True:
+            primero = self._cola.get()
+            if primero is _PARAR:
+                return
+            tanda = [primero]
+
+            esperar = self.espera_s > 0 and (self._en_vuelo > 1 or self._ultimo_lote > 1)
+            limite = time.perf_counter() + (self.espera_s if esperar else 0)
+            parar = False
+            while len(tanda) < self.max_lote:
+                restante = limite - time.perf_counter()
+                try:
+                    item = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _PARAR:
+                    parar = True
+                    break
+                tanda.append(item)
+
+            self._ultimo_lote = len(tanda)
+            self.stats["tandas"] += 1
+            self.stats["peticiones"] += len(tanda)
+            self.stats["max_tanda"] = max(self.stats["max_tanda"], len(tanda))
+            self._procesar(tanda)
+            if parar:
+                return
+
+    def _procesar(self, tanda):
+        embeddings = [p for p in tanda if p[0] == "embedding"]
+        if embeddings:
+            try:
+                textos = [p[2] for p in embeddings]
+                vectores = self._get_embedder().encode(textos, batch_size=len(textos))
+                for p, v in zip(embeddings, vectores):
+                    p[3].set_result(v.tolist())
+            except Exception as e:
+                for p in embeddings:
+                    p[3].set_exception(e)
+
+        # Chroma solo admite un n_results y un where por llamada: se agrupa por ellos
+        grupos = {}
+        for p in tanda:
+            if p[0] == "consulta":
+                grupos.setdefault(p[1], []).append(p)
+        for grupo in grupos.values():
+            collection, _, n_results, where = grupo[0][2]
+            try:
+                res = collection.query(
+                    query_embeddings=[p[2][1] for p in grupo],
+                    n_results=n_results,
+                    where=where,
+                )
+                for i, p in enumerate(grupo):
+                    p[3].set_result({
+                        k: [res[k][i]] for k in _CLAVES_POR_CONSULTA if res.get(k) is not None
+                    })
+            except Exception as e:
+                for p in grupo:
+                    p[3].set_exception(e)
+
+    def resumen(self) -> str:
+        s = self.stats
+        media = s["peticiones"] / s["tandas"] if s["tandas"] else 0.0
+        return f"{s['peticiones']} peticiones en {s['tandas']} tandas (media {media:.1f}, máx {s['max_tanda']})"
@@ -1,44 +1,27 @@
 # rag_core.py
 import re
-import requests
+import time
 from datetime import datetime
 
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-
 from config import (
-    CHROMA_DIR,
-    EMBEDDING_MODEL_NAME,
-    OLLAMA_URL,
     TOP_K,
+    ANSWER_CACHE_ENABLED,
+    SHOW_RETRIEVAL_TIMINGS,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
 )
+from answer_cache import AnswerCache, huella_coleccion
+from chunker import ubicacion
+import hybrid_search
+import reranker
+from manifest import clave_carpeta
 from model_router import elegir_modelo
+from ollama_client import stream_chat, chat
+from runtime import get_collection
+import tracing
+from tracing import tramo
 
-_chroma_client = None
-_collection = None
-_embedder = None
-
-
-def get_embedder():
-    global _embedder
-    if _embedder is None:
-        print(f"🧠 Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}")
-        _embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-    return _embedder
-
-
-def get_collection():
-    global _chroma_client, _collection
-    if _chroma_client is None:
-        print(f"📚 Iniciando Chroma PersistentClient en: {CHROMA_DIR}")
-        _chroma_client = chromadb.PersistentClient(
-            path=str(CHROMA_DIR),
-            settings=Settings(anonymized_telemetry=False),
-        )
-    if _collection is None:
-        _collection = _chroma_client.get_or_create_collection(name="docs")
-    return _collection
+_answer_cache = None
 
 
 def parsear_filtros_y_pregunta(texto: str) -> tuple[dict, str]:
@@ -92,64 +75,115 @@ def parsear_filtros_y_pregunta(texto: str) -> tuple[dict, str]:
     return filtros, pregunta_limpia
 
 
-def buscar_contexto(pregunta: str, filtros: dict, k: int = TOP_K) -> list[dict]:
-    collection = get_collection()
-    embedder = get_embedder()
+def embeber_pregunta(pregunta: str) -> list[float]:
+    return hybrid_search.embeber_pregunta(pregunta)
 
-    pregunta_embedding = embedder.encode([pregunta]).tolist()[0]
 
-    results = collection.query(
-        query_embeddings=[pregunta_embedding],
-        n_results=max(k * 4, k),
+def construir_where(filtros: dict) -> dict | None:
+    """
+    Traduce los filtros de parsear_filtros_y_pregunta a un `where` de Chroma,
+    para que el top-k se calcule ya solo sobre los chunks que cumplen:
+      [type:pdf]           → {"ext": {"$in": [".pdf"]}}
+      [carpeta:seguridad]  → {"dir:seguridad": True}   (componente de la ruta)
+      [fecha>=2024-01-01]  → {"date_ord": {"$gte": <ordinal del día>}}
+    Varias carpetas se combinan con $or; filtros distintos con $and.
+    """
+    condiciones = []
+
+    if filtros["exts"]:
+        condiciones.append({"ext": {"$in": sorted(filtros["exts"])}})
+
+    if filtros["carpetas"]:
+        por_carpeta = []
+        for carpeta in sorted(filtros["carpetas"]):
+            # [carpeta:seguridad/linux] → ambas carpetas en la ruta
+            partes = [{clave_carpeta(p): True} for p in re.split(r"[\\/]+", carpeta) if p.strip()]
+            if partes:
+                por_carpeta.append(partes[0] if len(partes) == 1 else {"$and": partes})
+        if por_carpeta:
+            condiciones.append(por_carpeta[0] if len(por_carpeta) == 1 else {"$or": por_carpeta})
+
+    if filtros["fecha_desde"]:
+        condiciones.append({"date_ord": {"$gte": filtros["fecha_desde"].toordinal()}})
+    if filtros["fecha_hasta"]:
+        condiciones.append({"date_ord": {"$lte": filtros["fecha_hasta"].toordinal()}})
+
+    if not condiciones:
+        return None
+    if len(condiciones) == 1:
+        return condiciones[0]
+    return {"$and": condiciones}
+
+
+def buscar_contexto(pregunta: str, filtros: dict, k: int = TOP_K,
+                    pregunta_embedding: list[float] | None = None,
+                    tiempos: dict | None = None, verbose: bool = True) -> list[dict]:
+    """
+    Top-k chunks para la pregunta: vectorial + BM25 fusionados (ver
+    hybrid_search). Los filtros van dentro de la consulta, así el top-k se
+    calcula solo sobre los chunks que cumplen. Los iguales o casi iguales
+    se colapsan en uno (DEDUP_CONSULTA), así los k huecos son distintos. Con
+    RERANK_ENABLED se traen RERANK_CANDIDATES y el cross-encoder elige los k mejores.
+    Con SHARDING la consulta solo va a los shards que pueden tener chunks que
+    cumplan los filtros (sin [carpeta:...], a todos en paralelo; ver shards.py).
+    """
+    collection = get_collection()
+    if tiempos is None:
+        tiempos = {}
+    where = construir_where(filtros)
+    if hasattr(collection, "shards_para"):
+        tiempos["shards"] = f"{len(collection.shards_para(where))}/{len(collection.shards())}"
+
+    if pregunta_embedding is None:
+        t0 = time.perf_counter()
+        pregunta_embedding = embeber_pregunta(pregunta)
+        tiempos["embedding_ms"] = (time.perf_counter() - t0) * 1000
+
+    n = max(k, RERANK_CANDIDATES) if RERANK_ENABLED else k
+    context_chunks = hybrid_search.buscar(
+        collection, pregunta, pregunta_embedding, n,
+        where=where, tiempos=tiempos,
     )
+    if RERANK_ENABLED:
+        context_chunks = reranker.reordenar(pregunta, context_chunks, k, tiempos=tiempos)
 
-    docs = results.get("documents", [[]])[0]
-    metas = results.get("metadatas", [[]])[0]
-
-    context_chunks = []
-    for doc, meta in zip(docs, metas):
-        context_chunks.append({
-            "text": doc,
-            "metadata": meta,
-        })
+    if verbose and SHOW_RETRIEVAL_TIMINGS:
+        print(hybrid_search.formatear_tiempos(tiempos))
 
-    if not context_chunks:
-        return []
+    return context_chunks
 
-    filtrados = []
 
+def fuentes_de(context_chunks: list[dict]) -> list[str]:
+    """
+    Archivos de origen de los chunks, sin repetir y en orden de relevancia,
+    con las páginas/diapositivas usadas si se conocen ("informe.pdf (pág. 3, 7)")
+    y cuántos archivos más tienen el mismo texto (ver dedup.py).
+    """
+    paginas = {}
+    copias = {}
     for ch in context_chunks:
         meta = ch["metadata"]
-        ext = meta.get("ext", "").lower()
-        folder = meta.get("folder", "").lower()
-        date_str = meta.get("date")
-
-        if filtros["exts"] and ext not in filtros["exts"]:
+        src = meta.get("source")
+        if not src:
             continue
+        if meta.get("fuentes"):
+            copias.setdefault(src, set()).update(f for f in meta["fuentes"].split("\n") if f)
+        lista = paginas.setdefault(src, [])
+        for clave, etiqueta in (("page", "pág."), ("slide", "diap.")):
+            if meta.get(clave) is not None and (etiqueta, meta[clave]) not in lista:
+                lista.append((etiqueta, meta[clave]))
 
-        if filtros["carpetas"]:
-            folder_ok = any(c in folder for c in filtros["carpetas"])
-            source = meta.get("source", "").lower()
-            if not folder_ok and not any(c in source for c in filtros["carpetas"]):
-                continue
-
-        if (filtros["fecha_desde"] or filtros["fecha_hasta"]) and date_str:
-            try:
-                d = datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                d = None
-            if d:
-                if filtros["fecha_desde"] and d < filtros["fecha_desde"]:
-                    continue
-                if filtros["fecha_hasta"] and d > filtros["fecha_hasta"]:
-                    continue
-
-        filtrados.append(ch)
-
-    if not filtrados:
-        return []
-
-    return filtrados[:k]
+    fuentes = []
+    for src, lista in paginas.items():
+        texto = src
+        if lista:
+            numeros = ", ".join(str(n) for _, n in sorted(lista, key=lambda x: x[1]))
+            texto += f" ({lista[0][0]} {numeros})"
+        otros = copias.get(src, set()) - set(paginas)
+        if otros:
+            texto += f" · también en {len(otros)} archivo(s) más"
+        fuentes.append(texto)
+    return fuentes
 
 
 def construir_prompt(context_chunks: list[dict], pregunta: str) -> str:
@@ -162,9 +196,8 @@ def construir_prompt(context_chunks: list[dict], pregunta: str) -> str:
         for i, ch in enumerate(context_chunks, start=1):
             meta = ch["metadata"]
             src = meta.get("source", "desconocido")
-            idx = meta.get("chunk_index", "?")
             partes.append(
-                f"[FRAGMENTO {i} | {src} | chunk {idx}]\n{ch['text']}\n"
+                f"[FRAGMENTO {i} | {src} | {ubicacion(meta)}]\n{ch['text']}\n"
             )
         partes.append(
             "\nUsa estos fragmentos SOLO si son relevantes. "
@@ -182,68 +215,177 @@ def construir_prompt(context_chunks: list[dict], pregunta: str) -> str:
     return "\n".join(partes)
 
 
-def llamar_ollama(modelo: str, prompt: str) -> str:
-    # Payload para /api/chat sin streaming
-    payload = {
-        "model": modelo,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "Eres un asistente técnico. "
-                    "Si usas información de los fragmentos, cítala de forma clara. "
-                    "Si no hay información suficiente en el contexto, dilo."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
-        "stream": False,  # 👈 clave para que devuelva UN solo JSON
-    }
+SYSTEM_PROMPT = (
+    "Eres un asistente técnico. "
+    "Si usas información de los fragmentos, cítala de forma clara "
+    "(archivo y, si aparece en el fragmento, página, diapositiva u hoja). "
+    "Si no hay información suficiente en el contexto, dilo."
+)
 
-    # Tu OLLAMA_URL ya viene como "http://localhost:11434/api/chat"
-    url = OLLAMA_URL
 
-    resp = requests.post(url, json=payload, timeout=600)
-    resp.raise_for_status()
+def _mensajes(prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def llamar_ollama_stream(modelo: str, prompt: str, stats: dict | None = None):
+    """Generador de tokens de la respuesta (ver ollama_client.stream_chat)."""
+    return stream_chat(modelo, _mensajes(prompt), stats=stats)
 
-    # Intentamos parsear JSON, si falla mostramos el texto para debug
-    try:
-        data = resp.json()
-    except Exception:
-        print("\n⚠ Respuesta NO-JSON desde Ollama (debug):\n")
-        print(resp.text[:1000])
-        raise
 
-    # Estructura típica de /api/chat:
-    # {
-    #   "message": {
-    #       "role": "assistant",
-    #       "content": "texto..."
-    #   },
-    #   ...
-    # }
-    message = data.get("message", {})
-    content = message.get("content", "")
+def llamar_ollama(modelo: str, prompt: str, stats: dict | None = None) -> str:
+    """Versión sin streaming: espera la respuesta completa."""
+    return chat(modelo, _mensajes(prompt), stats=stats)
 
-    return content.strip()
 
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None and ANSWER_CACHE_ENABLED:
+        _answer_cache = AnswerCache()
+    return _answer_cache
 
 
-def responder(texto_usuario: str) -> tuple[str, str, list[str]]:
-    filtros, pregunta = parsear_filtros_y_pregunta(texto_usuario)
+def answer_cache_stats() -> dict | None:
+    """Aciertos/fallos de la caché semántica, sin abrirla (None si no se ha usado)."""
+    cache = _answer_cache
+    if cache is None:
+        return None
+    return {"aciertos": cache.hits, "fallos": cache.misses}
 
-    modelo = elegir_modelo(pregunta)
+
+def preparar_respuesta(texto_usuario: str, tiempos: dict | None = None) -> tuple[str, str, list[str], dict]:
+    """
+    Filtros + modelo + búsqueda de contexto.
+    Devuelve (modelo, prompt, fuentes, clave), donde `clave` son los datos
+    con los que se busca/guarda la respuesta en la caché semántica.
+    Si se pasa `tiempos`, se rellena con los ms de cada etapa (ver tracing.py).
+    """
+    if tiempos is None:
+        tiempos = {}
+    with tramo(tiempos, "filtros"):
+        filtros, pregunta = parsear_filtros_y_pregunta(texto_usuario)
+
+    with tramo(tiempos, "modelo"):
+        modelo = elegir_modelo(pregunta)
     print(f"🤖 Modelo elegido: {modelo}")
 
-    context_chunks = buscar_contexto(pregunta, filtros=filtros, k=TOP_K)
+    with tramo(tiempos, "embedding"):
+        pregunta_embedding = embeber_pregunta(pregunta)
+    context_chunks = buscar_contexto(
+        pregunta, filtros=filtros, k=TOP_K, pregunta_embedding=pregunta_embedding,
+        tiempos=tiempos,
+    )
 
-    fuentes = []
-    for ch in context_chunks:
-        src = ch["metadata"].get("source")
-        if src and src not in fuentes:
-            fuentes.append(src)
+    with tramo(tiempos, "prompt"):
+        fuentes = fuentes_de(context_chunks)
+        prompt = construir_prompt(context_chunks, pregunta)
+    clave = {
+        "pregunta": pregunta,
+        "embedding": pregunta_embedding,
+        "modelo": modelo,
+        "chunk_ids": [ch["id"] for ch in context_chunks],
+    }
+    return modelo, prompt, fuentes, clave
 
-    prompt = construir_prompt(context_chunks, pregunta)
-    respuesta = llamar_ollama(modelo, prompt)
+
+def buscar_en_cache(clave: dict) -> tuple[tuple | None, str | None]:
+    """
+    Busca la respuesta de `clave` (ver preparar_respuesta) en la caché semántica.
+    Devuelve (acierto, huella): acierto = (respuesta, fuentes, similitud) o None,
+    y la huella de la colección con la que se buscó (None sin caché), que es
+    la que hay que pasar a guardar_en_cache si se genera la respuesta.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None, None
+    huella = huella_coleccion(get_collection())
+    return cache.buscar(clave["embedding"], clave["modelo"], clave["chunk_ids"], huella), huella
+
+
+def guardar_en_cache(clave: dict, huella: str | None, respuesta: str, fuentes: list[str]):
+    """Guarda la respuesta generada para `clave` (no hace nada sin caché o sin huella)."""
+    cache = get_answer_cache()
+    if cache is None or huella is None:
+        return
+    cache.guardar(
+        clave["pregunta"], clave["embedding"], clave["modelo"], clave["chunk_ids"],
+        huella, respuesta, fuentes,
+    )
+
+
+def responder(texto_usuario: str, stats: dict | None = None,
+              origen: str = "consola") -> tuple[str, str, list[str]]:
+    """
+    Respuesta completa. `stats` se rellena como en responder_stream, con
+    stats["etapas"] = ms de cada etapa, y la pregunta queda en la traza.
+    """
+    if stats is None:
+        stats = {}
+    t0 = time.perf_counter()
+    tiempos = stats.setdefault("etapas", {})
+    modelo, prompt, fuentes, clave = preparar_respuesta(texto_usuario, tiempos)
+
+    with tramo(tiempos, "cache"):
+        acierto, huella = buscar_en_cache(clave)
+    if acierto:
+        print(f"⚡ Respuesta desde la caché semántica (similitud {acierto[2]:.3f})")
+        stats.update({"cache": True, "similitud": acierto[2], "total_s": time.perf_counter() - t0})
+        tracing.registrar(origen, modelo, clave["pregunta"], stats)
+        return modelo, acierto[0], fuentes
+
+    respuesta = llamar_ollama(modelo, prompt, stats=stats)
+    guardar_en_cache(clave, huella, respuesta, fuentes)
+    tracing.registrar(origen, modelo, clave["pregunta"], stats)
 
     return modelo, respuesta, fuentes
+
+
+def _guardar_al_terminar(tokens, clave: dict, huella: str, fuentes: list[str]):
+    """Pasa los tokens tal cual y, si el stream termina bien, guarda la respuesta."""
+    partes = []
+    for token in tokens:
+        partes.append(token)
+        yield token
+    guardar_en_cache(clave, huella, "".join(partes).strip(), fuentes)
+
+
+def _trazar_al_terminar(tokens, stats: dict, origen: str, modelo: str, pregunta: str):
+    """Pasa los tokens tal cual y escribe la traza al terminar, aunque se corte antes."""
+    try:
+        yield from tokens
+    finally:
+        # Al cerrar este generador, yield from cierra antes el de Ollama:
+        # stats ya tiene lo que se llegó a medir
+        tracing.registrar(origen, modelo, pregunta, stats)
+
+
+def responder_stream(texto_usuario: str, stats: dict | None = None, origen: str = "consola"):
+    """
+    Igual que responder() pero la respuesta es un generador de tokens.
+    Devuelve (modelo, tokens, fuentes); `stats` se rellena al agotar `tokens`.
+    Si la respuesta sale de la caché semántica, stats["cache"] es True.
+    """
+    if stats is None:
+        stats = {}
+    t0 = time.perf_counter()
+    tiempos = stats.setdefault("etapas", {})
+    modelo, prompt, fuentes, clave = preparar_respuesta(texto_usuario, tiempos)
+
+    with tramo(tiempos, "cache"):
+        acierto, huella = buscar_en_cache(clave)
+    if acierto:
+        stats.update({
+            "cache": True,
+            "similitud": acierto[2],
+            "total_s": time.perf_counter() - t0,
+        })
+        tracing.registrar(origen, modelo, clave["pregunta"], stats)
+        return modelo, iter([acierto[0]]), fuentes
+
+    tokens = llamar_ollama_stream(modelo, prompt, stats=stats)
+    if huella is not None:
+        tokens = _guardar_al_terminar(tokens, clave, huella, fuentes)
+    tokens = _trazar_al_terminar(tokens, stats, origen, modelo, clave["pregunta"])
+    return modelo, tokens, fuentes
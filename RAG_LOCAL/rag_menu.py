@@ -1,29 +1,26 @@
 # rag_menu.py - Menú principal del RAG local
 
-import os
 import sys
-import time
 
-# Importamos las funciones que ya tienes
-try:
-    from re_ingest import main as re_ingest_main
-except ImportError:
-    re_ingest_main = None
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+if PROFILE_STARTUP:
+    import startup_profile
+    startup_profile.activar()
 
-try:
-    from clean_collection import main as clean_collection_main
-except ImportError:
-    clean_collection_main = None
+import importlib
+import os
+import time
 
-try:
-    from count_collection import main as count_collection_main
-except ImportError:
-    count_collection_main = None
 
-try:
-    from smart_query import smart_ask
-except ImportError:
-    smart_ask = None
+# Las funciones de cada opción se importan al elegirla, no al arrancar:
+# chromadb y sentence_transformers/torch tardan varios segundos en importarse
+# y el menú debe aparecer al instante.
+def _cargar(modulo: str, funcion: str):
+    try:
+        return getattr(importlib.import_module(modulo), funcion)
+    except (ImportError, AttributeError) as e:
+        print(f"⚠ No se pudo cargar {modulo}.{funcion}: {e}")
+        return None
 
 
 def clear_screen():
@@ -37,16 +34,33 @@ def pause(msg: str = "\nPresiona ENTER para volver al menú..."):
 def option_re_ingest():
     clear_screen()
     print("🔄 RE-INGESTAR DOCUMENTOS\n")
+    re_ingest_main = _cargar("re_ingest", "main")
     if re_ingest_main is None:
         print("⚠ No se encontró re_ingest.py o su función main().")
     else:
-        re_ingest_main()
+        from config import SHARDING
+
+        # Con shards se puede rehacer solo uno (ver "Contar documentos/chunks")
+        shard = input("Shard o carpeta a re-ingestar (ENTER = todo): ").strip() if SHARDING else ""
+        re_ingest_main(shard=shard or None)
+    pause()
+
+
+def option_incremental_ingest():
+    clear_screen()
+    print("➕ INGESTA INCREMENTAL (solo archivos nuevos/modificados/eliminados)\n")
+    ingest_run = _cargar("ingest", "run")
+    if ingest_run is None:
+        print("⚠ No se encontró ingest.py o su función run().")
+    else:
+        ingest_run(mode="incremental")
     pause()
 
 
 def option_clean_collection():
     clear_screen()
     print("🧹 LIMPIAR COLECCIÓN 'docs'\n")
+    clean_collection_main = _cargar("clean_collection", "main")
     if clean_collection_main is None:
         print("⚠ No se encontró clean_collection.py o su función main().")
     else:
@@ -57,6 +71,7 @@ def option_clean_collection():
 def option_count_collection():
     clear_screen()
     print("📊 CONTAR DOCUMENTOS/CHUNKS EN 'docs'\n")
+    count_collection_main = _cargar("count_collection", "main")
     if count_collection_main is None:
         print("⚠ No se encontró count_collection.py o su función main().")
     else:
@@ -64,11 +79,21 @@ def option_count_collection():
     pause()
 
 
+def option_trace_stats():
+    clear_screen()
+    print("⏱ TIEMPOS POR ETAPA (trazas de las últimas preguntas)\n")
+    tracing = importlib.import_module("tracing")
+    print(tracing.formatear_resumen(tracing.resumen(tracing.leer())))
+    print(f"\n   Trazas en: {tracing.TRACE_LOG_PATH}")
+    pause()
+
+
 def option_chat_mode():
     clear_screen()
     print("💬 MODO CHAT CON EL RAG")
     print("Escribe tus preguntas. Escribe 'salir' para volver al menú.\n")
 
+    smart_ask = _cargar("smart_query", "smart_ask")
     if smart_ask is None:
         print("⚠ No se encontró smart_query.py o la función smart_ask.")
         pause()
@@ -91,6 +116,7 @@ def option_single_question():
     clear_screen()
     print("❓ PREGUNTA ÚNICA AL RAG\n")
 
+    smart_ask = _cargar("smart_query", "smart_ask")
     if smart_ask is None:
         print("⚠ No se encontró smart_query.py o la función smart_ask.")
         pause()
@@ -128,9 +154,48 @@ def option_ui_console():
     pause("\nui_console.py ha terminado. Presiona ENTER para volver al menú...")
 
 
+def warmup_ollama():
+    """Precarga en segundo plano los modelos de OLLAMA_WARMUP_MODELS (si está activado)."""
+    try:
+        from config import OLLAMA_WARMUP, OLLAMA_WARMUP_MODELS
+        from ollama_client import precargar_modelos
+    except ImportError:
+        return
+    if OLLAMA_WARMUP:
+        precargar_modelos(OLLAMA_WARMUP_MODELS)
+
+
+def warmup_embedder():
+    """Carga embeddings + Chroma en un hilo mientras el usuario elige opción."""
+    try:
+        from config import EMBEDDER_WARMUP
+        import runtime
+    except ImportError:
+        return
+    if EMBEDDER_WARMUP:
+        runtime.warmup_en_segundo_plano()
+
+
+def teardown_runtime():
+    """Libera el modelo de embeddings y Chroma (compartidos por todas las opciones)."""
+    runtime = sys.modules.get("runtime")
+    if runtime is not None:
+        runtime.teardown()
+
+
 def main_menu():
     os.system("title RAG LOCAL - MENU") if os.name == "nt" else None
 
+    if PROFILE_STARTUP:
+        startup_profile.informe("Arranque del menú (hasta poder dibujarlo)")
+        startup_profile.medir_diferidos(
+            ["ollama_client", "smart_query", "ingest", "chromadb", "sentence_transformers", "onnxruntime"]
+        )
+        return
+
+    warmup_ollama()
+    warmup_embedder()
+
     while True:
         clear_screen()
         print("══════════════════════════════════════════")
@@ -143,9 +208,11 @@ def main_menu():
         print(" 5) Pregunta única rápida con el RAG")
         print(" 6) Salir")
         print(" 7) Abrir ui_console.py (consola avanzada)")   # ← AGREGADO
+        print(" 8) Ingesta incremental (solo cambios)")
+        print(" 9) Tiempos por etapa (p50/p95 de las trazas)")
         print("══════════════════════════════════════════")
 
-        choice = input("Selecciona una opción (1-7): ").strip()
+        choice = input("Selecciona una opción (1-9): ").strip()
 
         if choice == "1":
             option_re_ingest()
@@ -158,11 +225,16 @@ def main_menu():
         elif choice == "5":
             option_single_question()
         elif choice == "6":
+            teardown_runtime()
             print("\nSaliendo del menú RAG. ¡Hasta luego! 👋")
             time.sleep(1)
             break
         elif choice == "7":
             option_ui_console()   # ← AGREGADO
+        elif choice == "8":
+            option_incremental_ingest()
+        elif choice == "9":
+            option_trace_stats()
         else:
             print("\n⚠ Opción inválida. Intenta de nuevo.")
             time.sleep(1.2)
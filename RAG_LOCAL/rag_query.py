@@ -1,40 +1,22 @@
 # rag_query.py - RAG sobre Chroma usando phi4 como modelo principal
 
 import textwrap
-
-import chromadb
-import requests
-from sentence_transformers import SentenceTransformer
+import time
 
 from config import (
-    CHROMA_DIR,
-    EMBEDDING_MODEL_NAME,
     TOP_K,
-    OLLAMA_URL,
     MODEL_MAIN,  # aquí tienes "phi4:14b-q4_K_M"
+    SHOW_RETRIEVAL_TIMINGS,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
 )
+import hybrid_search
+import reranker
+from chunker import ubicacion
+from ollama_client import stream_chat, chat, imprimir_stream, formatear_stats
 
-
-# 🔁 Opcional: cache simple para no recargar el modelo cada vez
-_embedder = None
-_collection = None
-
-
-def get_embedder():
-    global _embedder
-    if _embedder is None:
-        print(f"🧠 Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}...")
-        _embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-    return _embedder
-
-
-def get_collection():
-    global _collection
-    if _collection is None:
-        print(f"📚 Conectando a Chroma en: {CHROMA_DIR}")
-        client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-        _collection = client.get_or_create_collection("docs")
-    return _collection
+# Embedder y colección compartidos con rag_core (ver runtime.py)
+from runtime import get_collection
 
 
 def _build_context(docs, metadatas):
@@ -50,19 +32,14 @@ def _build_context(docs, metadatas):
     context_parts = []
     for idx, (doc, meta) in enumerate(zip(docs[0], metadatas[0])):
         source = meta.get("source", "desconocido")
-        chunk_index = meta.get("chunk_index", "N/A")
         context_parts.append(
-            f"[Fragmento {idx+1} | chunk {chunk_index} | fuente: {source}]\n{doc}"
+            f"[Fragmento {idx+1} | {ubicacion(meta)} | fuente: {source}]\n{doc}"
         )
 
     return "\n\n".join(context_parts)
 
 
-def _call_ollama_rag(model: str, context: str, question: str) -> str:
-    """
-    Llama al modelo vía Ollama usando el contexto recuperado de Chroma.
-    Usa MODEL_MAIN (phi4) por defecto.
-    """
+def _build_messages(context: str, question: str) -> list[dict]:
     system_prompt = (
         "Eres un asistente especializado que responde basándote en el CONTEXTO "
         "proporcionado. Si la respuesta no está claramente respaldada por el contexto, "
@@ -91,87 +68,116 @@ def _call_ollama_rag(model: str, context: str, question: str) -> str:
         """
     ).strip()
 
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "stream": False,
-    }
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=600)
-    resp.raise_for_status()
-    data = resp.json()
-    msg = data.get("message", {})
-    text = msg.get("content", "") or ""
-    return text.strip()
 
+def _call_ollama_rag(model: str, context: str, question: str) -> str:
+    """
+    Llama al modelo vía Ollama usando el contexto recuperado de Chroma.
+    Usa MODEL_MAIN (phi4) por defecto.
+    """
+    return chat(model, _build_messages(context, question))
 
-def rag_query(question: str) -> str:
+
+def _stream_ollama_rag(model: str, context: str, question: str, stats: dict | None = None):
+    """Como _call_ollama_rag pero devuelve un generador de tokens."""
+    return stream_chat(model, _build_messages(context, question), stats=stats)
+
+
+NO_CONTEXT_ANSWER = "No encontré información relevante en tus documentos para responder esta pregunta."
+
+
+def _retrieve_context(question: str) -> str:
     """
-    Hace una consulta RAG:
-    - Embebe la pregunta
-    - Recupera TOP_K fragmentos relevantes de Chroma
-    - Llama a phi4 (MODEL_MAIN) con el contexto
-    - Devuelve la respuesta en texto
+    Embebe la pregunta, recupera TOP_K fragmentos de Chroma y construye el
+    bloque de contexto. Devuelve "" si no hay fragmentos.
     """
     question = question.strip()
     if not question:
         raise ValueError("La pregunta no puede estar vacía.")
 
-    embedder = get_embedder()
     collection = get_collection()
 
     print(f"\n🔎 Pregunta al RAG: {question}\n")
 
     # 1) Embedding de la pregunta
-    query_embedding = embedder.encode([question]).tolist()
-
-    # 2) Consulta a Chroma
-    results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=TOP_K,
-        include=["documents", "metadatas", "distances"],
-    )
-
-    docs = results.get("documents", [[]])
-    metadatas = results.get("metadatas", [[]])
-    distances = results.get("distances", [[]])
-
-    if not docs or not docs[0]:
+    t0 = time.perf_counter()
+    query_embedding = hybrid_search.embeber_pregunta(question)
+    tiempos = {"embedding_ms": (time.perf_counter() - t0) * 1000}
+
+    # 2) Búsqueda híbrida (vectorial + BM25) en Chroma
+    n = max(TOP_K, RERANK_CANDIDATES) if RERANK_ENABLED else TOP_K
+    chunks = hybrid_search.buscar(collection, question, query_embedding, n, tiempos=tiempos)
+    if RERANK_ENABLED:
+        chunks = reranker.reordenar(question, chunks, TOP_K, tiempos=tiempos)
+    if SHOW_RETRIEVAL_TIMINGS:
+        print(hybrid_search.formatear_tiempos(tiempos))
+
+    if not chunks:
         print("⚠ No se encontraron fragmentos relevantes en la base vectorial.")
-        return "No encontré información relevante en tus documentos para responder esta pregunta."
+        return ""
 
-    print(f"📄 Fragmentos recuperados: {len(docs[0])}")
-    # Opcional: mostrar distancias si quieres depurar
-    # print("Distancias:", distances[0])
+    print(f"📄 Fragmentos recuperados: {len(chunks)}")
 
     # 3) Construir contexto
-    context = _build_context(docs, metadatas)
+    docs = [[ch["text"] for ch in chunks]]
+    metadatas = [[ch["metadata"] for ch in chunks]]
+    return _build_context(docs, metadatas)
+
+
+def rag_query(question: str) -> str:
+    """
+    Hace una consulta RAG:
+    - Embebe la pregunta
+    - Recupera TOP_K fragmentos relevantes de Chroma
+    - Llama a phi4 (MODEL_MAIN) con el contexto
+    - Devuelve la respuesta en texto
+    """
+    context = _retrieve_context(question)
+    if not context:
+        return NO_CONTEXT_ANSWER
 
     # 4) Llamar al modelo principal (phi4) vía Ollama
     print(f"🤖 Consultando modelo RAG: {MODEL_MAIN} (Ollama)...\n")
-    answer = _call_ollama_rag(MODEL_MAIN, context, question)
+    answer = _call_ollama_rag(MODEL_MAIN, context, question.strip())
 
     return answer
 
 
+def rag_query_stream(question: str, stats: dict | None = None):
+    """
+    Igual que rag_query pero devuelve un generador de tokens.
+    Si no hay contexto, el generador produce solo el aviso correspondiente.
+    """
+    context = _retrieve_context(question)
+    if not context:
+        return iter([NO_CONTEXT_ANSWER])
+
+    print(f"🤖 Consultando modelo RAG: {MODEL_MAIN} (Ollama)...\n")
+    return _stream_ollama_rag(MODEL_MAIN, context, question.strip(), stats=stats)
+
+
 def ask_rag(question: str):
     """
     Envoltorio cómodo para usar desde otros scripts (ej: smart_query, pruebas en consola).
-    Imprime la respuesta formateada y la devuelve.
+    Imprime la respuesta en streaming (según llega de Ollama) y la devuelve.
     """
+    stats = {}
     try:
-        answer = rag_query(question)
+        tokens = rag_query_stream(question, stats=stats)
+        print("\n🧠 RESPUESTA DEL RAG:")
+        print("───────────────────────")
+        answer = imprimir_stream(tokens)
     except Exception as e:
         print(f"❌ Error en RAG: {e}")
         return None
 
-    print("\n🧠 RESPUESTA DEL RAG:")
-    print("───────────────────────")
-    print(answer)
     print("───────────────────────")
+    if stats:
+        print(formatear_stats(stats))
     return answer
 
 
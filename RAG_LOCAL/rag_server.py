@@ -0,0 +1,431 @@
+# rag_server.py - API HTTP local del RAG (asyncio, solo librería estándar)
+#
+# Varios usuarios/scripts pueden preguntar a la vez sin pelearse por una
+# terminal. Endpoints:
+#   POST /query   {"pregunta": "...", "modo": "rag"|"smart"}  → JSON con la respuesta
+#   POST /stream  igual, pero devuelve NDJSON: un evento "inicio", una línea
+#                 por token y un evento "fin" con las stats
+#   POST /ingest  {"modo": "incremental"|"full", "paths": [...]}  → IngestStats
+#   GET  /stats   contadores del servidor, colas por modelo y latencias
+#
+# modo "rag" = rag_core (filtros [type:..], router de modelos, caché semántica);
+# modo "smart" = smart_query (charla / código / documentos).
+#
+# Embeddings, Chroma e ingesta van a un pool de hilos; Ollama se llama con
+# el cliente asyncio de ollama_async.py. Cada modelo tiene un semáforo
+# (OLLAMA_CONCURRENCIA_POR_MODELO): una pregunta larga a phi4 no bloquea las
+# de llama3.1, y Ollama no recibe más peticiones de las que puede atender.
+#
+# Uso:  python rag_server.py [--host 127.0.0.1] [--port 8765]
+#       curl -N -d '{"pregunta": "[type:pdf] resume la política"}' localhost:8765/stream
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from functools import partial
+
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_THREADS,
+    SERVER_MAX_BODY_KB,
+    SERVER_READ_TIMEOUT,
+    OLLAMA_CONCURRENCIA_POR_MODELO,
+    OLLAMA_CONCURRENCIA_DEFECTO,
+    OLLAMA_WARMUP,
+    OLLAMA_WARMUP_MODELS,
+    EMBEDDER_WARMUP,
+)
+import ollama_async
+import runtime
+import tracing
+
+_ESTADOS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ErrorPeticion(Exception):
+    def __init__(self, codigo: int, mensaje: str):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def _percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+class RagServer:
+    def __init__(self, hilos: int = SERVER_THREADS):
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="rag-server")
+        self.inicio = time.time()
+        self._semaforos = {}
+        self._ingesta = asyncio.Lock()
+        self.peticiones = Counter()   # ruta → nº
+        self.errores = 0
+        self.en_curso = 0
+        self.esperando = Counter()    # modelo → peticiones esperando turno
+        self.generando = Counter()    # modelo → peticiones en Ollama
+        self.latencias = deque(maxlen=1000)  # segundos de /query y /stream completos
+
+    # ── Utilidades ────────────────────────────────────────────
+
+    async def en_hilo(self, fn, *args, **kwargs):
+        """Ejecuta código bloqueante (embeddings, Chroma, SQLite) en el pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, partial(fn, *args, **kwargs))
+
+    def semaforo(self, modelo: str) -> asyncio.Semaphore:
+        if modelo not in self._semaforos:
+            limite = OLLAMA_CONCURRENCIA_POR_MODELO.get(modelo, OLLAMA_CONCURRENCIA_DEFECTO)
+            self._semaforos[modelo] = asyncio.Semaphore(limite)
+        return self._semaforos[modelo]
+
+    # ── Respuesta (común a /query y /stream) ──────────────────
+
+    async def _preparar(self, pregunta: str, modo: str, tiempos: dict):
+        """
+        Devuelve (inicio, mensajes, cache, acierto) según el modo; `cache` es
+        (clave, huella) para guardar la respuesta o None. `tiempos` se rellena por etapa.
+        """
+        if modo == "smart":
+            from smart_query import clasificar, _chat_messages
+            from rag_query import _retrieve_context, _build_messages, NO_CONTEXT_ANSWER
+
+            ruta, modelo, q = clasificar(pregunta)
+            if ruta == "vacia":
+                raise ErrorPeticion(400, "La pregunta está vacía")
+            inicio = {"evento": "inicio", "modo": modo, "ruta": ruta, "modelo": modelo, "fuentes": []}
+            if ruta != "rag":
+                return inicio, _chat_messages(q), None, None
+            context = await self.en_hilo(_retrieve_context, q)
+            if not context:
+                return inicio, None, None, (NO_CONTEXT_ANSWER, None)
+            return inicio, _build_messages(context, q), None, None
+
+        if modo != "rag":
+            raise ErrorPeticion(400, f"modo desconocido: {modo!r} (usa 'rag' o 'smart')")
+        if not pregunta.strip():
+            raise ErrorPeticion(400, "La pregunta está vacía")
+
+        import rag_core
+
+        modelo, prompt, fuentes, clave = await self.en_hilo(rag_core.preparar_respuesta, pregunta, tiempos)
+        inicio = {"evento": "inicio", "modo": modo, "ruta": "rag", "modelo": modelo, "fuentes": fuentes}
+        t_cache = time.perf_counter()
+        acierto, huella = await self.en_hilo(rag_core.buscar_en_cache, clave)
+        tiempos["cache_ms"] = (time.perf_counter() - t_cache) * 1000
+        if acierto:
+            return inicio, None, None, (acierto[0], acierto[2])
+        return inicio, rag_core._mensajes(prompt), (clave, huella) if huella is not None else None, None
+
+    async def eventos(self, pregunta: str, modo: str):
+        """Generador asíncrono: evento inicio, {"token": ...} por trozo y evento fin."""
+        t0 = time.perf_counter()
+        tiempos = {}
+        inicio, mensajes, cache, acierto = await self._preparar(pregunta, modo, tiempos)
+        yield inicio
+
+        if acierto is not None:
+            texto, similitud = acierto
+            yield {"token": texto}
+            stats = {"total_s": time.perf_counter() - t0}
+            if tiempos:
+                stats["etapas"] = tiempos
+            if similitud is not None:
+                stats.update({"cache": True, "similitud": similitud})
+                tracing.registrar("servidor", inicio["modelo"], pregunta, stats)
+            yield {"evento": "fin", "stats": stats}
+            return
+
+        modelo = inicio["modelo"]
+        stats = {"etapas": tiempos} if tiempos else {}
+        partes = []
+        t_espera = time.perf_counter()
+        self.esperando[modelo] += 1
+        en_cola = True
+        try:
+            async with self.semaforo(modelo):
+                self.esperando[modelo] -= 1
+                en_cola = False
+                espera_s = time.perf_counter() - t_espera
+                self.generando[modelo] += 1
+                try:
+                    async for token in ollama_async.stream_chat(modelo, mensajes, stats=stats):
+                        partes.append(token)
+                        yield {"token": token}
+                finally:
+                    self.generando[modelo] -= 1
+        finally:
+            # Si el cliente se va mientras espera turno
+            if en_cola:
+                self.esperando[modelo] -= 1
+        stats["espera_modelo_s"] = espera_s
+        stats["total_s"] = time.perf_counter() - t0
+        if modo == "rag":
+            tracing.registrar("servidor", modelo, pregunta, stats)
+
+        if cache is not None:
+            import rag_core
+
+            clave, huella = cache
+            await self.en_hilo(rag_core.guardar_en_cache, clave, huella, "".join(partes).strip(), inicio["fuentes"])
+        yield {"evento": "fin", "stats": stats}
+
+    # ── Endpoints ─────────────────────────────────────────────
+
+    async def query(self, cuerpo: dict) -> dict:
+        pregunta, modo = _pregunta_y_modo(cuerpo)
+        t0 = time.perf_counter()
+        resultado = {"respuesta": ""}
+        partes = []
+        async for ev in self.eventos(pregunta, modo):
+            if "token" in ev:
+                partes.append(ev["token"])
+            elif ev["evento"] == "inicio":
+                resultado.update({k: v for k, v in ev.items() if k != "evento"})
+            else:
+                resultado["stats"] = ev["stats"]
+        resultado["respuesta"] = "".join(partes).strip()
+        self.latencias.append(time.perf_counter() - t0)
+        return resultado
+
+    async def stream(self, cuerpo: dict, writer):
+        pregunta, modo = _pregunta_y_modo(cuerpo)
+        t0 = time.perf_counter()
+        eventos = self.eventos(pregunta, modo)
+        # El primer evento se pide antes de enviar cabeceras: así un error de
+        # la petición (pregunta vacía, modo malo) se devuelve como 400 normal.
+        primero = await eventos.__anext__()
+        await _cabeceras(writer, 200, "application/x-ndjson", chunked=True)
+        try:
+            await _trozo(writer, primero)
+            async for ev in eventos:
+                await _trozo(writer, ev)
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            # Las cabeceras ya se enviaron: el error va como última línea
+            self.errores += 1
+            await _trozo(writer, {"evento": "error", "error": str(e)})
+        finally:
+            await eventos.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.latencias.append(time.perf_counter() - t0)
+
+    async def ingest(self, cuerpo: dict) -> dict:
+        modo, paths = _modo_y_paths(cuerpo)
+        if self._ingesta.locked():
+            raise ErrorPeticion(409, "Ya hay una ingesta en curso")
+        async with self._ingesta:
+            from ingest import run as ingest_run
+
+            stats = await self.en_hilo(ingest_run, paths=paths, mode=modo)
+        return asdict(stats)
+
+    async def stats(self) -> dict:
+        datos = {
+            "uptime_s": round(time.time() - self.inicio, 1),
+            "peticiones": dict(self.peticiones),
+            "en_curso": self.en_curso,
+            "errores": self.errores,
+            "ingesta_en_curso": self._ingesta.locked(),
+            "latencia_s": {
+                "n": len(self.latencias),
+                "p50": round(_percentil(self.latencias, 0.50), 3),
+                "p95": round(_percentil(self.latencias, 0.95), 3),
+            },
+            "modelos": {
+                modelo: {
+                    "limite": OLLAMA_CONCURRENCIA_POR_MODELO.get(modelo, OLLAMA_CONCURRENCIA_DEFECTO),
+                    "generando": self.generando[modelo],
+                    "esperando": self.esperando[modelo],
+                }
+                for modelo in sorted(set(OLLAMA_CONCURRENCIA_POR_MODELO) | set(self._semaforos))
+            },
+        }
+        try:
+            datos["chunks"] = await self.en_hilo(lambda: runtime.get_collection().count())
+        except Exception as e:
+            datos["chunks"] = None
+            datos["error_chroma"] = str(e)
+        batching = runtime.query_batcher_stats()
+        if batching is not None:
+            datos["query_batching"] = batching
+        # rag_core solo si alguna petición ya lo cargó: /stats no carga la caché
+        rag_core = sys.modules.get("rag_core")
+        cache = rag_core.answer_cache_stats() if rag_core else None
+        if cache is not None:
+            datos["cache_respuestas"] = cache
+        return datos
+
+    # ── HTTP ──────────────────────────────────────────────────
+
+    async def atender(self, reader, writer):
+        self.en_curso += 1
+        try:
+            try:
+                metodo, ruta, cuerpo = await _leer_peticion(reader)
+                self.peticiones[ruta] += 1
+                if ruta == "/stats" and metodo == "GET":
+                    await _json(writer, 200, await self.stats())
+                elif ruta in ("/query", "/stream", "/ingest"):
+                    if metodo != "POST":
+                        raise ErrorPeticion(405, f"{ruta} solo admite POST")
+                    if ruta == "/query":
+                        await _json(writer, 200, await self.query(cuerpo))
+                    elif ruta == "/stream":
+                        await self.stream(cuerpo, writer)
+                    else:
+                        await _json(writer, 200, await self.ingest(cuerpo))
+                else:
+                    raise ErrorPeticion(404, f"No existe {metodo} {ruta}")
+            except ErrorPeticion as e:
+                await _json(writer, e.codigo, {"error": str(e)})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass  # el cliente cerró la conexión
+            except Exception as e:
+                self.errores += 1
+                print(f"❌ Error atendiendo petición: {e!r}")
+                await _json(writer, 500, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            self.en_curso -= 1
+            writer.close()
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _pregunta_y_modo(cuerpo: dict) -> tuple[str, str]:
+    pregunta = cuerpo.get("pregunta")
+    if not isinstance(pregunta, str):
+        raise ErrorPeticion(400, 'Falta "pregunta" (texto)')
+    return pregunta, cuerpo.get("modo", "rag")
+
+
+def _modo_y_paths(cuerpo: dict) -> tuple[str, list[str] | None]:
+    modo = cuerpo.get("modo", "incremental")
+    if modo not in ("incremental", "full"):
+        raise ErrorPeticion(400, f"modo de ingesta desconocido: {modo!r} (usa 'incremental' o 'full')")
+    paths = cuerpo.get("paths")
+    # Un texto suelto se recorrería letra a letra como si fueran rutas
+    if paths is not None and (not isinstance(paths, list) or not all(isinstance(p, str) and p for p in paths)):
+        raise ErrorPeticion(400, '"paths" debe ser una lista de rutas (texto)')
+    return modo, paths or None
+
+
+async def _leer(lectura):
+    try:
+        return await asyncio.wait_for(lectura, timeout=SERVER_READ_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ErrorPeticion(408, f"Sin datos de la petición en {SERVER_READ_TIMEOUT} s")
+
+
+async def _leer_peticion(reader) -> tuple[str, str, dict]:
+    """Lee línea de petición, cabeceras y cuerpo JSON (Content-Length)."""
+    linea = await _leer(reader.readline())
+    partes = linea.decode("latin-1").split()
+    if len(partes) != 3:
+        raise ErrorPeticion(400, "Petición HTTP mal formada")
+    metodo, ruta, _ = partes
+    ruta = ruta.split("?", 1)[0]
+
+    cabeceras = {}
+    while True:
+        linea = await _leer(reader.readline())
+        if linea in (b"\r\n", b"\n", b""):
+            break
+        nombre, _, valor = linea.decode("latin-1").partition(":")
+        cabeceras[nombre.strip().lower()] = valor.strip()
+
+    try:
+        largo = int(cabeceras.get("content-length", "0") or 0)
+    except ValueError:
+        raise ErrorPeticion(400, "Content-Length no es un número")
+    if largo < 0:
+        raise ErrorPeticion(400, "Content-Length negativo")
+    if largo > SERVER_MAX_BODY_KB * 1024:
+        raise ErrorPeticion(413, f"Cuerpo de más de {SERVER_MAX_BODY_KB} KB")
+    cuerpo = {}
+    if largo:
+        try:
+            cuerpo = json.loads(await _leer(reader.readexactly(largo)))
+        except ValueError:
+            raise ErrorPeticion(400, "El cuerpo no es JSON válido")
+        if not isinstance(cuerpo, dict):
+            raise ErrorPeticion(400, "El cuerpo debe ser un objeto JSON")
+    return metodo.upper(), ruta, cuerpo
+
+
+async def _cabeceras(writer, codigo: int, tipo: str, largo: int | None = None, chunked: bool = False):
+    lineas = [
+        f"HTTP/1.1 {codigo} {_ESTADOS.get(codigo, '')}",
+        f"Content-Type: {tipo}; charset=utf-8",
+        "Connection: close",
+    ]
+    if chunked:
+        lineas.append("Transfer-Encoding: chunked")
+    elif largo is not None:
+        lineas.append(f"Content-Length: {largo}")
+    writer.write(("\r\n".join(lineas) + "\r\n\r\n").encode("latin-1"))
+
+
+async def _json(writer, codigo: int, datos: dict):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    await _cabeceras(writer, codigo, "application/json", largo=len(cuerpo))
+    writer.write(cuerpo)
+    await writer.drain()
+
+
+async def _trozo(writer, datos: dict):
+    """Una línea NDJSON como trozo de Transfer-Encoding: chunked."""
+    linea = (json.dumps(datos, ensure_ascii=False) + "\n").encode("utf-8")
+    writer.write(f"{len(linea):x}\r\n".encode("ascii") + linea + b"\r\n")
+    await writer.drain()
+
+
+async def servir(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    servidor = RagServer()
+    if OLLAMA_WARMUP:
+        from ollama_client import precargar_modelos
+        precargar_modelos(OLLAMA_WARMUP_MODELS)
+    if EMBEDDER_WARMUP:
+        runtime.warmup_en_segundo_plano()
+
+    srv = await asyncio.start_server(servidor.atender, host, port)
+    print(f"🌐 RAG escuchando en http://{host}:{port}  (POST /query /stream /ingest · GET /stats)")
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        servidor.cerrar()
+        runtime.teardown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API HTTP local del RAG")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(servir(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 Servidor detenido.")
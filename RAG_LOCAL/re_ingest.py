@@ -1,29 +1,83 @@
 # re_ingest.py
-import subprocess
-import sys
-import chromadb
-from config import CHROMA_DIR
+import runtime
+from ingest import run as ingest_run
+from manifest import anotar_cambio, borrar_manifest, cargar_manifest, guardar_manifest
 
-def main():
-    print("🔗 Conectando a Chroma...")
-    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+def main(shard: str | None = None):
+    if shard:
+        return reingestar_shard(shard)
 
-    print("🧹 Eliminando colección 'docs'...")
-    try:
-        client.delete_collection("docs")
-        print("✅ Colección eliminada.")
-    except Exception as e:
-        print(f"⚠ No se pudo eliminar (posiblemente ya no existe): {e}")
+    print("🧹 Eliminando colección 'docs' (y su índice BM25) y creándola vacía...")
+    runtime.reset_collection()
 
-    print("📁 Creando colección vacía...")
-    client.get_or_create_collection("docs")
+    # La colección está vacía: el manifest de la ingesta incremental ya no vale
+    borrar_manifest()
 
-    print("\n🚀 Ejecutando ingest.py con el mismo intérprete de Python (venv)...\n")
-
-    # 🔥 Esto asegura que use el Python actual (el del .venv)
-    subprocess.run([sys.executable, "ingest.py"], check=True)
+    # En este mismo proceso: si el modelo de embeddings y Chroma ya están
+    # cargados (p. ej. desde el menú) se reutilizan en vez de arrancar otro Python
+    print("\n🚀 Ingestando todos los documentos...\n")
+    stats = ingest_run(mode="full")
 
     print("\n🎉 Re-ingesta completada.")
+    return stats
+
+def reingestar_shard(nombre: str):
+    """
+    Con SHARDING: vacía un solo shard (por su nombre o el de su carpeta) y
+    vuelve a ingestar sus archivos. El resto del corpus no se toca.
+    """
+    from config import DOCS_DIR, HYBRID_SEARCH, DEDUP_ENABLED
+    from dedup import Deduplicador
+    from ingest import borrar_chunks
+
+    col = runtime.get_collection()
+    if not hasattr(col, "vaciar"):
+        print("⚠ SHARDING está desactivado en config.py: no hay shards que re-ingestar.")
+        return None
+    shard = col.resolver(nombre)
+    if shard is None:
+        print(f"⚠ No existe el shard '{nombre}'. Shards: {', '.join(col.shards()) or '(ninguno)'}")
+        return None
+
+    manifest = cargar_manifest()
+    claves = col.archivos(shard, manifest)
+    print(f"🧹 Vaciando el shard '{shard}' ({len(claves)} archivo(s))...")
+    # Sus chunks salen también del índice BM25 y de la tabla de duplicados: si
+    # alguno era el canónico de copias de otros shards, una de ellas ocupa su sitio
+    ids = [cid for key in claves for cid in manifest["files"].pop(key).get("chunk_ids", [])]
+    bm25 = runtime.get_bm25_index() if HYBRID_SEARCH else None
+    dedup = Deduplicador() if DEDUP_ENABLED else None
+    borrar_chunks(col, ids, bm25, dedup)
+    if dedup is not None:
+        dedup.actualizar_metadatos(col)
+        dedup.cerrar()
+    col.vaciar(shard)
+    anotar_cambio(manifest)
+    guardar_manifest(manifest)
+    if bm25 is not None:
+        bm25.guardar()
+
+    # Por carpeta se vuelve a leer la carpeta entera (con sus archivos nuevos);
+    # por hash, los archivos que tenían chunks en el shard
+    if col.modo == "carpeta":
+        rutas = [p for p in DOCS_DIR.iterdir()
+                 if col.shard_de("", {"folder": p.name if p.is_dir() else ""}) == shard]
+    else:
+        rutas = [DOCS_DIR / key for key in claves]
+    if not rutas:
+        print("\n✅ El shard no tenía archivos: queda vacío.")
+        return None
+
+    print(f"\n🚀 Ingestando los documentos del shard '{shard}'...\n")
+    stats = ingest_run(paths=rutas, mode="full")
+
+    print(f"\n🎉 Re-ingesta del shard '{shard}' completada.")
+    return stats
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-ingesta todos los documentos (o, con SHARDING, un shard)")
+    parser.add_argument("--shard", help="shard o carpeta de primer nivel a re-ingestar (ver count_collection.py)")
+    args = parser.parse_args()
+    main(shard=args.shard)
@@ -0,0 +1,53 @@
+# reranker.py - Reordenación de candidatos con un cross-encoder local
+#
+# La recuperación (vectores + BM25) trae RERANK_CANDIDATES fragmentos; el
+# cross-encoder lee cada par (pregunta, fragmento) completo y los puntúa
+# mucho mejor que la distancia entre embeddings. Nos quedamos con los TOP_K
+# mejores: el prompt es más corto y más relevante, y el prefill del LLM más rápido.
+#
+# Se puntúa por lotes y, después de cada lote, se mira el presupuesto de tiempo
+# (RERANK_BUDGET_MS): si se ha agotado, se reordenan solo los ya puntuados y
+# detrás van los demás en el orden de la recuperación.
+import time
+
+from config import RERANK_BATCH_SIZE, RERANK_BUDGET_MS
+from runtime import get_reranker
+
+
+def reordenar(pregunta: str, chunks: list[dict], k: int,
+              presupuesto_ms: float = RERANK_BUDGET_MS,
+              tiempos: dict | None = None) -> list[dict]:
+    """
+    Devuelve los k mejores chunks según el cross-encoder.
+    Si el presupuesto se agota antes de puntuar todos, los puntuados van
+    reordenados delante y el resto detrás en el orden de la recuperación;
+    tiempos["rerank_agotado"] = (puntuados, total).
+    La carga del modelo (solo la primera vez) no cuenta para el presupuesto.
+    """
+    if tiempos is None:
+        tiempos = {}
+    if len(chunks) <= 1:
+        return chunks[:k]
+
+    modelo = get_reranker()
+
+    t0 = time.perf_counter()
+    puntos = []
+    for start in range(0, len(chunks), RERANK_BATCH_SIZE):
+        lote = chunks[start:start + RERANK_BATCH_SIZE]
+        puntos.extend(
+            float(p) for p in modelo.predict(
+                [(pregunta, ch["text"]) for ch in lote],
+                batch_size=len(lote),
+                show_progress_bar=False,
+            )
+        )
+        # Después de cada lote: uno lento (o el único) también cuenta
+        if len(puntos) < len(chunks) and (time.perf_counter() - t0) * 1000 > presupuesto_ms:
+            tiempos["rerank_agotado"] = (len(puntos), len(chunks))
+            break
+    tiempos["rerank_ms"] = (time.perf_counter() - t0) * 1000
+
+    orden = sorted(range(len(puntos)), key=lambda i: puntos[i], reverse=True)
+    orden += range(len(puntos), len(chunks))
+    return [chunks[i] for i in orden[:k]]
@@ -0,0 +1,227 @@
+# runtime.py - Recursos pesados compartidos por todo el proceso
+#
+# Modelo de embeddings, cliente de Chroma, colecciones, índice BM25 y
+# reranker se crean UNA vez por proceso, la primera vez que alguien los pide
+# (rag_core, rag_query, ingest, re_ingest...). Antes cada módulo tenía sus
+# propias variables globales y, p. ej. desde el menú, SentenceTransformer se
+# cargaba dos o tres veces.
+#
+# Los imports pesados (chromadb, sentence_transformers/torch, onnxruntime)
+# están dentro de los getters: importar este módulo es instantáneo. Con
+# VECTOR_BACKEND = "int8" las colecciones son de vector_store.py y chromadb
+# ni se importa. Con SHARDING, get_collection() devuelve la ShardedCollection
+# de shards.py, que reparte entre colecciones "docs__<shard>".
+import gc
+import threading
+import time
+
+from config import (
+    CHROMA_DIR,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    RERANK_MODEL,
+    QUERY_BATCHING,
+    SHARDING,
+    VECTOR_BACKEND,
+    VECTOR_STORE_DIR,
+)
+
+COLECCION = "docs"
+
+_lock = threading.RLock()
+_embedder = None
+_client = None
+_collections = {}
+_bm25 = None
+_reranker = None
+_query_batcher = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from embeddings import cargar_embedder
+
+                print(f"🧠 Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND})")
+                _embedder = cargar_embedder()
+    return _embedder
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                print(f"📚 Iniciando Chroma PersistentClient en: {CHROMA_DIR}")
+                _client = chromadb.PersistentClient(
+                    path=str(CHROMA_DIR),
+                    settings=Settings(anonymized_telemetry=False),
+                )
+    return _client
+
+
+def get_collection(nombre: str = COLECCION):
+    col = _collections.get(nombre)
+    if col is None:
+        with _lock:
+            col = _collections.get(nombre)
+            if col is None:
+                if SHARDING and nombre == COLECCION:
+                    from shards import ShardedCollection
+
+                    print(f"📚 Colección '{nombre}' repartida en shards (SHARDING = {SHARDING!r})")
+                    col = ShardedCollection(get_collection, _borrar_coleccion, nombre)
+                elif VECTOR_BACKEND == "int8":
+                    from vector_store import QuantizedCollection
+
+                    print(f"📚 Abriendo colección int8 en: {VECTOR_STORE_DIR / nombre}")
+                    col = QuantizedCollection(VECTOR_STORE_DIR / nombre, nombre)
+                else:
+                    col = get_client().get_or_create_collection(name=nombre)
+                _collections[nombre] = col
+    return col
+
+
+def get_bm25_index():
+    global _bm25
+    if _bm25 is None:
+        with _lock:
+            if _bm25 is None:
+                from bm25_index import BM25Index
+
+                _bm25 = BM25Index()
+    return _bm25
+
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+
+                print(f"🧠 Cargando modelo de reranking: {RERANK_MODEL}")
+                _reranker = CrossEncoder(RERANK_MODEL)
+    return _reranker
+
+
+def get_query_batcher():
+    """Micro-lotes de embeddings/consultas (None si QUERY_BATCHING está desactivado)."""
+    global _query_batcher
+    if _query_batcher is None and QUERY_BATCHING:
+        with _lock:
+            if _query_batcher is None:
+                from query_batcher import QueryBatcher
+
+                _query_batcher = QueryBatcher(get_embedder)
+    return _query_batcher
+
+
+def query_batcher_stats() -> dict | None:
+    """Contadores de los micro-lotes, sin crearlos (None si no se han usado)."""
+    batcher = _query_batcher
+    return dict(batcher.stats) if batcher is not None else None
+
+
+def _borrar_coleccion(nombre: str):
+    """Elimina la colección del disco (la siguiente get_collection() la crea vacía)."""
+    with _lock:
+        col = _collections.pop(nombre, None)
+        if VECTOR_BACKEND == "int8":
+            from vector_store import QuantizedCollection
+
+            if col is not None:
+                col.cerrar()
+            QuantizedCollection.borrar_todo(VECTOR_STORE_DIR / nombre)
+            print(f"✅ Colección '{nombre}' eliminada.")
+        else:
+            try:
+                get_client().delete_collection(nombre)
+                print(f"✅ Colección '{nombre}' eliminada.")
+            except Exception as e:
+                print(f"⚠ No se pudo eliminar (posiblemente ya no existe): {e}")
+
+
+def reset_collection(nombre: str = COLECCION, solo_vectores: bool = False):
+    """
+    Borra la colección y la vuelve a crear vacía, junto con su índice BM25
+    y la tabla de duplicados (salvo con solo_vectores=True: migrar_vectores.py).
+    Con SHARDING se borran todos sus shards. Quien tuviera la colección
+    anterior debe volver a pedirla con get_collection().
+    """
+    global _bm25
+    from bm25_index import BM25Index
+    from dedup import Deduplicador
+
+    with _lock:
+        if SHARDING and nombre == COLECCION:
+            get_collection(nombre).vaciar()
+        else:
+            _borrar_coleccion(nombre)
+        if solo_vectores:
+            return get_collection(nombre)
+
+        if _bm25 is not None:
+            _bm25.cerrar()
+            _bm25 = None
+        BM25Index.borrar_todo()
+        Deduplicador.borrar_todo()
+
+        return get_collection(nombre)
+
+
+def warmup(embedder: bool = True, coleccion: bool = True):
+    """
+    Carga por adelantado lo que necesita la primera consulta. El encode de
+    prueba inicializa también los kernels/hilos de torch, que si no se
+    pagarían en la primera pregunta.
+    """
+    t0 = time.perf_counter()
+    if embedder:
+        get_embedder().encode(["calentamiento"])
+    if coleccion:
+        get_collection()
+        get_bm25_index()
+    return time.perf_counter() - t0
+
+
+def warmup_en_segundo_plano(embedder: bool = True, coleccion: bool = True):
+    """
+    warmup() en un hilo daemon. Si alguien pide el embedder antes de que
+    termine, get_embedder() espera al lock y no lo carga dos veces.
+    """
+    def _trabajo():
+        try:
+            warmup(embedder=embedder, coleccion=coleccion)
+        except Exception as e:
+            # Sin dependencias o sin disco: ya fallará (con su mensaje) al usarse
+            print(f"\n⚠ Precarga de embeddings fallida: {e}")
+
+    hilo = threading.Thread(target=_trabajo, name="runtime-warmup", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def teardown():
+    """Suelta todos los recursos (al salir, o para liberar RAM entre usos)."""
+    global _embedder, _client, _bm25, _reranker, _query_batcher
+    with _lock:
+        if _query_batcher is not None:
+            _query_batcher.cerrar()
+            _query_batcher = None
+        if _bm25 is not None:
+            _bm25.cerrar()
+        for col in _collections.values():
+            if hasattr(col, "cerrar"):
+                col.cerrar()
+        _embedder = None
+        _reranker = None
+        _bm25 = None
+        _collections.clear()
+        _client = None
+    gc.collect()
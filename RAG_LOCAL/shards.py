@@ -0,0 +1,351 @@
+# shards.py - Corpus repartido en varias colecciones (SHARDING en config.py)
+#
+# Con una sola colección 'docs' cada pregunta recorre todo el corpus aunque
+# lleve [carpeta:seguridad], y rehacer una parte obliga a rehacerlo todo.
+# Con SHARDING cada chunk va a una colección ("shard"):
+#   "carpeta" → una por carpeta de primer nivel de docs/ (docs__seguridad,
+#               docs__rrhh...; los archivos sueltos en docs/ van a docs__raiz)
+#   "hash"    → SHARDS colecciones (docs__hash_0...) repartidas por el ID del chunk
+# ShardedCollection se usa como una colección más (count, upsert, get, query,
+# update, delete): runtime.get_collection() la devuelve en lugar de 'docs' y
+# la ingesta, la deduplicación y la búsqueda híbrida no cambian. El índice
+# BM25 y la tabla de duplicados siguen siendo uno para todo el corpus.
+#
+# Enrutado: SHARDS_PATH guarda, por shard, las marcas de carpeta ("dir:x")
+# de sus chunks, incluidas las que la deduplicación añade a un canónico por
+# sus copias de otras carpetas. Una consulta con [carpeta:...] solo va a los
+# shards que pueden tener chunks que la cumplan; sin filtro de carpeta va a
+# todos a la vez (SHARD_WORKERS hilos) y se quedan los n_results más
+# cercanos de entre todos: las distancias son comparables (mismo modelo).
+# Las marcas solo se añaden: una carpeta vaciada hace, como mucho, que se
+# consulte un shard de más. Vaciar el shard (re_ingest.py --shard) las borra.
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+import numpy as np
+
+from config import SHARDING, SHARDS, SHARDS_PATH, SHARD_WORKERS, VECTOR_IVF_MIN
+from manifest import clave_carpeta
+
+MODOS = ["carpeta", "hash"]
+RAIZ = "raiz"
+
+_PREFIJO_CARPETA = clave_carpeta("")
+# Claves de un resultado de query() que van "una lista por consulta"
+_CLAVES_CONSULTA = ("ids", "documents", "metadatas", "distances", "embeddings")
+
+
+def _slug(nombre: str) -> str:
+    """Nombre de carpeta → parte válida de un nombre de colección ([a-z0-9-])."""
+    texto = "".join(
+        c for c in unicodedata.normalize("NFKD", nombre.lower()) if not unicodedata.combining(c)
+    )
+    slug = re.sub(r"[^a-z0-9]+", "-", texto).strip("-")[:40].strip("-")
+    return slug or hashlib.sha1(nombre.encode("utf-8")).hexdigest()[:8]
+
+
+def carpeta_de(meta: dict | None) -> str:
+    """Carpeta de primer nivel de un chunk según su metadato "folder" ("" si está suelto en docs/)."""
+    folder = (meta or {}).get("folder") or ""
+    return re.split(r"[\\/]+", folder.strip("\\/"))[0]
+
+
+def _puede_cumplir(where: dict | None, marcas: set) -> bool:
+    """¿Puede un shard con esas marcas de carpeta tener chunks que cumplan `where`?"""
+    for clave, valor in (where or {}).items():
+        if clave == "$and":
+            if not all(_puede_cumplir(w, marcas) for w in valor):
+                return False
+        elif clave == "$or":
+            if not any(_puede_cumplir(w, marcas) for w in valor):
+                return False
+        elif clave.startswith(_PREFIJO_CARPETA) and valor in (True, {"$eq": True}):
+            if clave not in marcas:
+                return False
+    return True
+
+
+def _juntar(partes: list[dict], include) -> dict:
+    """Resultados de get() de varios shards en uno solo."""
+    res = {"ids": [], "include": list(include)}
+    for clave in ("documents", "metadatas", "embeddings"):
+        res[clave] = [] if clave in include else None
+    for p in partes:
+        res["ids"].extend(p["ids"])
+        for clave in ("documents", "metadatas", "embeddings"):
+            if res[clave] is not None and p.get(clave) is not None:
+                res[clave].extend(p[clave])
+    if res["embeddings"]:
+        res["embeddings"] = np.asarray(res["embeddings"], dtype=np.float32)
+    return res
+
+
+def _fusionar(partes: list[dict], n_results: int) -> dict:
+    """Resultados de query() de varios shards → los n_results más cercanos de cada pregunta."""
+    claves = [c for c in _CLAVES_CONSULTA if partes[0].get(c) is not None]
+    res = {c: [] for c in claves}
+    for q in range(len(partes[0]["ids"])):
+        mejores = heapq.nsmallest(
+            n_results,
+            ((p["distances"][q][j], i, j) for i, p in enumerate(partes) for j in range(len(p["ids"][q]))),
+        )
+        for c in claves:
+            res[c].append([partes[i][c][q][j] for _, i, j in mejores])
+    return res
+
+
+class ShardedCollection:
+    """
+    Varias colecciones usadas como una sola, con el API de una colección de
+    Chroma. `abrir(nombre)` devuelve la colección de un shard (la crea si no
+    existe) y `borrar(nombre)` la elimina del disco (ver runtime.py).
+    """
+
+    def __init__(self, abrir, borrar, nombre: str = "docs", modo: str | None = SHARDING,
+                 n_shards: int = SHARDS, ruta: Path = SHARDS_PATH, hilos: int = SHARD_WORKERS):
+        if modo not in MODOS:
+            raise ValueError(f"SHARDING desconocido: {modo!r} (opciones: None, {', '.join(map(repr, MODOS))})")
+        self.name = nombre
+        self.modo = modo
+        self.n_shards = max(1, n_shards)
+        self._abrir = abrir
+        self._borrar = borrar
+        self._ruta = Path(ruta)
+        # Cada reparto tiene su propia lista de shards: cambiar SHARDING no mezcla las de otro
+        self._reparto = f"hash:{self.n_shards}" if modo == "hash" else modo
+        self._lock = threading.RLock()
+        self._tabla = self._cargar_tabla()
+        self._pool = ThreadPoolExecutor(max_workers=hilos or 8, thread_name_prefix="shards")
+
+    # ── Tabla de shards ───────────────────────────────────────
+
+    def _cargar_tabla(self) -> dict:
+        """{reparto: {shard: marcas de carpeta}} de SHARDS_PATH."""
+        try:
+            datos = json.loads(self._ruta.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠ Tabla de shards ilegible ({e}): re-ingesta con python re_ingest.py.")
+            return {}
+        return {reparto: {s: set(m) for s, m in shards.items()} for reparto, shards in datos.items()}
+
+    def _guardar_tabla(self):
+        """Escritura atómica: primero a un .tmp y luego os.replace()."""
+        self._ruta.parent.mkdir(parents=True, exist_ok=True)
+        datos = {reparto: {s: sorted(m) for s, m in shards.items()} for reparto, shards in self._tabla.items()}
+        tmp = self._ruta.with_suffix(self._ruta.suffix + ".tmp")
+        tmp.write_text(json.dumps(datos, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self._ruta)
+
+    def _marcas(self) -> dict:
+        return self._tabla.setdefault(self._reparto, {})
+
+    def _anotar(self, shard: str, metas):
+        """Registra el shard y las marcas de carpeta de estos metadatos."""
+        nuevas = {
+            clave for meta in metas if meta
+            for clave, valor in meta.items() if clave.startswith(_PREFIJO_CARPETA) and valor is True
+        }
+        with self._lock:
+            marcas = self._marcas().get(shard)
+            if marcas is not None and nuevas <= marcas:
+                return
+            self._marcas().setdefault(shard, set()).update(nuevas)
+            self._guardar_tabla()
+
+    # ── Enrutado ──────────────────────────────────────────────
+
+    def shards(self) -> list[str]:
+        """Shards del reparto actual que tienen (o han tenido) chunks."""
+        with self._lock:
+            return sorted(self._marcas())
+
+    def shards_para(self, where: dict | None = None) -> list[str]:
+        """Los shards que pueden tener chunks que cumplan `where`."""
+        with self._lock:
+            return [s for s, marcas in sorted(self._marcas().items()) if _puede_cumplir(where, marcas)]
+
+    def shard_de(self, cid: str, meta: dict | None = None) -> str:
+        """Shard de un chunk: por su ID (hash) o por su carpeta de primer nivel."""
+        if self.modo == "hash":
+            return f"{self.name}__hash_{int(hashlib.sha1(cid.encode('utf-8')).hexdigest()[:8], 16) % self.n_shards}"
+        return f"{self.name}__{_slug(carpeta_de(meta) or RAIZ)}"
+
+    def resolver(self, nombre: str) -> str | None:
+        """Shard por su nombre (docs__seguridad) o por el de su carpeta (seguridad)."""
+        shards = self.shards()
+        for candidato in (nombre, f"{self.name}__{nombre}", f"{self.name}__{_slug(nombre)}"):
+            if candidato in shards:
+                return candidato
+        return None
+
+    def archivos(self, shard: str, manifest: dict) -> list[str]:
+        """Claves del manifest (archivos) con algún chunk en ese shard."""
+        claves = []
+        for key, info in manifest.get("files", {}).items():
+            padre = PurePosixPath(key).parent.as_posix()
+            meta = {"folder": "" if padre == "." else padre}
+            if any(self.shard_de(cid, meta) == shard for cid in info.get("chunk_ids", [])):
+                claves.append(key)
+        return claves
+
+    def _en_paralelo(self, funcion, shards: list[str]) -> list:
+        if len(shards) == 1:
+            return [funcion(shards[0])]
+        return list(self._pool.map(funcion, shards))
+
+    def _agrupar(self, ids: list[str], metadatas=None) -> dict[str, list[int]]:
+        """Posiciones de `ids` por shard (por el ID o por la carpeta de sus metadatos)."""
+        grupos = {}
+        for i, cid in enumerate(ids):
+            shard = self.shard_de(cid, metadatas[i] if metadatas is not None else None)
+            grupos.setdefault(shard, []).append(i)
+        return grupos
+
+    def _ubicar(self, ids: list[str]) -> dict[str, list[int]]:
+        """Posiciones de `ids` por el shard donde están guardados."""
+        if self.modo == "hash":
+            grupos = self._agrupar(ids)
+            existentes = set(self.shards())
+            return {s: idx for s, idx in grupos.items() if s in existentes}
+        # Por carpeta el ID no dice dónde está: se pregunta a todos los shards
+        shards = self.shards()
+        encontrados = self._en_paralelo(lambda s: set(self._abrir(s).get(ids=ids, include=[])["ids"]), shards)
+        grupos = {}
+        for shard, hay in zip(shards, encontrados):
+            idx = [i for i, cid in enumerate(ids) if cid in hay]
+            if idx:
+                grupos[shard] = idx
+        return grupos
+
+    # ── API de colección ──────────────────────────────────────
+
+    def count(self) -> int:
+        return sum(self.contar().values())
+
+    def contar(self) -> dict[str, int]:
+        """Chunks de cada shard."""
+        return {s: self._abrir(s).count() for s in self.shards()}
+
+    def _escribir(self, metodo: str, ids, embeddings, metadatas, documents):
+        ids = list(ids)
+        for shard, idx in self._agrupar(ids, metadatas).items():
+            partes = {"ids": [ids[i] for i in idx]}
+            for clave, valores in (("embeddings", embeddings), ("metadatas", metadatas), ("documents", documents)):
+                if valores is not None:
+                    partes[clave] = [valores[i] for i in idx]
+            # Antes de escribir: un chunk guardado nunca queda fuera del enrutado
+            self._anotar(shard, partes.get("metadatas") or [])
+            getattr(self._abrir(shard), metodo)(**partes)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **_):
+        self._escribir("upsert", ids, embeddings, metadatas, documents)
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None, **_):
+        self._escribir("add", ids, embeddings, metadatas, documents)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **_):
+        ids = list(ids)
+        for shard, idx in self._ubicar(ids).items():
+            partes = {"ids": [ids[i] for i in idx]}
+            for clave, valores in (("embeddings", embeddings), ("metadatas", metadatas), ("documents", documents)):
+                if valores is not None:
+                    partes[clave] = [valores[i] for i in idx]
+            self._anotar(shard, partes.get("metadatas") or [])
+            self._abrir(shard).update(**partes)
+
+    def delete(self, ids=None, where: dict | None = None, **_):
+        if ids is not None:
+            ids = list(ids)
+            for shard, idx in self._ubicar(ids).items():
+                self._abrir(shard).delete(ids=[ids[i] for i in idx], where=where)
+        elif where:
+            for shard in self.shards_para(where):
+                self._abrir(shard).delete(where=where)
+
+    def get(self, ids=None, where: dict | None = None, include=("documents", "metadatas"),
+            limit: int | None = None, offset: int | None = None, **_) -> dict:
+        include = list(include)
+        if ids is not None:
+            ids = list(ids)
+            shards = self.shards_para(where)
+            if self.modo == "hash":
+                grupos = {s: [ids[i] for i in idx] for s, idx in self._agrupar(ids).items() if s in shards}
+            else:
+                grupos = {s: ids for s in shards}
+            partes = self._en_paralelo(
+                lambda s: self._abrir(s).get(ids=grupos[s], where=where, include=include), list(grupos)
+            )
+            res = _juntar(partes, include)
+            if offset or limit is not None:
+                fin = None if limit is None else (offset or 0) + limit
+                for clave in ("ids", "documents", "metadatas", "embeddings"):
+                    if res[clave] is not None:
+                        res[clave] = res[clave][offset or 0:fin]
+            return res
+
+        # Sin IDs: los shards uno detrás de otro, como si fueran una sola colección
+        saltar, quedan, partes = offset or 0, limit, []
+        for shard in self.shards_para(where):
+            if quedan is not None and quedan <= 0:
+                break
+            col = self._abrir(shard)
+            if saltar:
+                n = col.count() if not where else len(col.get(where=where, include=[])["ids"])
+                if saltar >= n:
+                    saltar -= n
+                    continue
+            partes.append(col.get(where=where, include=include, limit=quedan, offset=saltar or None))
+            saltar = 0
+            if quedan is not None:
+                quedan -= len(partes[-1]["ids"])
+        return _juntar(partes, include)
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None, include=None, **_) -> dict:
+        """Consulta los shards que pueden cumplir `where` a la vez y fusiona por distancia."""
+        extra = {} if include is None else {"include": sorted(set(include) | {"distances"})}
+        shards = self.shards_para(where)
+        if not shards:
+            preguntas = len(np.atleast_2d(np.asarray(query_embeddings)))
+            return {c: [[] for _ in range(preguntas)] for c in ("ids", "documents", "metadatas", "distances")}
+        partes = self._en_paralelo(
+            lambda s: self._abrir(s).query(
+                query_embeddings=query_embeddings, n_results=n_results, where=where, **extra
+            ),
+            shards,
+        )
+        return _fusionar(partes, n_results)
+
+    # ── Mantenimiento ─────────────────────────────────────────
+
+    def entrenar(self):
+        """Índice IVF de los shards del almacén int8 que ya son grandes (ver vector_store.py)."""
+        for shard in self.shards():
+            col = self._abrir(shard)
+            if hasattr(col, "entrenar") and col.count() >= VECTOR_IVF_MIN:
+                col.entrenar()
+
+    def vaciar(self, shard: str | None = None):
+        """Borra ese shard (o todos, de cualquier reparto) y lo quita de la tabla."""
+        with self._lock:
+            if shard is None:
+                nombres = sorted({s for shards in self._tabla.values() for s in shards})
+                self._tabla = {}
+            else:
+                nombres = [shard]
+                self._marcas().pop(shard, None)
+            self._guardar_tabla()
+        for nombre in nombres:
+            self._borrar(nombre)
+
+    def cerrar(self):
+        # Sin esperar: runtime.teardown() la cierra con su lock cogido
+        self._pool.shutdown(wait=False, cancel_futures=True)
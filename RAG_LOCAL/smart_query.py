@@ -1,33 +1,31 @@
 # smart_query.py - Decide si usar RAG (documentos) o solo el modelo de IA
 
-import requests
-
 from config import (
-    OLLAMA_URL,
     MODEL_MAIN,      # para RAG (phi4)
     MODEL_CODE,      # para código (mistral)
     MODEL_BALANCED,  # para chat general (llama3.1:8b)
 )
+from ollama_client import stream_chat, chat, imprimir_stream, formatear_stats
 
 # Importamos el RAG basado en documentos
 from rag_query import ask_rag as ask_rag_docs
 
 
+def _chat_messages(content: str) -> list[dict]:
+    return [{"role": "user", "content": content}]
+
+
 def _call_ollama_chat(model: str, content: str) -> str:
     """Llama a Ollama en modo chat sin RAG (solo modelo)."""
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": content}
-        ],
-        "stream": False,
-    }
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=600)
-    resp.raise_for_status()
-    data = resp.json()
-    msg = data.get("message", {})
-    text = msg.get("content", "") or ""
-    return text.strip()
+    return chat(model, _chat_messages(content))
+
+
+def _stream_ollama_chat(model: str, content: str) -> str:
+    """Chat sin RAG imprimiendo la respuesta según llega. Devuelve el texto completo."""
+    stats = {}
+    answer = imprimir_stream(stream_chat(model, _chat_messages(content), stats=stats))
+    print(f"\n{formatear_stats(stats)}")
+    return answer
 
 
 def _is_small_talk(q: str) -> bool:
@@ -149,18 +147,14 @@ def _is_doc_question(q: str) -> bool:
     return False
 
 
-def smart_ask(question: str):
+def clasificar(question: str) -> tuple[str, str | None, str]:
     """
-    Decide automáticamente:
-    - Small talk / charla general → llama3.1:8b (MODEL_BALANCED)
-    - Pregunta de código → mistral (MODEL_CODE)
-    - Pregunta sobre documentos → RAG con phi4 + Chroma (MODEL_MAIN)
-    - En caso de duda → modelo general (llama3.1:8b)
+    Decide la ruta sin imprimir ni llamar a nada (lo usan smart_ask y rag_server).
+    Devuelve (ruta, modelo, pregunta) con ruta "chat", "code", "rag" o "vacia".
     """
     q = question.strip()
     if not q:
-        print("⚠ Pregunta vacía.")
-        return
+        return "vacia", None, ""
 
     q_lower = q.lower()
 
@@ -172,26 +166,42 @@ def smart_ask(question: str):
 
     # 1) Small talk / charla corta
     if _is_small_talk(q):
-        print("\n🤖 (Chat general - llama3.1:8b)\n")
-        answer = _call_ollama_chat(MODEL_BALANCED, q)
-        print(answer)
-        return answer
+        return "chat", MODEL_BALANCED, q
 
     # 2) Pregunta de código
     if _is_code_question(q):
-        print("\n💻 (Pregunta de código - mistral)\n")
-        answer = _call_ollama_chat(MODEL_CODE, q)
-        print(answer)
-        return answer
+        return "code", MODEL_CODE, q
 
     # 3) Pregunta explícita sobre documentos
     if _is_doc_question(q):
+        return "rag", MODEL_MAIN, q
+
+    # 4) En caso de duda → Chat general
+    return "chat", MODEL_BALANCED, q
+
+
+def smart_ask(question: str):
+    """
+    Decide automáticamente:
+    - Small talk / charla general → llama3.1:8b (MODEL_BALANCED)
+    - Pregunta de código → mistral (MODEL_CODE)
+    - Pregunta sobre documentos → RAG con phi4 + Chroma (MODEL_MAIN)
+    - En caso de duda → modelo general (llama3.1:8b)
+    """
+    ruta, modelo, q = clasificar(question)
+
+    if ruta == "vacia":
+        print("⚠ Pregunta vacía.")
+        return
+
+    if ruta == "code":
+        print("\n💻 (Pregunta de código - mistral)\n")
+        return _stream_ollama_chat(modelo, q)
+
+    if ruta == "rag":
         print("\n📚 (Usando documentos con RAG - phi4 + Chroma)\n")
         # ask_rag_docs ya imprime la respuesta internamente
         return ask_rag_docs(q)
 
-    # 4) En caso de duda → Chat general
     print("\n🤖 (Chat general - llama3.1:8b)\n")
-    answer = _call_ollama_chat(MODEL_BALANCED, q)
-    print(answer)
-    return answer
+    return _stream_ollama_chat(modelo, q)
@@ -0,0 +1,59 @@
+# startup_profile.py - Desglose del tiempo de arranque (--profile-startup)
+#
+# Se activa ANTES de cualquier otro import del script (rag_menu.py,
+# ui_console.py) y mide cuánto tarda cada import que se hace hasta que el
+# menú/consola está listo. Después mide también lo que el arranque rápido
+# deja para más tarde (chromadb, sentence_transformers...), para ver lo que
+# se ahorra. Para un detalle completo: python -X importtime rag_menu.py
+import builtins
+import importlib
+import sys
+import time
+
+_import_original = builtins.__import__
+_registros = []  # (módulo, segundos incluyendo sus dependencias, profundidad)
+_profundidad = 0
+_t_inicio = None
+
+
+def _import_medido(name, globals=None, locals=None, fromlist=(), level=0):
+    global _profundidad
+    if level or name in sys.modules:
+        return _import_original(name, globals, locals, fromlist, level)
+    _profundidad += 1
+    t0 = time.perf_counter()
+    try:
+        return _import_original(name, globals, locals, fromlist, level)
+    finally:
+        _profundidad -= 1
+        _registros.append((name, time.perf_counter() - t0, _profundidad))
+
+
+def activar():
+    global _t_inicio
+    _t_inicio = time.perf_counter()
+    builtins.__import__ = _import_medido
+
+
+def informe(titulo: str, top: int = 15):
+    """Imprime los imports de primer nivel más lentos desde activar()."""
+    builtins.__import__ = _import_original
+    total = time.perf_counter() - (_t_inicio or time.perf_counter())
+    raices = sorted((r for r in _registros if r[2] == 0), key=lambda r: r[1], reverse=True)
+
+    print(f"\n⏱ {titulo}: {total * 1000:.0f} ms ({len(_registros)} módulos importados)")
+    for nombre, segundos, _ in raices[:top]:
+        print(f"   {segundos * 1000:9.1f} ms  {nombre}")
+
+
+def medir_diferidos(modulos: list[str]):
+    """Cuánto costaría importar ahora lo que el arranque rápido ha dejado para después."""
+    print("\n⏱ Imports diferidos (se pagan al usar la opción que los necesita):")
+    for nombre in modulos:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(nombre)
+        except ImportError as e:
+            print(f"   {'—':>9}     {nombre} (no disponible: {e})")
+            continue
+        print(f"   {(time.perf_counter() - t0) * 1000:9.1f} ms  {nombre}")
@@ -0,0 +1,184 @@
+# tracing.py - Tiempos por etapa de cada pregunta (trazas JSONL + p50/p95)
+#
+# Cada pregunta que pasa por rag_core.responder / responder_stream (consola,
+# servidor y lotes) va llenando un dict `tiempos` con un *_ms por etapa:
+#   filtros, modelo (router), embedding, vector, bm25, lectura, fusion,
+#   dedup, rerank, prompt y cache (búsqueda en la caché semántica)
+# y al terminar se le suman los contadores de Ollama que antes se tiraban
+# (load_duration, prompt_eval_duration, eval_duration; ver
+# ollama_client.rellenar_stats). Con eso se escribe una línea en
+# TRACE_LOG_PATH.
+#
+#   python tracing.py              # p50/p95 de las últimas TRACE_STATS_ULTIMAS preguntas
+#   python tracing.py --ultimas 0  # de todo el archivo
+#   python ui_console.py --verbose-timings   # desglose tras cada respuesta
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import TRACE_LOG_ENABLED, TRACE_LOG_PATH, TRACE_LOG_MAX_MB, TRACE_STATS_ULTIMAS
+
+# Orden y nombre con el que se muestran las etapas
+ETAPAS = [
+    ("filtros_ms", "filtros"),
+    ("modelo_ms", "router"),
+    ("embedding_ms", "embedding"),
+    ("vector_ms", "vectorial"),
+    ("bm25_ms", "bm25"),
+    ("lectura_ms", "lectura"),
+    ("fusion_ms", "fusión"),
+    ("dedup_ms", "duplicados"),
+    ("rerank_ms", "rerank"),
+    ("prompt_ms", "prompt"),
+    ("cache_ms", "caché"),
+]
+# Stats de Ollama (en segundos en `stats`, en ms en la traza)
+OLLAMA = [
+    ("espera_modelo_s", "espera turno"),
+    ("ollama_carga_s", "carga modelo"),
+    ("ollama_prompt_s", "eval. prompt"),
+    ("ollama_generacion_s", "generación"),
+    ("ttft_s", "primer token"),
+    ("total_s", "total"),
+]
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def tramo(tiempos: dict, nombre: str):
+    """Suma a tiempos[f"{nombre}_ms"] lo que tarde el bloque."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        clave = f"{nombre}_ms"
+        tiempos[clave] = tiempos.get(clave, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def construir(origen: str, modelo: str, pregunta: str, stats: dict) -> dict:
+    """Registro de una pregunta a partir de stats (con stats["etapas"] = tiempos)."""
+    etapas = {k: round(v, 2) for k, v in stats.get("etapas", {}).items() if isinstance(v, (int, float))}
+    ollama = {
+        clave[:-2] + "_ms": round(stats[clave] * 1000, 1)
+        for clave, _ in OLLAMA
+        if isinstance(stats.get(clave), (int, float))
+    }
+    for clave in ("tokens", "tokens_prompt", "tokens_s"):
+        if stats.get(clave) is not None:
+            ollama[clave] = round(stats[clave], 1)
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "origen": origen,
+        "modelo": modelo,
+        "pregunta": pregunta[:200],
+        "cache": bool(stats.get("cache")),
+        "error": stats.get("error"),
+        "interrumpido": bool(stats.get("interrumpido")),
+        "etapas": etapas,
+        "ollama": ollama,
+    }
+
+
+def registrar(origen: str, modelo: str, pregunta: str, stats: dict):
+    """Añade la traza al JSONL (no rompe la respuesta si el disco falla)."""
+    if not TRACE_LOG_ENABLED:
+        return
+    linea = json.dumps(construir(origen, modelo, pregunta, stats), ensure_ascii=False)
+    try:
+        with _lock:
+            TRACE_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            if TRACE_LOG_PATH.exists() and TRACE_LOG_PATH.stat().st_size > TRACE_LOG_MAX_MB * 1024 * 1024:
+                TRACE_LOG_PATH.replace(TRACE_LOG_PATH.with_suffix(".jsonl.1"))
+            with TRACE_LOG_PATH.open("a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+    except OSError as e:
+        print(f"⚠ No se pudo escribir la traza en {TRACE_LOG_PATH}: {e}")
+
+
+def leer(ultimas: int | None = TRACE_STATS_ULTIMAS) -> list[dict]:
+    """Últimas `ultimas` trazas (todas si es 0/None)."""
+    if not TRACE_LOG_PATH.exists():
+        return []
+    registros = []
+    with TRACE_LOG_PATH.open("r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registros.append(json.loads(linea))
+            except ValueError:
+                continue
+    return registros[-ultimas:] if ultimas else registros
+
+
+def _percentil(ordenados: list[float], p: float) -> float:
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+def resumen(registros: list[dict]) -> dict:
+    """{"etapas": {clave: {n, p50, p95}}, "ollama": {...}, "preguntas", "cache"}."""
+    datos = {"preguntas": len(registros), "cache": sum(1 for r in registros if r.get("cache"))}
+    for seccion in ("etapas", "ollama"):
+        valores = {}
+        for r in registros:
+            for clave, v in r.get(seccion, {}).items():
+                valores.setdefault(clave, []).append(v)
+        datos[seccion] = {}
+        for clave, vs in valores.items():
+            vs.sort()
+            datos[seccion][clave] = {"n": len(vs), "p50": _percentil(vs, 0.50), "p95": _percentil(vs, 0.95)}
+    return datos
+
+
+def formatear_resumen(datos: dict) -> str:
+    if not datos["preguntas"]:
+        return f"⏱ Sin trazas todavía ({TRACE_LOG_PATH})"
+    lineas = [
+        f"⏱ Tiempos de las últimas {datos['preguntas']} preguntas "
+        f"({datos['cache']} desde la caché) · p50 / p95",
+    ]
+    for clave, nombre in ETAPAS:
+        if clave in datos["etapas"]:
+            r = datos["etapas"][clave]
+            lineas.append(f"   {nombre:<14} {r['p50']:9.1f} ms {r['p95']:9.1f} ms")
+    for clave, nombre in OLLAMA:
+        clave = clave[:-2] + "_ms"
+        if clave in datos["ollama"]:
+            r = datos["ollama"][clave]
+            lineas.append(f"   {nombre:<14} {r['p50'] / 1000:9.2f} s  {r['p95'] / 1000:9.2f} s")
+    if "tokens_s" in datos["ollama"]:
+        r = datos["ollama"]["tokens_s"]
+        lineas.append(f"   {'tokens/s':<14} {r['p50']:9.1f}    {r['p95']:9.1f}")
+    return "\n".join(lineas)
+
+
+def formatear(stats: dict) -> str:
+    """Desglose de una pregunta (--verbose-timings)."""
+    etapas = stats.get("etapas", {})
+    partes = [f"{nombre} {etapas[clave]:.1f}" for clave, nombre in ETAPAS if clave in etapas]
+    lineas = [f"⏱ Etapas (ms): {' · '.join(partes)}"] if partes else []
+
+    ollama = [f"{nombre} {stats[clave]:.2f}" for clave, nombre in OLLAMA if isinstance(stats.get(clave), (int, float))]
+    if ollama:
+        lineas.append(f"⏱ Ollama (s): {' · '.join(ollama)}")
+    if stats.get("tokens") is not None and stats.get("tokens_s") is not None:
+        prompt = f"{stats['tokens_prompt']} tokens de prompt · " if stats.get("tokens_prompt") is not None else ""
+        lineas.append(f"   {prompt}{stats['tokens']} generados a {stats['tokens_s']:.1f} tokens/s")
+    return "\n".join(lineas)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="p50/p95 por etapa a partir de las trazas")
+    parser.add_argument("--ultimas", type=int, default=TRACE_STATS_ULTIMAS,
+                        help=f"preguntas recientes a resumir (0 = todas, por defecto {TRACE_STATS_ULTIMAS})")
+    parser.add_argument("--json", action="store_true", help="imprime el resumen en JSON")
+    args = parser.parse_args()
+
+    datos = resumen(leer(args.ultimas))
+    if args.json:
+        print(json.dumps(datos, ensure_ascii=False, indent=2))
+    else:
+        print(formatear_resumen(datos))
@@ -1,5 +1,16 @@
 # ui_console.py
-from rag_core import responder
+import sys
+
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+VERBOSE_TIMINGS = "--verbose-timings" in sys.argv   # desglose de tiempos tras cada respuesta
+if PROFILE_STARTUP:
+    import startup_profile
+    startup_profile.activar()
+
+# Solo lo ligero al arrancar: rag_core (y con él Chroma y el modelo de
+# embeddings) se carga en segundo plano o al llegar la primera pregunta.
+from config import OLLAMA_WARMUP, OLLAMA_WARMUP_MODELS, EMBEDDER_WARMUP
+import runtime
 
 def main():
     print("=======================================")
@@ -14,7 +25,7 @@ def main():
     print("  [type:docx]          → solo Word")
     print("  [type:xlsx]          → solo Excel")
     print("  [type:pptx]          → solo PowerPoint")
-    print("  [carpeta:seguridad]  → solo archivos en carpetas que contengan 'seguridad'")
+    print("  [carpeta:seguridad]  → solo archivos dentro de una carpeta llamada 'seguridad'")
     print("  [fecha>=2024-01-01]  → solo archivos modificados desde esa fecha")
     print("  [fecha<=2023-12-31]  → solo archivos hasta esa fecha")
     print("\nEjemplos:")
@@ -23,6 +34,31 @@ def main():
     print("  [fecha>=2024-01-01] dime lo más reciente sobre negociación\n")
     print("Escribe 'salir' para terminar.\n")
 
+    if PROFILE_STARTUP:
+        startup_profile.informe("Arranque de la consola (hasta el primer prompt)")
+        startup_profile.medir_diferidos(["ollama_client", "rag_core", "chromadb", "sentence_transformers", "onnxruntime"])
+        return
+
+    # Mientras escribes la primera pregunta, Ollama carga el LLM y este
+    # proceso el modelo de embeddings y Chroma
+    if OLLAMA_WARMUP:
+        from ollama_client import precargar_modelos
+        precargar_modelos(OLLAMA_WARMUP_MODELS)
+    if EMBEDDER_WARMUP:
+        runtime.warmup_en_segundo_plano()
+
+    try:
+        _bucle()
+    finally:
+        runtime.teardown()
+
+
+def _bucle():
+    from rag_core import responder_stream
+    from ollama_client import imprimir_stream, formatear_stats
+    from answer_cache import formatear_acierto
+    import tracing
+
     while True:
         try:
             pregunta = input("🧩 Pregunta> ").strip()
@@ -37,9 +73,16 @@ def main():
             print("👋 Saliendo...")
             break
 
-        modelo, respuesta, fuentes = responder(pregunta)
+        stats = {}
+        modelo, tokens, fuentes = responder_stream(pregunta, stats=stats)
         print(f"\n[Modelo usado: {modelo}]\n")
-        print(respuesta)
+        imprimir_stream(tokens)
+        if stats.get("cache"):
+            print(f"\n{formatear_acierto(stats)}")
+        else:
+            print(f"\n{formatear_stats(stats)}")
+        if VERBOSE_TIMINGS:
+            print(tracing.formatear(stats))
 
         if fuentes:
             print("\n📂 Fuentes usadas:")
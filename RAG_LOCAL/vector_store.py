@@ -0,0 +1,555 @@
+# vector_store.py - Colección de vectores cuantizados en disco (VECTOR_BACKEND = "int8")
+#
+# Alternativa a Chroma para la colección 'docs', con la parte de su interfaz
+# que usa el RAG (count, upsert, get, query, update, delete). Chroma guarda
+# cada vector en float32 dos veces (SQLite + índice HNSW) y carga el índice
+# entero en RAM. Aquí, en VECTOR_STORE_DIR/<colección>:
+#   vectores.i8    int8, 1 byte por dimensión: es lo que se recorre al buscar
+#   vectores.f16   copia float16 (o .f32, VECTOR_RESCORE_DTYPE): solo se leen
+#                  las filas de la lista corta, para la distancia final
+#   filas.f32      escala int8 y norma² de cada fila
+#   listas.i32     lista IVF de cada fila
+#   centroides.npy centroides IVF
+#   datos.sqlite   id ↔ fila, documento y metadatos (los filtros `where` se
+#                  traducen a SQL sobre los metadatos en JSON)
+# Los vectores se abren con np.memmap: la RAM que ocupan es la de las páginas
+# que se tocan, no la de la colección entera.
+#
+# Búsqueda de los n más cercanos:
+#   1. IVF: k-means con √N centroides y se miran las VECTOR_IVF_NPROBE listas
+#      más cercanas a la pregunta. Por debajo de VECTOR_IVF_MIN vectores, o con
+#      un `where` que dejan pocos (VECTOR_FILTRO_EXACTO), se recorren todos.
+#   2. Distancia aproximada con int8 → lista corta de n × VECTOR_RESCORE_FACTOR.
+#   3. Distancia con la copia float16/float32 de la lista corta → los n mejores.
+# Las distancias son L2 al cuadrado, como las de la colección de Chroma.
+import json
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    VECTOR_STORE_DIR,
+    VECTOR_RESCORE_DTYPE,
+    VECTOR_RESCORE_FACTOR,
+    VECTOR_IVF_MIN,
+    VECTOR_IVF_NPROBE,
+    VECTOR_FILTRO_EXACTO,
+)
+
+_CAPACIDAD_INICIAL = 4096
+_BLOQUE = 16384              # filas por bloque al recorrer (limita la RAM temporal)
+_BLOQUE_ASIGNAR = 4096       # filas por bloque al buscar su centroide
+_MIN_CORTA = 32              # lista corta mínima
+_SQL_IDS = 500               # IDs por cada IN (...)
+_KMEANS_ITER = 10
+_KMEANS_MUESTRA = 100_000    # filas con las que se entrenan los centroides
+_SIN_LISTA = -1
+_MAX_FILTROS = 32            # filtros `where` recordados (se olvidan al escribir)
+
+_OPERADORES = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where: dict) -> tuple[str, list]:
+    """Filtro `where` de Chroma → condición SQL sobre registros.meta."""
+    partes, params = [], []
+    for clave, valor in where.items():
+        if clave in ("$and", "$or"):
+            subs = [_where_sql(w) for w in valor]
+            union = f" {clave[1:].upper()} "
+            partes.append("(" + union.join(s for s, _ in subs) + ")")
+            params += [p for _, ps in subs for p in ps]
+            continue
+        campo = "json_extract(meta, ?)"
+        ruta = '$."' + clave.replace('"', "") + '"'
+        ops = valor if isinstance(valor, dict) else {"$eq": valor}
+        for op, v in ops.items():
+            if op in ("$in", "$nin"):
+                negar = "NOT " if op == "$nin" else ""
+                partes.append(f"{campo} {negar}IN ({','.join('?' * len(v))})")
+                params += [ruta, *v]
+            elif op in _OPERADORES:
+                partes.append(f"{campo} {_OPERADORES[op]} ?")
+                params += [ruta, v]
+            else:
+                raise ValueError(f"Operador no soportado en where: {op}")
+    return " AND ".join(partes) or "1", params
+
+
+def _mezclar(previa: dict | None, nueva: dict | None) -> dict:
+    """Como Chroma: las claves nuevas se añaden/sustituyen y None las quita."""
+    meta = dict(previa or {})
+    for clave, valor in (nueva or {}).items():
+        if valor is None:
+            meta.pop(clave, None)
+        else:
+            meta[clave] = valor
+    return meta
+
+
+def _cuantizar(vecs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """int8 simétrico con una escala por fila (el mayor valor absoluto → 127)."""
+    escala = np.abs(vecs).max(axis=1) / 127
+    escala[escala == 0] = 1
+    return np.round(vecs / escala[:, None]).astype(np.int8), escala.astype(np.float32)
+
+
+def _mas_cercano(datos: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+    """Índice del centroide más cercano (L2) de cada fila."""
+    mitad_norma = 0.5 * (centroides ** 2).sum(axis=1)
+    out = np.empty(len(datos), dtype=np.int32)
+    for i in range(0, len(datos), _BLOQUE_ASIGNAR):
+        out[i:i + _BLOQUE_ASIGNAR] = np.argmax(datos[i:i + _BLOQUE_ASIGNAR] @ centroides.T - mitad_norma, axis=1)
+    return out
+
+
+def _kmeans(datos: np.ndarray, k: int, rng) -> np.ndarray:
+    centroides = datos[rng.choice(len(datos), k, replace=False)].copy()
+    for _ in range(_KMEANS_ITER):
+        asignacion = _mas_cercano(datos, centroides)
+        orden = np.argsort(asignacion, kind="stable")
+        a = asignacion[orden]
+        inicios = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+        cuentas = np.diff(np.r_[inicios, len(a)])
+        centroides[a[inicios]] = np.add.reduceat(datos[orden], inicios, axis=0) / cuentas[:, None]
+        # Centroides sin filas: a un punto cualquiera, para que no se queden muertos
+        vacios = np.setdiff1d(np.arange(k), a[inicios])
+        if len(vacios):
+            centroides[vacios] = datos[rng.choice(len(datos), len(vacios), replace=False)]
+    return centroides
+
+
+class QuantizedCollection:
+    """
+    Colección con la interfaz de Chroma que usa el RAG sobre vectores int8 en
+    archivos mmap (ver cabecera del módulo). Segura entre hilos.
+    """
+
+    def __init__(self, directorio=VECTOR_STORE_DIR, nombre: str = "docs"):
+        self.name = nombre
+        self.dir = Path(directorio)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.dir / "datos.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS registros (
+                fila INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                documento TEXT,
+                meta TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ajustes (clave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+            """
+        )
+        self.dim = int(self._ajuste("dim", 0))
+        self.tipo = np.dtype(self._ajuste("tipo", VECTOR_RESCORE_DTYPE))
+        self.capacidad = int(self._ajuste("capacidad", 0))
+        self.n_entrenado = int(self._ajuste("n_entrenado", 0))
+
+        self._mapas = None
+        if self.dim:
+            self._abrir_mapas()
+        filas = np.fromiter((f for (f,) in self._db.execute("SELECT fila FROM registros")), dtype=np.int64)
+        self._usadas = int(filas.max()) + 1 if len(filas) else 0
+        self._vivas = np.zeros(self.capacidad, dtype=bool)
+        self._vivas[filas] = True
+        self._libres = np.flatnonzero(~self._vivas[:self._usadas]).tolist()
+        self._n = len(filas)
+
+        self._filtros = {}
+        self._centroides = None
+        self._listas = []
+        self._pendientes = {}
+        self._n_pendientes = 0
+        ruta = self.dir / "centroides.npy"
+        if self.n_entrenado and ruta.exists() and self._mapas:
+            self._poner_centroides(np.load(ruta))
+
+    # ── Persistencia ──────────────────────────────────────────
+
+    def _ajuste(self, clave: str, defecto):
+        fila = self._db.execute("SELECT valor FROM ajustes WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+
+    def _guardar_ajuste(self, clave: str, valor):
+        self._db.execute("INSERT OR REPLACE INTO ajustes (clave, valor) VALUES (?, ?)", (clave, str(valor)))
+
+    def _archivos(self) -> dict:
+        completo = "vectores.f16" if self.tipo == np.float16 else "vectores.f32"
+        return {
+            "i8": ("vectores.i8", np.int8, self.dim),
+            "completo": (completo, self.tipo, self.dim),
+            "filas": ("filas.f32", np.float32, 2),
+            "lista": ("listas.i32", np.int32, 0),
+        }
+
+    def _abrir_mapas(self):
+        self._mapas = {}
+        for clave, (nombre, tipo, ancho) in self._archivos().items():
+            path = self.dir / nombre
+            tam = self.capacidad * max(ancho, 1) * np.dtype(tipo).itemsize
+            with path.open("ab") as f:
+                if f.tell() < tam:
+                    f.truncate(tam)
+            if not self.capacidad:
+                continue
+            forma = (self.capacidad, ancho) if ancho else (self.capacidad,)
+            self._mapas[clave] = np.memmap(path, dtype=tipo, mode="r+", shape=forma)
+
+    def _cerrar_mapas(self):
+        # En Windows un archivo mapeado no se puede agrandar ni borrar: se sueltan
+        # todas las referencias antes de tocarlo
+        if self._mapas:
+            for m in self._mapas.values():
+                m.flush()
+        self._mapas = None
+
+    def _crecer(self, minimo: int):
+        # ×1,5 y no ×2: el hueco sin usar también ocupa disco
+        nueva = max(_CAPACIDAD_INICIAL, self.capacidad + self.capacidad // 2)
+        while nueva < minimo:
+            nueva += nueva // 2
+        self._cerrar_mapas()
+        self.capacidad = nueva
+        self._abrir_mapas()
+        vivas = np.zeros(nueva, dtype=bool)
+        vivas[:len(self._vivas)] = self._vivas
+        self._vivas = vivas
+        self._guardar_ajuste("capacidad", nueva)
+
+    def cerrar(self):
+        with self._lock:
+            self._cerrar_mapas()
+            self._db.close()
+
+    @staticmethod
+    def borrar_todo(directorio=VECTOR_STORE_DIR):
+        """Elimina la colección entera (limpieza / re-ingesta desde cero)."""
+        d = Path(directorio)
+        if not d.exists():
+            return
+        for path in d.iterdir():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    # ── Índice IVF ────────────────────────────────────────────
+
+    def _poner_centroides(self, centroides: np.ndarray):
+        self._centroides = centroides.astype(np.float32)
+        self._normas_c = (self._centroides ** 2).sum(axis=1)
+        self._reconstruir_listas()
+
+    def _reconstruir_listas(self):
+        vivas = np.flatnonzero(self._vivas[:self._usadas])
+        lista = np.asarray(self._mapas["lista"][vivas]) if len(vivas) else np.empty(0, np.int32)
+        orden = np.argsort(lista, kind="stable")
+        filas, lista = vivas[orden], lista[orden]
+        cortes = np.searchsorted(lista, np.arange(len(self._centroides) + 1))
+        self._listas = [filas[cortes[i]:cortes[i + 1]] for i in range(len(self._centroides))]
+        self._pendientes = {}
+        self._n_pendientes = 0
+
+    def entrenar(self):
+        """
+        Calcula los centroides IVF con las filas actuales y reparte todas en
+        sus listas. upsert() lo llama solo al llegar a VECTOR_IVF_MIN vectores
+        y cada vez que la colección se multiplica por 4.
+        """
+        with self._lock:
+            vivas = np.flatnonzero(self._vivas[:self._usadas])
+            n = len(vivas)
+            if not n:
+                return
+            k = max(1, int(round(math.sqrt(n))))
+            rng = np.random.default_rng(0)
+            muestra = np.sort(rng.choice(vivas, min(n, _KMEANS_MUESTRA), replace=False))
+            centroides = _kmeans(self._mapas["completo"][muestra].astype(np.float32), k, rng)
+
+            for i in range(0, n, _BLOQUE):
+                filas = vivas[i:i + _BLOQUE]
+                self._mapas["lista"][filas] = _mas_cercano(
+                    self._mapas["completo"][filas].astype(np.float32), centroides
+                )
+            self._mapas["lista"].flush()
+            tmp = self.dir / "centroides.tmp.npy"
+            np.save(tmp, centroides)
+            os.replace(tmp, self.dir / "centroides.npy")
+            self.n_entrenado = n
+            self._guardar_ajuste("n_entrenado", n)
+            self._db.commit()
+            self._poner_centroides(centroides)
+
+    def _candidatas_ivf(self, q: np.ndarray, minimo: int, permitidas) -> np.ndarray:
+        """Filas de las listas más cercanas a q (se abren más si no llegan a `minimo`)."""
+        k = len(self._centroides)
+        cerca = np.argsort(self._normas_c - 2 * (self._centroides @ q))
+        nprobe = min(k, VECTOR_IVF_NPROBE)
+        while True:
+            sondas = cerca[:nprobe]
+            partes = [self._listas[l] for l in sondas]
+            partes += [np.asarray(self._pendientes[l], dtype=np.int64) for l in sondas if l in self._pendientes]
+            filas = np.unique(np.concatenate(partes)) if partes else np.empty(0, np.int64)
+            filas = filas[self._vivas[filas]]
+            # Una fila reutilizada puede seguir apuntada en su lista anterior
+            filas = filas[np.isin(self._mapas["lista"][filas], sondas)]
+            if permitidas is not None:
+                filas = np.intersect1d(filas, permitidas, assume_unique=True)
+            if len(filas) >= minimo or nprobe >= k:
+                return filas
+            nprobe = min(k, nprobe * 2)
+
+    # ── Búsqueda ──────────────────────────────────────────────
+
+    def _aproximadas(self, q: np.ndarray, filas, corta: int) -> np.ndarray:
+        """Las `corta` filas más cercanas a q según los vectores int8."""
+        i8, datos = self._mapas["i8"], self._mapas["filas"]
+        mejores_d = np.empty(0, dtype=np.float32)
+        mejores_f = np.empty(0, dtype=np.int64)
+        total = self._usadas if filas is None else len(filas)
+        for i in range(0, total, _BLOQUE):
+            if filas is None:
+                fin = min(i + _BLOQUE, total)
+                bloque = np.arange(i, fin)
+                codigos, escala_norma = i8[i:fin], datos[i:fin]
+            else:
+                bloque = filas[i:i + _BLOQUE]
+                codigos, escala_norma = i8[bloque], datos[bloque]
+            # ‖v‖² − 2·q·v (‖q‖² es igual para todas y no cambia el orden)
+            d = escala_norma[:, 1] - 2 * escala_norma[:, 0] * (codigos.astype(np.float32) @ q)
+            if filas is None:
+                d[~self._vivas[bloque]] = np.inf
+            mejores_d = np.concatenate([mejores_d, d])
+            mejores_f = np.concatenate([mejores_f, bloque])
+            if len(mejores_d) > corta:
+                top = np.argpartition(mejores_d, corta - 1)[:corta]
+                mejores_d, mejores_f = mejores_d[top], mejores_f[top]
+        return mejores_f[np.isfinite(mejores_d)]
+
+    def _buscar(self, q: np.ndarray, n: int, permitidas) -> tuple[np.ndarray, np.ndarray]:
+        if n <= 0 or not self._n or (permitidas is not None and not len(permitidas)):
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        corta = max(n * VECTOR_RESCORE_FACTOR, _MIN_CORTA)
+        if permitidas is not None and (self._centroides is None or len(permitidas) <= VECTOR_FILTRO_EXACTO):
+            candidatas = permitidas
+        elif self._centroides is None:
+            candidatas = None
+        else:
+            candidatas = self._candidatas_ivf(q, corta, permitidas)
+
+        lista_corta = np.sort(self._aproximadas(q, candidatas, corta))
+        exactos = self._mapas["completo"][lista_corta].astype(np.float32)
+        d = ((exactos - q) ** 2).sum(axis=1)
+        orden = np.argsort(d)[:n]
+        return lista_corta[orden], d[orden]
+
+    def _filtrar(self, where: dict) -> np.ndarray:
+        """Filas que cumplen el filtro (json_extract recorre toda la tabla: se recuerdan)."""
+        clave = json.dumps(where, sort_keys=True)
+        filas = self._filtros.get(clave)
+        if filas is None:
+            sql, params = _where_sql(where)
+            cursor = self._db.execute(f"SELECT fila FROM registros WHERE {sql} ORDER BY fila", params)
+            filas = np.fromiter((f for (f,) in cursor), dtype=np.int64)
+            if len(self._filtros) >= _MAX_FILTROS:
+                self._filtros.pop(next(iter(self._filtros)))
+            self._filtros[clave] = filas
+        return filas
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None, include=None, **_) -> dict:
+        preguntas = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        res = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            if self.dim and preguntas.shape[1] != self.dim:
+                raise ValueError(f"Embedding de dimensión {preguntas.shape[1]}; la colección es de {self.dim}")
+            permitidas = self._filtrar(where) if where else None
+            encontrados = [self._buscar(q, n_results, permitidas) for q in preguntas]
+            registros = self._por_fila(sorted({int(f) for filas, _ in encontrados for f in filas}))
+        for filas, dist in encontrados:
+            res["ids"].append([registros[f][0] for f in filas])
+            res["documents"].append([registros[f][1] for f in filas])
+            res["metadatas"].append([registros[f][2] for f in filas])
+            res["distances"].append([float(x) for x in dist])
+        return res
+
+    # ── Lectura ───────────────────────────────────────────────
+
+    def count(self) -> int:
+        return self._n
+
+    def _por_fila(self, filas: list[int]) -> dict:
+        out = {}
+        for start in range(0, len(filas), _SQL_IDS):
+            trozo = filas[start:start + _SQL_IDS]
+            for fila, cid, doc, meta in self._db.execute(
+                f"SELECT fila, id, documento, meta FROM registros WHERE fila IN ({','.join('?' * len(trozo))})",
+                trozo,
+            ):
+                out[fila] = (cid, doc, json.loads(meta))
+        return out
+
+    def _registros(self, ids: list[str], where: dict | None = None) -> list[tuple]:
+        """(fila, id, documento, meta) de esos IDs, en el orden de `ids`."""
+        cond, params = _where_sql(where) if where else ("1", [])
+        encontrados = {}
+        for start in range(0, len(ids), _SQL_IDS):
+            trozo = ids[start:start + _SQL_IDS]
+            for fila, cid, doc, meta in self._db.execute(
+                f"SELECT fila, id, documento, meta FROM registros "
+                f"WHERE id IN ({','.join('?' * len(trozo))}) AND {cond}",
+                [*trozo, *params],
+            ):
+                encontrados[cid] = (fila, cid, doc, json.loads(meta))
+        return [encontrados[cid] for cid in dict.fromkeys(ids) if cid in encontrados]
+
+    def get(self, ids=None, where: dict | None = None, include=("documents", "metadatas"),
+            limit: int | None = None, offset: int | None = None, **_) -> dict:
+        with self._lock:
+            if ids is not None:
+                registros = self._registros(list(ids), where)[offset or 0:][:limit]
+            else:
+                cond, params = _where_sql(where) if where else ("1", [])
+                registros = [
+                    (fila, cid, doc, json.loads(meta))
+                    for fila, cid, doc, meta in self._db.execute(
+                        f"SELECT fila, id, documento, meta FROM registros WHERE {cond} "
+                        f"ORDER BY fila LIMIT ? OFFSET ?",
+                        [*params, -1 if limit is None else limit, offset or 0],
+                    )
+                ]
+            embeddings = None
+            if "embeddings" in include:
+                filas = np.array([r[0] for r in registros], dtype=np.int64)
+                embeddings = (self._mapas["completo"][filas].astype(np.float32)
+                              if len(filas) else np.empty((0, self.dim), np.float32))
+        return {
+            "ids": [r[1] for r in registros],
+            "documents": [r[2] for r in registros] if "documents" in include else None,
+            "metadatas": [r[3] for r in registros] if "metadatas" in include else None,
+            "embeddings": embeddings,
+            "include": list(include),
+        }
+
+    # ── Escritura ─────────────────────────────────────────────
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None, **_):
+        ids = list(ids)
+        if not ids:
+            return
+        vecs = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        # ID repetido en el mismo lote: vale el último, como si llegaran de uno en uno
+        ultimo = {cid: i for i, cid in enumerate(ids)}
+        if len(ultimo) < len(ids):
+            quedan = sorted(ultimo.values())
+            ids, vecs = [ids[i] for i in quedan], vecs[quedan]
+            metadatas = [metadatas[i] for i in quedan] if metadatas is not None else None
+            documents = [documents[i] for i in quedan] if documents is not None else None
+
+        with self._lock:
+            if not self.dim:
+                self.dim = vecs.shape[1]
+                self._guardar_ajuste("dim", self.dim)
+                self._guardar_ajuste("tipo", self.tipo.name)
+            if vecs.shape[1] != self.dim:
+                raise ValueError(f"Embedding de dimensión {vecs.shape[1]}; la colección es de {self.dim}")
+
+            previos = {r[1]: r for r in self._registros(ids)}
+            nuevos = sum(1 for cid in ids if cid not in previos)
+            # Primero los huecos de filas borradas, después al final
+            libres = [self._libres.pop() for _ in range(min(nuevos, len(self._libres)))]
+            extra = nuevos - len(libres)
+            libres += range(self._usadas, self._usadas + extra)
+            self._usadas += extra
+            if self._usadas > self.capacidad:
+                self._crecer(self._usadas)
+
+            libres = iter(libres)
+            filas = np.array([previos[cid][0] if cid in previos else next(libres) for cid in ids], dtype=np.int64)
+            codigos, escala = _cuantizar(vecs)
+            m = self._mapas
+            m["i8"][filas] = codigos
+            m["completo"][filas] = vecs.astype(self.tipo)
+            m["filas"][filas] = np.stack([escala, (vecs ** 2).sum(axis=1)], axis=1)
+            listas = _mas_cercano(vecs, self._centroides) if self._centroides is not None else None
+            m["lista"][filas] = _SIN_LISTA if listas is None else listas
+            for mapa in m.values():
+                mapa.flush()
+
+            filas_sql = []
+            for i, cid in enumerate(ids):
+                _, _, doc, meta = previos.get(cid, (None, cid, None, {}))
+                if documents is not None:
+                    doc = documents[i]
+                meta = _mezclar(meta, metadatas[i] if metadatas is not None else None)
+                filas_sql.append((int(filas[i]), cid, doc, json.dumps(meta, ensure_ascii=False)))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO registros (fila, id, documento, meta) VALUES (?, ?, ?, ?)", filas_sql
+            )
+            self._db.commit()
+            self._filtros.clear()
+
+            self._vivas[filas] = True
+            self._n += nuevos
+            if listas is not None:
+                for fila, lista in zip(filas.tolist(), listas.tolist()):
+                    self._pendientes.setdefault(lista, []).append(fila)
+                self._n_pendientes += len(filas)
+                if self._n_pendientes > max(10_000, self._n // 8):
+                    self._reconstruir_listas()
+
+            if self._n >= VECTOR_IVF_MIN and self._n >= 4 * self.n_entrenado:
+                print(f"   🧭 Índice IVF: entrenando con {self._n} vectores...")
+                self.entrenar()
+
+    def add(self, ids, embeddings, metadatas=None, documents=None, **_):
+        self.upsert(ids, embeddings, metadatas=metadatas, documents=documents)
+
+    def update(self, ids, metadatas=None, documents=None, embeddings=None, **_):
+        ids = list(ids)
+        with self._lock:
+            if embeddings is not None:
+                existentes = {r[1] for r in self._registros(ids)}
+                quedan = [i for i, cid in enumerate(ids) if cid in existentes]
+                self.upsert(
+                    [ids[i] for i in quedan],
+                    np.asarray(embeddings, dtype=np.float32)[quedan],
+                    metadatas=[metadatas[i] for i in quedan] if metadatas is not None else None,
+                    documents=[documents[i] for i in quedan] if documents is not None else None,
+                )
+                return
+            posicion = {cid: i for i, cid in enumerate(ids)}
+            cambios = []
+            for _, cid, doc, meta in self._registros(ids):
+                i = posicion[cid]
+                if documents is not None:
+                    doc = documents[i]
+                if metadatas is not None:
+                    meta = _mezclar(meta, metadatas[i])
+                cambios.append((doc, json.dumps(meta, ensure_ascii=False), cid))
+            self._db.executemany("UPDATE registros SET documento = ?, meta = ? WHERE id = ?", cambios)
+            self._db.commit()
+            self._filtros.clear()
+
+    def delete(self, ids=None, where: dict | None = None, **_):
+        with self._lock:
+            if ids is not None:
+                filas = [r[0] for r in self._registros(list(ids), where)]
+            elif where:
+                filas = self._filtrar(where).tolist()
+            else:
+                return
+            for start in range(0, len(filas), _SQL_IDS):
+                trozo = filas[start:start + _SQL_IDS]
+                self._db.execute(f"DELETE FROM registros WHERE fila IN ({','.join('?' * len(trozo))})", trozo)
+            self._db.commit()
+            self._filtros.clear()
+            self._vivas[filas] = False
+            self._libres.extend(filas)
+            self._n -= len(filas)